@@ -0,0 +1,83 @@
+import asyncio
+import json
+import time
+from collections.abc import AsyncIterator, Iterator
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Offline stand-in for the OpenAI model with realistic timing.
+
+    The reply to a prompt is the value of the first `script` entry whose key occurs in the last message,
+    otherwise `default`. A dict reply is returned as a call of the bound tool with those arguments, which
+    serves `with_structured_output`. Each call waits `latency` seconds before the first token and
+    `token_delay` seconds between words, so streaming and concurrency behave like a remote model.
+    """
+
+    script: dict[str, str | dict]
+    default: str = "The analysis is complete."
+    latency: float = 0.5
+    token_delay: float = 0.01
+    tool_name: str | None = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={"tool_name": convert_to_openai_tool(tools[0])["function"]["name"]})
+
+    def _reply(self, messages: list[BaseMessage]) -> str | dict:
+        prompt = str(messages[-1].content)
+        return next((reply for key, reply in self.script.items() if key in prompt), self.default)
+
+    def _message(self, reply: str | dict) -> AIMessage:
+        if isinstance(reply, dict):
+            return AIMessage(content="", tool_calls=[{"name": self.tool_name, "args": reply, "id": "call_0"}])
+        return AIMessage(content=reply)
+
+    def _delay(self, reply: str | dict) -> float:
+        return self.latency + (self.token_delay * len(reply.split()) if isinstance(reply, str) else 0)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        reply = self._reply(messages)
+        time.sleep(self._delay(reply))
+        return ChatResult(generations=[ChatGeneration(message=self._message(reply))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        reply = self._reply(messages)
+        await asyncio.sleep(self._delay(reply))
+        return ChatResult(generations=[ChatGeneration(message=self._message(reply))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        reply = self._reply(messages)
+        time.sleep(self.latency)
+        for chunk in self._chunks(reply):
+            time.sleep(self.token_delay)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self, messages, stop=None, run_manager=None, **kwargs
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        reply = self._reply(messages)
+        await asyncio.sleep(self.latency)
+        for chunk in self._chunks(reply):
+            await asyncio.sleep(self.token_delay)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def _chunks(self, reply: str | dict) -> list[ChatGenerationChunk]:
+        if isinstance(reply, dict):
+            tool_call = {"name": self.tool_name, "args": json.dumps(reply), "id": "call_0", "index": 0}
+            return [ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[tool_call]))]
+        words = reply.split(" ")
+        tokens = [word + " " for word in words[:-1]] + words[-1:]
+        return [ChatGenerationChunk(message=AIMessageChunk(content=token)) for token in tokens]
@@ -0,0 +1,148 @@
+"""
+Load test of the agent graph with N concurrent simulated users against a scripted LLM.
+
+Every user asks `--questions` questions one after the other in their own session (chat history), the way
+the Gradio UI drives the graph. Reports p50/p95 of the total latency and of the time to the first answer
+token, throughput and the peak queue depths of the shared LLM and SQL limits.
+
+    python -m benchmarks.load_test --users 1 10 50 --llm-latency 0.5
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import math
+import os
+import time
+
+import pandas as pd
+
+from config import DATA_PATH, UI_CONCURRENCY_LIMIT
+from src.agent.concurrency import LLM_LIMIT, SQL_LIMIT
+from src.agent.graph import FINAL_ANSWER_TAG, build_agent_graph
+from src.data.catalog import DataCatalog
+from src.tools.result_cache import QueryResultCache
+from src.tools.sql_tool import SqlTool
+
+from .fake_llm import ScriptedChatModel
+
+
+def build_script(catalog: DataCatalog) -> dict[str, str]:
+    """Scripts a two-step plan with two independent SQL steps against the first table of the catalog."""
+    table = catalog.table_names[0]
+    df = catalog.get(table)
+    numeric = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])]
+    column = numeric[0] if numeric else df.columns[0]
+    answer = " ".join(["The table holds the requested rows and their total value."] * 8)
+    return {
+        # The synthesis prompt repeats the plan, so it must be matched before the step instructions
+        "synthesizing the results of a data analysis plan": answer,
+        "devise a step-by-step plan": (
+            f"1. Count the rows of {table}. [depends on: none]\n"
+            f'2. Get the total of "{column}". [depends on: none]\n'
+            "3. Synthesize the results and answer the question. [depends on: 1, 2]"
+        ),
+        "Count the rows": f'SELECT COUNT(*) AS row_count FROM "{table}"',
+        "Get the total": f'SELECT SUM("{column}") AS total FROM "{table}"',
+    }
+
+
+async def ask(graph, question: str, chat_history: list) -> tuple[float, float | None, list]:
+    """Runs one question through the graph. Returns latency, time to first answer token and the history."""
+    start = time.perf_counter()
+    first_token = None
+    state = {"question": question, "chat_history": chat_history}
+    async for mode, chunk in graph.astream(state, stream_mode=["updates", "messages"]):
+        if mode == "messages":
+            token, metadata = chunk
+            if first_token is None and token.content and FINAL_ANSWER_TAG in metadata.get("tags", []):
+                first_token = time.perf_counter() - start
+        elif "update_chat_history" in chunk:
+            chat_history = chunk["update_chat_history"]["chat_history"]
+    return time.perf_counter() - start, first_token, chat_history
+
+
+async def simulate_user(graph, user: int, questions: int, sessions: asyncio.Semaphore, samples: list):
+    chat_history = []
+    for i in range(questions):
+        question = f"User {user}, question {i + 1}: how many rows and what total?"
+        start = time.perf_counter()
+        # Mirrors the UI queue: a question waits until one of the concurrent session slots is free
+        async with sessions:
+            waited = time.perf_counter() - start
+            latency, first_token, chat_history = await ask(graph, question, chat_history)
+        samples.append((waited + latency, None if first_token is None else waited + first_token))
+
+
+async def run_load(graph, users: int, questions: int, ui_concurrency: int) -> dict[str, float]:
+    samples: list[tuple[float, float | None]] = []
+    sessions = asyncio.Semaphore(ui_concurrency)
+    LLM_LIMIT.max_waiting = SQL_LIMIT.max_waiting = 0
+    start = time.perf_counter()
+    await asyncio.gather(*(simulate_user(graph, u, questions, sessions, samples) for u in range(users)))
+    elapsed = time.perf_counter() - start
+    latencies = [latency for latency, _ in samples]
+    first_tokens = [first for _, first in samples if first is not None]
+    return {
+        "users": users,
+        "questions": len(samples),
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "ttft_p50_s": percentile(first_tokens, 50),
+        "ttft_p95_s": percentile(first_tokens, 95),
+        "throughput_qps": len(samples) / elapsed,
+        "max_llm_waiting": LLM_LIMIT.max_waiting,
+        "max_sql_waiting": SQL_LIMIT.max_waiting,
+    }
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile; NaN for no values."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    # The smallest value with at least q% of the values at or below it
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 10, 50], help="Concurrent users per run")
+    parser.add_argument("--questions", type=int, default=3, help="Questions asked by each user")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Seconds between answer tokens")
+    parser.add_argument("--ui-concurrency", type=int, default=UI_CONCURRENCY_LIMIT)
+    parser.add_argument("--data", default=DATA_PATH, help="Data file or directory")
+    parser.add_argument("--no-result-cache", action="store_true", help="Execute every query in the engine")
+    parser.add_argument("--verbose", action="store_true", help="Show the agent's log output")
+    args = parser.parse_args()
+
+    catalog = DataCatalog()
+    if os.path.isdir(args.data):
+        catalog.register_directory(args.data)
+    else:
+        catalog.register_file(args.data)
+    sql_tool = SqlTool(catalog, result_cache=QueryResultCache(max_mb=0) if args.no_result_cache else None)
+    llm = ScriptedChatModel(
+        script=build_script(catalog), latency=args.llm_latency, token_delay=args.token_delay
+    )
+    graph = build_agent_graph(sql_tool, catalog.get_schema(), llm=llm)
+
+    print(
+        f"{'users':>6} {'questions':>9} {'p50 s':>7} {'p95 s':>7} {'ttft p50':>9} {'ttft p95':>9} "
+        f"{'q/s':>7} {'llm wait':>8} {'sql wait':>8}"
+    )
+    for users in args.users:
+        log = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with log:
+            result = asyncio.run(run_load(graph, users, args.questions, args.ui_concurrency))
+        print(
+            f"{result['users']:>6} {result['questions']:>9} {result['p50_s']:>7.2f} {result['p95_s']:>7.2f} "
+            f"{result['ttft_p50_s']:>9.2f} {result['ttft_p95_s']:>9.2f} {result['throughput_qps']:>7.2f} "
+            f"{result['max_llm_waiting']:>8} {result['max_sql_waiting']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
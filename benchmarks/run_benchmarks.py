@@ -0,0 +1,360 @@
+"""
+Offline benchmark of the agent pipeline on synthetic data of growing size.
+
+Every data size runs in a fresh process: it generates (or reuses) a synthetic Accrual_Accounts table, times
+loading it into the catalog and into the SQL engine, and then runs recorded questions
+end to end through `build_agent_graph` with a scripted LLM. Reports per-node latency, time spent in
+`SqlTool`, chart time and peak memory, and saves everything as JSON.
+
+    python -m benchmarks.run_benchmarks --rows 10000 1000000 10000000
+    python -m benchmarks.run_benchmarks --compare baseline.json current.json
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import UTC, datetime
+from functools import wraps
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from config import SQL_ENGINE
+from src.agent.graph import build_agent_graph
+from src.data.catalog import DataCatalog
+from src.tools.chart_renderer import ChartRenderer
+from src.tools.result_cache import QueryResultCache
+from src.tools.sql_engines import create_engine
+from src.tools.sql_tool import SqlTool
+
+from .fake_llm import ScriptedChatModel
+from .synthetic_data import synthetic_accrual_accounts
+
+NODES = ["planner", "execute_step", "generate_final_answer", "generate_chart"]
+
+# Recorded plans and SQL; each scenario replays the same LLM replies on every data size
+SCENARIOS = {
+    "aggregate": {
+        "question": "What is the total transaction value per fiscal year?",
+        "plan": (
+            '1. Get the total "Transaction Value" per "Fiscal Year.2". [depends on: none]\n'
+            "2. Synthesize the results and answer the user's question. [depends on: 1]"
+        ),
+        "sql": {
+            'per "Fiscal Year.2"': (
+                'SELECT "Fiscal Year.2", SUM("Transaction Value") AS total FROM Accrual_Accounts '
+                'GROUP BY "Fiscal Year.2" ORDER BY "Fiscal Year.2"'
+            ),
+        },
+    },
+    "parallel_compare": {
+        "question": "Compare the total transaction value of 2018 and 2019.",
+        "plan": (
+            '1. Get the total "Transaction Value" for fiscal year 2018. [depends on: none]\n'
+            '2. Get the total "Transaction Value" for fiscal year 2019. [depends on: none]\n'
+            "3. Compute the difference between the two totals. [depends on: 1, 2]\n"
+            "4. Synthesize the results and compare the two totals. [depends on: 3]"
+        ),
+        "sql": {
+            "fiscal year 2018": (
+                'SELECT SUM("Transaction Value") AS total_2018 FROM Accrual_Accounts '
+                'WHERE "Fiscal Year.2" = 2018'
+            ),
+            "fiscal year 2019": (
+                'SELECT SUM("Transaction Value") AS total_2019 FROM Accrual_Accounts '
+                'WHERE "Fiscal Year.2" = 2019'
+            ),
+            "Compute the difference": (
+                "SELECT (SELECT total_2019 FROM step_2) - (SELECT total_2018 FROM step_1) AS difference"
+            ),
+        },
+    },
+    "filter_detail": {
+        "question": "List the 20 largest debit transactions of the top business transaction type.",
+        "plan": (
+            '1. Find the "Bus. Transac. Type" with the most rows. [depends on: none]\n'
+            "2. List the 20 largest debit transactions of that type. [depends on: 1]\n"
+            "3. Synthesize the results and answer the user's question. [depends on: 2]"
+        ),
+        "sql": {
+            "with the most rows": (
+                'SELECT "Bus. Transac. Type", COUNT(*) AS row_count FROM Accrual_Accounts '
+                'GROUP BY "Bus. Transac. Type" ORDER BY row_count DESC LIMIT 1'
+            ),
+            "20 largest debit": (
+                'SELECT "ID", "Clearing Date", "Transaction Value" FROM Accrual_Accounts '
+                'WHERE "Debit/Credit ind" = \'S\' AND "Bus. Transac. Type" IN '
+                '(SELECT "Bus. Transac. Type" FROM step_1) ORDER BY "Transaction Value" DESC LIMIT 20'
+            ),
+        },
+    },
+    "chart": {
+        "question": "Chart the monthly transaction value for the top business transaction type.",
+        "plan": (
+            '1. Find the "Bus. Transac. Type" with the highest total value. [depends on: none]\n'
+            '2. For that type, get the total "Transaction Value" per "Posting period.1". [depends on: 1]\n'
+            "3. Create a line chart of the monthly values and synthesize the answer. [depends on: 2]"
+        ),
+        "sql": {
+            "with the highest total": (
+                'SELECT "Bus. Transac. Type", SUM("Transaction Value") AS total FROM Accrual_Accounts '
+                'GROUP BY "Bus. Transac. Type" ORDER BY total DESC LIMIT 1'
+            ),
+            'per "Posting period.1"': (
+                'SELECT "Posting period.1" AS month, SUM("Transaction Value") AS total FROM Accrual_Accounts '
+                'WHERE "Bus. Transac. Type" IN (SELECT "Bus. Transac. Type" FROM step_1) '
+                'GROUP BY "Posting period.1" ORDER BY month'
+            ),
+        },
+        "chart": {"chart_type": "line", "x_column": "month", "y_column": "total", "title": "Monthly value"},
+    },
+}
+
+
+class Timings:
+    """Thread-safe accumulator of elapsed seconds per label."""
+
+    def __init__(self):
+        self.seconds: dict[str, float] = defaultdict(float)
+        self.counts: dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, label: str, seconds: float) -> None:
+        with self._lock:
+            self.seconds[label] += seconds
+            self.counts[label] += 1
+
+    def timed(self, label: str, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(label, time.perf_counter() - start)
+
+        return wrapper
+
+
+class NodeTimer(BaseCallbackHandler):
+    """Times every run of the graph nodes listed in `NODES`."""
+
+    def __init__(self, timings: Timings):
+        self.timings = timings
+        self._starts: dict = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        name = kwargs.get("name")
+        # Runnables wrapped by a node run under its name as well; only the outermost run is timed
+        if parent_run_id in self._starts:
+            return
+        if name in NODES and metadata and metadata.get("langgraph_node") == name:
+            self._starts[run_id] = (name, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        if run_id in self._starts:
+            name, start = self._starts.pop(run_id)
+            self.timings.add(name, time.perf_counter() - start)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._starts.pop(run_id, None)
+
+
+def scripted_llm(scenario: dict) -> ScriptedChatModel:
+    script = {
+        # The synthesis prompt repeats the plan, so it must be matched before the step instructions
+        "synthesizing the results of a data analysis plan": "The totals are shown in the table above.",
+        "best chart to create": scenario.get("chart", {}),
+        "devise a step-by-step plan": scenario["plan"],
+        **scenario["sql"],
+    }
+    return ScriptedChatModel(script=script, latency=0, token_delay=0)
+
+
+def benchmark_size(rows: int, engine_name: str, repeat: int, data_dir: str, verbose: bool) -> dict:
+    """Benchmarks one data size. Runs in its own process so that the peak memory is per size."""
+    if not verbose:
+        sys.stdout = io.StringIO()
+    directory = os.path.join(data_dir, f"accrual_{rows}")
+    path = synthetic_accrual_accounts(rows, directory)
+    result: dict = {"rows": rows}
+
+    catalog = DataCatalog()
+    start = time.perf_counter()
+    catalog.register_file(path)
+    df = catalog.get("Accrual_Accounts")
+    result["load_s"] = time.perf_counter() - start
+    result["table_mb"] = df.memory_usage(deep=True).sum() / 1024**2
+
+    # Results are not cached, so that every repetition measures the SQL engine
+    sql_tool = SqlTool(catalog, create_engine(engine_name), QueryResultCache(max_mb=0))
+    start = time.perf_counter()
+    sql_tool.engine.register("Accrual_Accounts", df)
+    result["engine_load_s"] = time.perf_counter() - start
+
+    # Charts are not cached either, so that every repetition renders them
+    renderer = ChartRenderer(max_entries=0)
+    result["scenarios"] = {}
+    for name, scenario in SCENARIOS.items():
+        graph = build_agent_graph(
+            sql_tool, catalog.get_schema(), llm=scripted_llm(scenario), renderer=renderer
+        )
+        runs = [_run_scenario(graph, sql_tool, scenario) for _ in range(repeat)]
+        result["scenarios"][name] = _median_of(runs)
+
+    result["peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+
+def _run_scenario(graph, sql_tool: SqlTool, scenario: dict) -> dict:
+    timings = Timings()
+    execute_query = sql_tool.execute_query
+    sql_tool.execute_query = timings.timed("sql", execute_query)
+    try:
+        start = time.perf_counter()
+        state = asyncio.run(
+            graph.ainvoke(
+                {"question": scenario["question"], "chat_history": []},
+                config={"callbacks": [NodeTimer(timings)]},
+            )
+        )
+        total = time.perf_counter() - start
+    finally:
+        sql_tool.execute_query = execute_query
+    if state.get("error"):
+        raise RuntimeError(f"Scenario '{scenario['question']}' failed: {state['error']}")
+
+    nodes = {node: timings.seconds[node] for node in NODES if timings.counts[node]}
+    return {
+        "total_s": total,
+        "nodes": nodes,
+        "sql_s": timings.seconds["sql"],
+        "sql_queries": timings.counts["sql"],
+    }
+
+
+def _median_of(runs: list[dict]) -> dict:
+    median = {}
+    for key, value in runs[0].items():
+        if isinstance(value, dict):
+            median[key] = _median_of([run[key] for run in runs])
+        else:
+            median[key] = statistics.median(run[key] for run in runs)
+    return median
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline_path: str, current_path: str, threshold: float, min_seconds: float) -> bool:
+    """Prints every metric side by side and returns whether any timing regressed beyond the threshold."""
+    with open(baseline_path) as f:
+        baseline = _flatten(json.load(f)["sizes"])
+    with open(current_path) as f:
+        current = _flatten(json.load(f)["sizes"])
+
+    regressed = False
+    print(f"{'metric':<66} {'baseline':>10} {'current':>10} {'change':>8}")
+    for metric in sorted(baseline.keys() & current.keys()):
+        old, new = baseline[metric], current[metric]
+        change = (new - old) / old if old else 0.0
+        is_timing = metric.endswith("_s") or ".nodes." in metric
+        flag = ""
+        if is_timing and change > threshold and new - old > min_seconds:
+            flag, regressed = "  REGRESSION", True
+        print(f"{metric:<66} {old:>10.4f} {new:>10.4f} {change:>+8.1%}{flag}")
+    for metric in sorted(baseline.keys() ^ current.keys()):
+        print(f"{metric:<66} only in {'baseline' if metric in baseline else 'current'}")
+    return regressed
+
+
+def _flatten(data: dict, prefix: str = "") -> dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, int | float) and key != "rows":
+            flat[f"{prefix}{key}"] = float(value)
+    return flat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000])
+    parser.add_argument("--engine", default=SQL_ENGINE, help="SQL engine to benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario; the median is reported")
+    parser.add_argument("--data-dir", default=".cache/benchmarks", help="Where synthetic data is kept")
+    parser.add_argument("--output", help="JSON result file (default: <data-dir>/results-<commit>.json)")
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="Compare two result files"
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="Relative slowdown counted as regression"
+    )
+    parser.add_argument("--min-seconds", type=float, default=0.005, help="Ignore slowdowns below this")
+    parser.add_argument("--verbose", action="store_true", help="Show the agent's log output")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold, args.min_seconds) else 0)
+
+    commit = _git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "created": datetime.now(UTC).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "engine": args.engine,
+            "repeat": args.repeat,
+        },
+        "sizes": {},
+    }
+    for rows in args.rows:
+        print(f"Benchmarking {rows:,} rows on {args.engine}...")
+        # A fresh process per size keeps peak memory and warm caches from leaking between sizes
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            result = pool.submit(
+                benchmark_size, rows, args.engine, args.repeat, args.data_dir, args.verbose
+            ).result()
+        report["sizes"][str(rows)] = result
+        print(
+            f"  load {result['load_s']:.2f}s, engine {result['engine_load_s']:.2f}s, "
+            f"peak RSS {result['peak_rss_mb']:.0f} MB"
+        )
+        for name, scenario in result["scenarios"].items():
+            nodes = ", ".join(f"{node} {seconds:.3f}s" for node, seconds in scenario["nodes"].items())
+            print(f"  {name}: total {scenario['total_s']:.3f}s, sql {scenario['sql_s']:.3f}s ({nodes})")
+
+    output = args.output or os.path.join(args.data_dir, f"results-{commit or 'unknown'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
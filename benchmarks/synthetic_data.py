@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.data.handler import load_data
+
+SOURCE_PATH = "data_sample/Accrual_Accounts.xlsx"
+
+# Rows generated and written at a time, so 10M-row files don't have to fit in memory at once
+CHUNK_ROWS = 1_000_000
+
+
+def synthetic_accrual_accounts(
+    rows: int, directory: str, source_path: str = SOURCE_PATH, seed: int = 0
+) -> str:
+    """
+    Writes a synthetic `Accrual_Accounts` table with `rows` rows to `directory` and returns its path.
+
+    Rows are drawn with replacement from the sample file, with unique IDs and jittered transaction values,
+    so column types, cardinalities and null rates match the real data. Parquet is used because Excel
+    cannot hold more than about 1M rows; the table name is the same. Existing files are reused.
+    """
+    path = os.path.join(directory, "Accrual_Accounts.parquet")
+    if os.path.exists(path) and pq.read_metadata(path).num_rows == rows:
+        return path
+    os.makedirs(directory, exist_ok=True)
+
+    source = load_data(source_path)
+    rng = np.random.default_rng(seed)
+    tmp_path = f"{path}.tmp"
+    writer = None
+    try:
+        for start in range(0, rows, CHUNK_ROWS):
+            size = min(CHUNK_ROWS, rows - start)
+            chunk = source.iloc[rng.integers(0, len(source), size)].reset_index(drop=True)
+            chunk["ID"] = np.arange(start, start + size)
+            chunk["Transaction Value"] = (chunk["Transaction Value"] * rng.uniform(0.5, 1.5, size)).round(2)
+            table = pa.Table.from_pandas(
+                chunk, schema=writer.schema if writer else None, preserve_index=False
+            )
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(tmp_path, path)
+    print(f"Generated {rows:,} synthetic rows in {path}")
+    return path
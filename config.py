@@ -1,14 +1,162 @@
 # OpenAI LLM model
 LLM_MODEL = "gpt-4o-mini"
 
+# Data file or directory; every Excel sheet, CSV and Parquet file becomes a table
+DATA_PATH = "data_sample"
+
+# Memory budget for loaded tables; least recently used tables are evicted beyond it
+CATALOG_MEMORY_BUDGET_MB = 2048
+
+# Directory (next to each source file) for the columnar load cache; None disables caching
+DATA_CACHE_DIR = ".cache"
+
+# Store loaded tables in compact types (categorical text, narrow numbers)
+COMPACT_DTYPES = True
+
+# Text columns with at most this ratio of distinct values to rows are stored as categoricals
+CATEGORY_MAX_RATIO = 0.5
+
+# Seconds between checks of DATA_PATH for new or changed files, which are loaded without a restart;
+# None disables watching
+DATA_WATCH_INTERVAL_SECONDS = 30
+
+# Persistent cache of LLM responses keyed on prompt, model and temperature
+LLM_CACHE_ENABLED = True
+LLM_CACHE_PATH = ".cache/llm_cache.sqlite"
+LLM_CACHE_TTL_SECONDS = 7 * 24 * 3600
+LLM_CACHE_MAX_ENTRIES = 10_000
+
+# Also reuse responses for prompts that differ only in the wording of the question or step instruction
+# (local hashing embeddings of that instruction, same literals required)
+LLM_CACHE_SEMANTIC = False
+LLM_CACHE_SIMILARITY_THRESHOLD = 0.95
+
 # Maximum number of retries for SQL query correction
 MAX_RETRIES = 10
 
 # Maximum number of rows to return in SQL query result to avoid token limits
 MAX_ROWS = 100
 
+# SQL execution engine: "sqlite" (indexed row store) or "duckdb" (vectorized, zero-copy over DataFrames)
+SQL_ENGINE = "sqlite"
+
+# Worker threads for the DuckDB engine (0 uses all cores)
+DUCKDB_THREADS = 0
+
+# Number of read-only connections the SQLite engine keeps open for concurrent queries
+SQLITE_POOL_SIZE = 4
+
+# Columns with at most this share of distinct values (relative to row count) get a SQLite index
+SQLITE_INDEX_CARDINALITY_RATIO = 0.01
+
+# Profile the columns of every table (distinct values, ranges, nulls) for the schema in the prompts. Tables
+# without a cached profile are profiled when they are first loaded
+PROFILE_TABLES = True
+
+# Columns with at most this many distinct values have all of them listed in the schema
+PROFILE_MAX_VALUES = 10
+
+# Pre-aggregated rollups per table: aggregate queries that only group and filter by the dimension columns
+# are answered from the rollup instead of scanning the table. Tables not in the catalog are ignored
+ROLLUPS = {
+    "Accrual_Accounts": {
+        "dimensions": [
+            "Fiscal Year.2",
+            "Posting period.1",
+            "Bus. Transac. Type",
+            "Debit/Credit ind",
+            "Currency",
+            "Authorization Group",
+        ],
+        "measures": ["Transaction Value"],
+    },
+}
+
+# Reuse the plan and SQL of an earlier successful question of the same shape (same wording, other
+# literals) instead of calling the planner LLM; entries are kept in a local SQLite file
+PLAN_LIBRARY_ENABLED = True
+PLAN_LIBRARY_PATH = ".cache/plan_library.sqlite"
+PLAN_LIBRARY_MAX_ENTRIES = 1000
+
+# Minimum similarity (0-1) of a reordered question to a stored one for its plan (not SQL) to be reused
+PLAN_LIBRARY_SIMILARITY_THRESHOLD = 0.95
+
+# Plan the steps, write their SQL and decide on a chart in one structured LLM call instead of a planner
+# call plus one SQL call per step; the LLM is only asked for SQL again when one of those queries fails
+STRUCTURED_PLANNING = False
+
+# Fix mechanical SQL mistakes (quoting, misspelled names, semicolons) locally before executing a query
+SQL_REPAIR_ENABLED = True
+
+# Minimum similarity (0-1) for a misspelled table or column name to be replaced by a known one
+SQL_REPAIR_FUZZY_CUTOFF = 0.8
+
+# Repaired queries kept in memory
+SQL_REPAIR_CACHE_MAX_ENTRIES = 1024
+
+# Worker threads that execute SQL, shared by all sessions; further queries wait for a free worker
+SQL_WORKERS = 4
+
+# Maximum number of LLM calls in flight across all sessions; further calls wait for a free slot
+LLM_CONCURRENCY = 8
+
+# Questions answered at the same time by the UI and the number of further questions that may wait in
+# its queue before new ones are rejected
+UI_CONCURRENCY_LIMIT = 8
+UI_MAX_QUEUE_SIZE = 64
+
+# Memory budget for cached SQL query results
+RESULT_CACHE_MAX_MB = 256
+
+# Token budgets for step results included in each SQL-generation prompt and in the final answer prompt;
+# larger results are summarized (row count, column statistics, first rows)
+SQL_CONTEXT_TOKEN_BUDGET = 1500
+FINAL_ANSWER_CONTEXT_TOKEN_BUDGET = 3000
+
+# Rows included when a step result is summarized
+SUMMARY_TOP_K_ROWS = 10
+
+# JSONL file receiving one line per traced operation (graph node, LLM call, SQL query, chart); None disables
+TRACE_FILE = ".cache/traces.jsonl"
+
+# Size at which the trace file is rotated, and the rotated files kept (traces.jsonl.1 is the newest)
+TRACE_FILE_MAX_MB = 100
+TRACE_FILE_BACKUPS = 3
+
+# Local port serving Prometheus metrics at /metrics; None disables the endpoint
+METRICS_PORT = 9464
+
+# Questions answered at once by the headless batch runner (python -m src.batch.runner)
+BATCH_CONCURRENCY = 8
+
 # Maximum number of conversation history to keep in memory
 MAX_CONVERSATION_HISTORY = 5
 
-# Directory to save generated charts
-CHART_OUTPUT_PATH = "charts"
+# Token budget for the summary of the older messages of a conversation; the oldest turns drop out of it
+HISTORY_SUMMARY_TOKEN_BUDGET = 400
+
+# SQLite file holding the state of every chat session, so sessions survive a restart
+SESSION_DB_PATH = ".cache/sessions.sqlite"
+
+# Directory for the step results of running questions (Parquet), which the graph state only references,
+# and the disk budget beyond which the oldest are deleted
+SESSION_FRAMES_DIR = ".cache/frames"
+SESSION_FRAMES_MAX_MB = 1024
+
+# Worker processes that render charts, shared by all sessions
+CHART_WORKERS = 2
+
+# Image format of rendered charts: "png" or "svg"
+CHART_FORMAT = "png"
+
+# Points drawn per line chart; longer series are downsampled (LTTB), keeping their shape
+CHART_MAX_LINE_POINTS = 1000
+
+# Points drawn per scatter plot; denser numeric scatters are drawn as hexbin density plots
+CHART_MAX_SCATTER_POINTS = 5000
+
+# Categories drawn per bar or pie chart; the smaller ones are combined into an "Other" category
+CHART_MAX_CATEGORIES = 20
+
+# Rendered charts kept in memory, keyed by the charted data and the chart details
+CHART_CACHE_MAX_ENTRIES = 256
@@ -1,13 +1,20 @@
+import logging
 import os
-from pathlib import Path
 
 import pandas as pd
 
+from config import DATA_PATH, DATA_WATCH_INTERVAL_SECONDS, METRICS_PORT, PLAN_LIBRARY_ENABLED
 from src.agent.graph import build_agent_graph
-from src.data.handler import get_schema_from_dataframe, load_data
+from src.agent.plan_library import PlanLibrary
+from src.agent.sessions import create_checkpointer
+from src.data.catalog import DataCatalog
+from src.data.watcher import DataWatcher
+from src.observability.metrics import start_metrics_server
+from src.tools.sql_tool import SqlTool
 from src.ui.app import run_gradio_ui
 
 pd.options.display.float_format = "{:,.2f}".format
+logging.basicConfig(level=logging.INFO, format="%(message)s")
 
 
 def main():
@@ -16,14 +23,24 @@ def main():
         print("ERROR: OPENAI_API_KEY environment variable not set.")
         return
 
-    file_path = "data_sample/Accrual_Accounts.xlsx"
+    catalog = DataCatalog()
+    if os.path.isdir(DATA_PATH):
+        catalog.register_directory(DATA_PATH)
+    else:
+        catalog.register_file(DATA_PATH)
 
-    df = load_data(file_path)
-    table_name = Path(file_path).stem
+    sql_tool = SqlTool(catalog)
 
-    db_schema = get_schema_from_dataframe(df, table_name)
+    # The graph reads the catalog's current schema, so tables refreshed by the watcher reach the prompts.
+    # Chat sessions are checkpointed to disk, one thread per browser session
+    plan_library = PlanLibrary(catalog) if PLAN_LIBRARY_ENABLED else None
+    ai_agent = build_agent_graph(sql_tool, checkpointer=create_checkpointer(), plan_library=plan_library)
 
-    ai_agent = build_agent_graph(df, db_schema, table_name)
+    if DATA_WATCH_INTERVAL_SECONDS is not None:
+        DataWatcher(catalog, DATA_PATH, DATA_WATCH_INTERVAL_SECONDS).start()
+
+    if METRICS_PORT is not None:
+        start_metrics_server(METRICS_PORT)
 
     run_gradio_ui(ai_agent)
 
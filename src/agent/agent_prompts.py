@@ -19,23 +19,78 @@ def planner_system_prompt(question: str, chat_history: str, db_schema: str) -> s
     4.  Each step in your plan should be a clear, concise instruction for a data analyst to follow.
     5.  The final step should often be to "Synthesize the results and answer the user's question", optionally
     mentioning if a visualization is appropriate.
-    6.  Output the plan as a numbered list. Do not write any other text or explanation.
+    6.  End every step with the numbers of the earlier steps whose results it needs, written as
+    "[depends on: 1, 2]", or "[depends on: none]" if it needs no earlier results. Independent steps are
+    executed in parallel.
+    7.  The comment after each column in the schema describes its values (distinct count, range, or all values
+    when there are few). Use it to filter directly; do not plan steps that only look up distinct values.
+    8.  Output the plan as a numbered list with one step per line. Do not write any other text or explanation.
 
     **Example for a complex question:**
     User Question: "Chart the monthly transaction value for the top 2 business transaction types."
 
     **Your Output Plan:**
-    1. Find the top 2 "Bus. Transac. Type" by total "Transaction Value".
-    2. For those top 2 transaction types, retrieve their total "Transaction Value" for each month using the
-    "Clearing Date".
-    3. Create a line chart showing the monthly transaction value for the top 2 business transaction types and
-    synthesize the results to answer the user's question.
+    1. Find the top 2 "Bus. Transac. Type" by total "Transaction Value". [depends on: none]
+    2. For those 2 types, retrieve the total "Transaction Value" per month of "Clearing Date". [depends on: 1]
+    3. Create a line chart of the monthly values per type and synthesize the answer. [depends on: 2]
+
+    **Example with independent steps:**
+    User Question: "Compare the total transaction value of 2018 and 2019."
+
+    **Your Output Plan:**
+    1. Get the total "Transaction Value" for fiscal year 2018. [depends on: none]
+    2. Get the total "Transaction Value" for fiscal year 2019. [depends on: none]
+    3. Synthesize the results and compare the two totals. [depends on: 1, 2]
+    """
+
+
+def structured_plan_prompt(question: str, chat_history: str, db_schema: str, dialect: str = "SQLite") -> str:
+    return f"""
+    You are an expert AI data analyst and {dialect} SQL developer. Your task is to devise a step-by-step plan
+    to answer a user's question based on a database schema and conversation history, and to write the SQL
+    query of every step.
+
+    **User Question:** "{question}"
+
+    **Conversation History:**
+    {chat_history}
+
+    **Database Schema:**
+    {db_schema}
+
+    **Instructions:**
+    1.  If the question can be answered with a single SQL query, create a one-step plan. Otherwise break it
+    down into a logical sequence of simple steps (e.g., finding top items first, then getting details).
+    2.  Give every step a clear, concise instruction and the numbers of the earlier steps whose results it
+    needs in `depends_on`. Independent steps are executed in parallel.
+    3.  Give every step that retrieves data a single, valid {dialect} SQL query in `sql` that accomplishes
+    *only* that step. Steps that only synthesize the answer or describe a chart have no SQL.
+    4.  The results of earlier steps are not known yet: a query needing them must read the full result of a
+    step from the table named after it (e.g. step_1), which it has to list in `depends_on`.
+    5.  The comment after each column in the schema describes its values (distinct count, range, or all values
+    when there are few). Use the exact values and formats shown there to filter directly; do not plan steps
+    that only look up distinct values.
+    6.  Set `chart_requested` if the user asks for a chart, plot or other visualization.
+
+    **Example for a complex question:**
+    User Question: "Chart the monthly transaction value for the top 2 business transaction types."
+
+    **Your Plan:**
+    1. Find the top 2 "Bus. Transac. Type" by total "Transaction Value". Depends on: none.
+    SQL: SELECT "Bus. Transac. Type", SUM("Transaction Value") AS total FROM ... GROUP BY 1 ORDER BY 2 DESC
+    LIMIT 2
+    2. For those 2 types, retrieve the total "Transaction Value" per month of "Clearing Date". Depends on: 1.
+    SQL: SELECT ... WHERE "Bus. Transac. Type" IN (SELECT "Bus. Transac. Type" FROM step_1) GROUP BY ...
+    3. Create a line chart of the monthly values per type and synthesize the answer. Depends on: 2. No SQL.
+    Chart requested.
     """
 
 
-def step_sql_generation_prompt(plan_step: str, previous_steps_results: str, db_schema: str) -> str:
+def step_sql_generation_prompt(
+    plan_step: str, previous_steps_results: str, db_schema: str, dialect: str = "SQLite"
+) -> str:
     return f"""
-    You are an expert SQL developer. Your task is to write a single SQLite SQL query to execute a specific
+    You are an expert SQL developer. Your task is to write a single {dialect} SQL query to execute a specific
     step of a data analysis plan.
 
     **Current Step Instruction:** "{plan_step}"
@@ -47,15 +102,17 @@ def step_sql_generation_prompt(plan_step: str, previous_steps_results: str, db_s
     {db_schema}
 
     **Instructions:**
-    - Write a single, valid SQLite SQL query that accomplishes *only* the current step's instruction.
+    - Write a single, valid {dialect} SQL query that accomplishes *only* the current step's instruction.
     - Use the results from previous steps as context if necessary (e.g., for filtering with an IN clause).
+    - The full result of a previous step can be queried as a table named after it (e.g. step_1). Use it
+    instead of copying values when the result above is summarized or long.
+    - Use the exact values and formats shown in the column comments of the schema (e.g. for dates and years).
     - Only output the SQL query. Do not add explanations or markdown.
     """
 
 
-def final_answer_synthesis_prompt(question: str, plan: list[str], step_results: list[str]) -> str:
+def final_answer_synthesis_prompt(question: str, plan: list[str], results_str: str) -> str:
     plan_str = "\n".join(f"{i+1}. {step}" for i, step in enumerate(plan))
-    results_str = "\n".join(f"Result of Step {i+1}:\n{res}\n" for i, res in enumerate(step_results))
 
     return f"""
     You are an AI assistant. Your goal is to provide a final, comprehensive answer to the user's question by
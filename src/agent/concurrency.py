@@ -0,0 +1,109 @@
+import asyncio
+import threading
+from collections import deque
+from collections.abc import Callable
+from contextlib import asynccontextmanager, contextmanager
+
+from config import LLM_CONCURRENCY, SQL_WORKERS
+from src.observability.metrics import REGISTRY, Gauge
+
+
+class ConcurrencyLimit:
+    """
+    Caps the number of concurrent calls to a shared resource (LLM, SQL engine) across all sessions.
+
+    Callers beyond the limit wait in FIFO order, from threads (`hold`) as well as from coroutines
+    (`ahold`), so sync and async graph runs share the same limit. The current and peak number of waiting
+    callers are reported by `stats()`.
+    """
+
+    def __init__(self, name: str, limit: int):
+        if limit < 1:
+            raise ValueError(f"Concurrency limit '{name}' must be at least 1, got {limit}.")
+        self.name = name
+        self.limit = limit
+        self.max_waiting = 0
+        self._active = 0
+        self._waiters: deque[Callable[[], None]] = deque()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def hold(self):
+        event = threading.Event()
+        if not self._try_acquire(event.set):
+            event.wait()
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def ahold(self):
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        if not self._try_acquire(wake):
+            try:
+                await granted
+            except asyncio.CancelledError:
+                with self._lock:
+                    still_waiting = wake in self._waiters
+                    if still_waiting:
+                        self._waiters.remove(wake)
+                if not still_waiting:
+                    # The slot was handed over while being cancelled; pass it on
+                    self._release()
+                raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> dict[str, int]:
+        """Returns the number of running and waiting callers."""
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "active": self._active,
+                "waiting": len(self._waiters),
+                "max_waiting": self.max_waiting,
+            }
+
+    def _try_acquire(self, wake: Callable[[], None]) -> bool:
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                return True
+            self._waiters.append(wake)
+            self.max_waiting = max(self.max_waiting, len(self._waiters))
+            return False
+
+    def _release(self) -> None:
+        with self._lock:
+            if not self._waiters:
+                self._active -= 1
+                return
+            # The slot is handed directly to the next waiter, so `_active` stays the same
+            wake = self._waiters.popleft()
+        wake()
+
+
+# Shared by every agent graph in the process, since they all use the same LLM account and SQL engine
+LLM_LIMIT = ConcurrencyLimit("llm", LLM_CONCURRENCY)
+SQL_LIMIT = ConcurrencyLimit("sql", SQL_WORKERS)
+
+REGISTRY.register(
+    Gauge(
+        "sql_agent_concurrent_calls",
+        "Calls to shared resources that are running or waiting for a free slot.",
+        ("resource", "state"),
+        lambda: {
+            (limit.name, state): limit.stats()[state]
+            for limit in (LLM_LIMIT, SQL_LIMIT)
+            for state in ("active", "waiting")
+        },
+    )
+)
@@ -0,0 +1,97 @@
+import pandas as pd
+from langchain_core.messages import BaseMessage
+
+from config import SUMMARY_TOP_K_ROWS
+
+# Rough size of a token for English text and tables; avoids a tokenizer dependency
+CHARS_PER_TOKEN = 4
+
+# Longest text of a single message kept in the history summary
+SUMMARY_MESSAGE_CHARS = 200
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def step_table_name(index: int) -> str:
+    """Name under which the full result of a plan step can be queried in later steps."""
+    return f"step_{index + 1}"
+
+
+def render_result(df: pd.DataFrame, index: int, token_budget: int) -> str:
+    """
+    Renders a step result within the token budget: the full table if it fits, otherwise a summary with
+    row count, per-column statistics and as many of the first rows as fit.
+    """
+    header = f"Result of Step {index + 1} (table {step_table_name(index)}): {len(df)} rows"
+    full = f"{header}\n{df.to_markdown(index=False)}"
+    if estimate_tokens(full) <= token_budget:
+        return full
+
+    summary = f"{header} x {len(df.columns)} columns, summarized.\nColumns:\n{_column_stats(df)}"
+    for top_k in range(min(SUMMARY_TOP_K_ROWS, len(df)), 0, -1):
+        text = f"{summary}\nFirst {top_k} rows:\n{df.head(top_k).to_markdown(index=False)}"
+        if estimate_tokens(text) <= token_budget:
+            return text
+    return summary[: token_budget * CHARS_PER_TOKEN]
+
+
+def render_results(frames: dict[int, pd.DataFrame], token_budget: int) -> str:
+    """Renders several step results in plan order, splitting the token budget evenly between them."""
+    if not frames:
+        return ""
+    per_result_budget = token_budget // len(frames)
+    return "\n\n".join(render_result(frames[index], index, per_result_budget) for index in sorted(frames))
+
+
+def summarize_history(summary: str, messages: list[BaseMessage], token_budget: int) -> str:
+    """
+    Adds messages that drop out of the kept history to the conversation summary: one line per message with
+    its first sentence. The oldest lines are dropped to stay within the token budget.
+    """
+    lines = summary.splitlines() if summary else []
+    for message in messages:
+        text = " ".join(str(message.content).split())
+        first_sentence = text.split(". ", 1)[0]
+        if len(first_sentence) > SUMMARY_MESSAGE_CHARS:
+            first_sentence = first_sentence[: SUMMARY_MESSAGE_CHARS - 3] + "..."
+        lines.append(f"- {message.type}: {first_sentence}")
+    while lines and estimate_tokens("\n".join(lines)) > token_budget:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def _column_stats(df: pd.DataFrame) -> str:
+    lines = []
+    for column in df.columns:
+        series = df[column]
+        nulls = int(series.isna().sum())
+        if nulls == len(series):
+            lines.append(f'- "{column}": all null')
+            continue
+        null_info = f", {nulls} nulls" if nulls else ""
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            stats = ", ".join(
+                f"{name} {_format_number(value)}"
+                for name, value in [
+                    ("min", series.min()),
+                    ("max", series.max()),
+                    ("mean", series.mean()),
+                    ("sum", series.sum()),
+                ]
+            )
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            stats = f"from {series.min()} to {series.max()}"
+        else:
+            top_values = series.value_counts().head(5)
+            top = ", ".join(f"'{value}' ({count})" for value, count in top_values.items())
+            stats = f"{series.nunique()} distinct, most common: {top}"
+        lines.append(f'- "{column}": {stats}{null_info}')
+    return "\n".join(lines)
+
+
+def _format_number(value: float) -> str:
+    if float(value).is_integer():
+        return f"{value:,.0f}"
+    return f"{value:,.2f}" if abs(value) >= 1 else f"{value:.4g}"
@@ -0,0 +1,105 @@
+import json
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config import SESSION_FRAMES_DIR, SESSION_FRAMES_MAX_MB
+
+# Schema metadata key holding the original column names, which Parquet requires to be unique strings
+_COLUMNS_KEY = b"sql_agent_columns"
+
+
+class FrameStore:
+    """
+    Spills step results to Parquet files, so the graph state (and every checkpoint of it) only carries
+    short references instead of DataFrames. Frames Parquet can't store (e.g. columns mixing numbers and
+    text) are pickled instead.
+
+    The oldest files are deleted beyond `max_mb`; a question only reads the frames of its own steps, so the
+    budget only needs to hold the results of the questions in flight. Frames written for an `owner` (the
+    question's trace id) are never deleted to stay within the budget until the owner is released, so a
+    question still running keeps its frames even when other questions fill the store.
+    """
+
+    def __init__(self, directory: str = SESSION_FRAMES_DIR, max_mb: float = SESSION_FRAMES_MAX_MB):
+        self.directory = Path(directory)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._files: OrderedDict[str, int] | None = None
+        self._owners: dict[str, str] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, df: pd.DataFrame, owner: str | None = None) -> str:
+        """Writes a frame and returns its reference. It is kept until `release(owner)`, if given."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        ref = f"{uuid.uuid4().hex}.parquet"
+        try:
+            table = pa.Table.from_pandas(df.set_axis([str(i) for i in range(df.shape[1])], axis=1))
+            metadata = {**(table.schema.metadata or {}), _COLUMNS_KEY: json.dumps(list(map(str, df.columns)))}
+            pq.write_table(table.replace_schema_metadata(metadata), self.directory / ref)
+        except (pa.ArrowException, ValueError):
+            ref = ref.replace(".parquet", ".pkl")
+            df.to_pickle(self.directory / ref)
+        self._track(ref, (self.directory / ref).stat().st_size, owner)
+        return ref
+
+    def get(self, ref: str) -> pd.DataFrame:
+        path = self.directory / ref
+        if path.suffix == ".pkl":
+            return pd.read_pickle(path)
+        table = pq.read_table(path)
+        df = table.to_pandas()
+        return df.set_axis(json.loads(table.schema.metadata[_COLUMNS_KEY]), axis=1)
+
+    def get_all(self, refs: dict[int, str]) -> dict[int, pd.DataFrame]:
+        return {index: self.get(ref) for index, ref in refs.items()}
+
+    def release(self, owner: str) -> None:
+        """Lets the frames of a finished question be deleted to stay within the budget."""
+        with self._lock:
+            self._owners = {ref: ref_owner for ref, ref_owner in self._owners.items() if ref_owner != owner}
+            if self._files is not None:
+                self._evict()
+
+    def delete(self, refs) -> None:
+        with self._lock:
+            for ref in refs:
+                (self.directory / ref).unlink(missing_ok=True)
+                self._owners.pop(ref, None)
+                if self._files is not None and ref in self._files:
+                    self._bytes -= self._files.pop(ref)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"files": len(self._files or {}), "bytes": self._bytes}
+
+    def _track(self, ref: str, size: int, owner: str | None) -> None:
+        with self._lock:
+            if owner is not None:
+                self._owners[ref] = owner
+            if self._files is None:
+                # Files left by earlier runs count towards the budget too, oldest first
+                existing = sorted(self.directory.iterdir(), key=lambda path: path.stat().st_mtime_ns)
+                self._files = OrderedDict((path.name, path.stat().st_size) for path in existing)
+                self._bytes = sum(self._files.values())
+            else:
+                self._files[ref] = size
+                self._bytes += size
+            self._evict(keep=ref)
+
+    def _evict(self, keep: str | None = None) -> None:
+        for ref in list(self._files):
+            if self._bytes <= self.max_bytes:
+                break
+            if ref == keep or ref in self._owners:
+                continue
+            self._bytes -= self._files.pop(ref)
+            (self.directory / ref).unlink(missing_ok=True)
+
+
+FRAME_STORE = FrameStore()
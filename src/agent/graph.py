@@ -1,11 +1,31 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from typing import TypedDict
 
 import pandas as pd
+from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableLambda
 from langchain_openai import ChatOpenAI
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.graph import END, StateGraph
 
-from config import LLM_MODEL, MAX_CONVERSATION_HISTORY, MAX_RETRIES
+from config import (
+    FINAL_ANSWER_CONTEXT_TOKEN_BUDGET,
+    HISTORY_SUMMARY_TOKEN_BUDGET,
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_SEMANTIC,
+    LLM_MODEL,
+    MAX_CONVERSATION_HISTORY,
+    MAX_RETRIES,
+    SQL_CONTEXT_TOKEN_BUDGET,
+    SQL_WORKERS,
+    STRUCTURED_PLANNING,
+)
+from src.observability.metrics import SQL_RETRIES
+from src.observability.tracing import LLM_TRACING_HANDLER, current_span, span, traced_node
+from src.tools.chart_renderer import Chart, ChartRenderer
 from src.tools.sql_tool import SqlTool
 from src.tools.visualization_tool import VisualizationTool
 
@@ -13,125 +33,406 @@ from .agent_prompts import (
     final_answer_synthesis_prompt,
     planner_system_prompt,
     step_sql_generation_prompt,
+    structured_plan_prompt,
 )
+from .concurrency import LLM_LIMIT, SQL_LIMIT
+from .context import render_result, render_results, step_table_name, summarize_history
+from .frame_store import FRAME_STORE, FrameStore
+from .llm_cache import HashingEmbeddings, SqliteLLMCache
+from .plan_library import PlanLibrary
+from .planning import StructuredPlan, chart_requested, parse_plan, ready_steps, structured_plan_steps
+
+# Tag of the synthesis LLM call, so its tokens can be picked out of the graph's message stream
+FINAL_ANSWER_TAG = "final_answer"
 
 
 class AgentState(TypedDict):
-    """Defines the state of the agent."""
+    """
+    Defines the state of the agent. DataFrames are kept out of it: `dataframe_result` and `step_frames` hold
+    references into the frame store, so the state stays small enough to checkpoint after every node.
+    """
 
     question: str
     chat_history: list[BaseMessage]
-    dataframe_result: pd.DataFrame | None
+    history_summary: str
+    dataframe_result: str | None
     final_answer: str
-    chart_image_path: str | None
+    chart: Chart | None
     error: str | None
     retries: int
     plan: list[str]
+    step_dependencies: list[list[int]]
+    completed_steps: list[int]
     current_step: int
-    step_results: list[str]
+    step_results: list[str | None]
+    step_frames: dict[int, str]
+    step_sql: list[str | None]
+    planned_sql: list[str | None]
+    plan_reused: bool
+    chart_requested: bool
+    trace_id: str
 
 
 class AgentNodes:
-    """Defines LangGraph nodes of the agent."""
+    """
+    Defines LangGraph nodes of the agent.
 
-    def __init__(self, sql_tool: SqlTool, vis_tool: VisualizationTool, llm: ChatOpenAI, db_schema: str):
+    One instance serves every session: per-question data lives only in the graph state, while the SQL
+    workers and LLM calls are shared resources bounded by `SQL_LIMIT` and `LLM_LIMIT`.
+    """
+
+    def __init__(
+        self,
+        sql_tool: SqlTool,
+        vis_tool: VisualizationTool,
+        llm: BaseChatModel,
+        db_schema: str | None = None,
+        frame_store: FrameStore = FRAME_STORE,
+        plan_library: PlanLibrary | None = None,
+        structured_planning: bool = STRUCTURED_PLANNING,
+    ):
         self.sql_tool = sql_tool
         self.vis_tool = vis_tool
         self.llm = llm
-        self.db_schema = db_schema
+        self.frames = frame_store
+        self.plan_library = plan_library
+        self.synthesis_llm = llm.with_config(tags=[FINAL_ANSWER_TAG])
+        self.plan_llm = llm.with_structured_output(StructuredPlan) if structured_planning else None
+        self._db_schema = db_schema
+        self.sql_pool = ThreadPoolExecutor(max_workers=SQL_WORKERS, thread_name_prefix="sql")
+
+    @property
+    def db_schema(self) -> str:
+        """The fixed schema given, or else the catalog's current one, which follows data refreshes."""
+        return self._db_schema if self._db_schema is not None else self.sql_tool.catalog.get_schema()
 
-    def _get_history(self, history: list[BaseMessage]) -> str:
-        return "\n".join([f"{msg.type}: {msg.content}" for msg in history[-MAX_CONVERSATION_HISTORY:]])
+    def _get_history(self, state: AgentState) -> str:
+        history = state.get("chat_history") or []
+        recent = "\n".join([f"{msg.type}: {msg.content}" for msg in history[-MAX_CONVERSATION_HISTORY:]])
+        if state.get("history_summary"):
+            return f"Summary of the earlier conversation:\n{state['history_summary']}\n\n{recent}"
+        return recent
 
+    @traced_node("planner", new_trace=True)
     def planner(self, state: AgentState):
         print("Node: planner")
-        prompt = planner_system_prompt(
-            state["question"], self._get_history(state["chat_history"]), self.db_schema
+        # A checkpointed session still holds the previous question's results, which are not needed anymore
+        self.frames.delete((state.get("step_frames") or {}).values())
+        # Questions shaped like an earlier successful one reuse its plan and SQL without an LLM call
+        match = None
+        if self.plan_library is not None:
+            match = self.plan_library.match(state["question"], self.sql_tool.engine.dialect)
+        structured = None
+        if match is not None:
+            plan, dependencies, planned_sql = match.plan, match.dependencies, match.sql
+            chart = match.chart_requested
+            print(f"Reusing Plan (confidence {match.confidence:.2f}):\n{plan}\nDependencies: {dependencies}")
+        elif self.plan_llm is not None and (structured := self._structured_plan(state)) is not None:
+            plan, dependencies, planned_sql = structured_plan_steps(structured)
+            chart = structured.chart_requested
+            print(f"Generated Plan with SQL:\n{plan}\nDependencies: {dependencies}\nChart: {chart}")
+        else:
+            prompt = planner_system_prompt(state["question"], self._get_history(state), self.db_schema)
+            with LLM_LIMIT.hold():
+                response = self.llm.invoke([SystemMessage(content=prompt)])
+            # Parse the numbered list from response into steps and their dependencies
+            plan, dependencies = parse_plan(response.content)
+            planned_sql = [None] * len(plan)
+            chart = chart_requested(plan)
+            print(f"Generated Plan:\n{plan}\nDependencies: {dependencies}")
+        current_span().set(plan_reused=match is not None, structured=structured is not None)
+        return {
+            "plan": plan,
+            "step_dependencies": dependencies,
+            "planned_sql": planned_sql,
+            "plan_reused": match is not None,
+            "chart_requested": chart,
+            "completed_steps": [],
+            "current_step": 0,
+            "step_results": [None] * len(plan),
+            "step_frames": {},
+            "step_sql": [None] * len(plan),
+            "dataframe_result": None,
+            "chart": None,
+            "error": None,
+        }
+
+    def _structured_plan(self, state: AgentState) -> StructuredPlan | None:
+        """Plans the steps with their SQL in one call. Returns None if the model's output is unusable."""
+        prompt = structured_plan_prompt(
+            state["question"], self._get_history(state), self.db_schema, self.sql_tool.engine.dialect
         )
-        response = self.llm.invoke([SystemMessage(content=prompt)])
-        # Parse the numbered list from response into a Python list
-        plan = [step.strip() for step in response.content.split("\n") if step.strip() and step[0].isdigit()]
-        print(f"Generated Plan:\n{plan}")
-        return {"plan": plan, "current_step": 0, "step_results": []}
+        try:
+            with LLM_LIMIT.hold():
+                structured = self.plan_llm.invoke([SystemMessage(content=prompt)])
+        except Exception as e:
+            print(f"Structured planning failed, falling back to the planner: {e}")
+            return None
+        if structured is None or not structured.steps:
+            print("Structured planning returned no steps, falling back to the planner.")
+            return None
+        return structured
 
+    @traced_node("execute_step")
     def execute_step(self, state: AgentState):
-        print(f"Node: execute_step (Step {state['current_step'] + 1})")
-        plan = state["plan"]
-        current_step_index = state["current_step"]
-        step_instruction = plan[current_step_index]
+        """Executes every step whose dependencies are done, in parallel threads."""
+        wave = ready_steps(state["step_dependencies"], state["completed_steps"])
+        print(f"Node: execute_step (Steps {[i + 1 for i in wave]})")
+        # Each thread runs in a copy of this context, so its spans are nested under the node's span
+        contexts = [contextvars.copy_context() for _ in wave]
+        with ThreadPoolExecutor(max_workers=len(wave)) as pool:
+            outcomes = list(pool.map(lambda ctx, i: ctx.run(self._run_step, state, i), contexts, wave))
+        return self._merge_wave(state, wave, outcomes)
+
+    @traced_node("execute_step")
+    async def aexecute_step(self, state: AgentState):
+        """Async version of `execute_step`: LLM calls run concurrently, SQL runs in the worker pool."""
+        wave = ready_steps(state["step_dependencies"], state["completed_steps"])
+        print(f"Node: execute_step (Steps {[i + 1 for i in wave]})")
+        outcomes = await asyncio.gather(*(self._arun_step(state, i) for i in wave))
+        return self._merge_wave(state, wave, outcomes)
+
+    def _run_step(self, state: AgentState, index: int) -> tuple[pd.DataFrame | str | None, str | None]:
+        """
+        Runs one plan step, returning its result (an error message, or None if it needs no SQL) and the
+        query that produced it.
+        """
+        if not self._needs_sql(state, index):
+            return None, None
+        frames = self._dependency_frames(state, index)
+        sql_prompt = self._step_prompt(state, index, frames)
+        dependency_tables = {step_table_name(i): frame for i, frame in frames.items()}
+        with span("step", "step", step=index + 1) as step_span:
+            for attempt in range(1, MAX_RETRIES + 2):
+                step_span.set(attempts=attempt)
+                if attempt == 1 and self._planned_sql(state, index):
+                    # Planned SQL (reused or structured plan) runs first; the LLM only writes one if it fails
+                    sql_query = self._planned_sql(state, index)
+                else:
+                    with LLM_LIMIT.hold():
+                        sql_query = _clean_sql(self.llm.invoke([SystemMessage(content=sql_prompt)]).content)
+                with SQL_LIMIT.hold():
+                    result = self.sql_tool.execute_query(sql_query, dependency_tables)
+                if isinstance(result, pd.DataFrame):
+                    return result, sql_query
+                print(f"SQL execution failed. Attempt {attempt}/{MAX_RETRIES + 1}. Error: {result}")
+                SQL_RETRIES.inc()
+                sql_prompt = self._step_prompt(state, index, frames, sql_query, result)
+            step_span.fail(result)
+        return f"Failed to execute step '{state['plan'][index]}' after {MAX_RETRIES} attempts.", sql_query
+
+    async def _arun_step(self, state: AgentState, index: int) -> tuple[pd.DataFrame | str | None, str | None]:
+        if not self._needs_sql(state, index):
+            return None, None
+        loop = asyncio.get_running_loop()
+        frames = await asyncio.to_thread(self._dependency_frames, state, index)
+        sql_prompt = self._step_prompt(state, index, frames)
+        dependency_tables = {step_table_name(i): frame for i, frame in frames.items()}
+        with span("step", "step", step=index + 1) as step_span:
+            for attempt in range(1, MAX_RETRIES + 2):
+                step_span.set(attempts=attempt)
+                if attempt == 1 and self._planned_sql(state, index):
+                    sql_query = self._planned_sql(state, index)
+                else:
+                    async with LLM_LIMIT.ahold():
+                        response = await self.llm.ainvoke([SystemMessage(content=sql_prompt)])
+                    sql_query = _clean_sql(response.content)
+                async with SQL_LIMIT.ahold():
+                    # The worker runs in a copy of this context, so the SQL span is nested under the step
+                    result = await loop.run_in_executor(
+                        self.sql_pool,
+                        contextvars.copy_context().run,
+                        self.sql_tool.execute_query,
+                        sql_query,
+                        dependency_tables,
+                    )
+                if isinstance(result, pd.DataFrame):
+                    return result, sql_query
+                print(f"SQL execution failed. Attempt {attempt}/{MAX_RETRIES + 1}. Error: {result}")
+                SQL_RETRIES.inc()
+                sql_prompt = self._step_prompt(state, index, frames, sql_query, result)
+            step_span.fail(result)
+        return f"Failed to execute step '{state['plan'][index]}' after {MAX_RETRIES} attempts.", sql_query
 
-        # Check if this is a final synthesis/visualization step that doesn't need SQL
+    @staticmethod
+    def _planned_sql(state: AgentState, index: int) -> str | None:
+        planned = state.get("planned_sql") or []
+        return planned[index] if index < len(planned) else None
+
+    def _needs_sql(self, state: AgentState, index: int) -> bool:
+        if any(state.get("planned_sql") or []):
+            # A plan that came with its SQL (reused or structured) has no query for steps that need none
+            return self._planned_sql(state, index) is not None
+        return not self._is_non_sql_step(state["plan"][index])
+
+    @staticmethod
+    def _is_non_sql_step(step_instruction: str) -> bool:
+        # Final synthesis/visualization steps don't need SQL
         if any(
             keyword in step_instruction.lower()
             for keyword in ["synthesize", "chart", "visualize", "plot", "draw"]
         ):
             print("Step is for synthesis/visualization, skipping SQL execution.")
-            return {"current_step": current_step_index + 1}
-
-        previous_results_str = "\n".join(state["step_results"])
-        sql_prompt = step_sql_generation_prompt(step_instruction, previous_results_str, self.db_schema)
-
-        retries = 0
-        while retries <= MAX_RETRIES:
-            sql_query = (
-                self.llm.invoke([SystemMessage(content=sql_prompt)])
-                .content.strip()
-                .replace("```sql", "")
-                .replace("```", "")
-            )
-            result = self.sql_tool.execute_query(sql_query)
-
-            if isinstance(result, pd.DataFrame):
-                step_results = state["step_results"] + [result.to_markdown(index=False)]
-                return {
-                    "step_results": step_results,
-                    "current_step": current_step_index + 1,
-                    "dataframe_result": result,
-                }
-            else:
-                retries += 1
-                print(f"SQL execution failed. Attempt {retries}/{MAX_RETRIES}. Error: {result}")
-                sql_prompt = step_sql_generation_prompt(
-                    f"""FAILED ATTEMPT. The previous query '{sql_query}' failed with the error: {result}.
-                    Please fix it. Original instruction: {step_instruction}""",
-                    previous_results_str,
-                    self.db_schema,
-                )
+            return True
+        return False
+
+    def _step_prompt(
+        self,
+        state: AgentState,
+        index: int,
+        frames: dict[int, pd.DataFrame],
+        failed_query: str | None = None,
+        error: str | None = None,
+    ) -> str:
+        step_instruction = state["plan"][index]
+        # Only the results of the steps this one depends on are passed as context, within a token budget
+        previous_results_str = render_results(frames, SQL_CONTEXT_TOKEN_BUDGET)
+        if failed_query is not None:
+            step_instruction = f"""FAILED ATTEMPT. The previous query '{failed_query}' failed with the error:
+                    {error}. Please fix it. Original instruction: {step_instruction}"""
+        return step_sql_generation_prompt(
+            step_instruction, previous_results_str, self.db_schema, self.sql_tool.engine.dialect
+        )
+
+    def _dependency_frames(self, state: AgentState, index: int) -> dict[int, pd.DataFrame]:
+        """Full results of the steps this one depends on, queryable as `step_<n>` tables."""
+        refs = state["step_frames"]
+        return self.frames.get_all({i: refs[i] for i in state["step_dependencies"][index] if i in refs})
 
-        return {"error": f"Failed to execute step '{step_instruction}' after {MAX_RETRIES} attempts."}
+    def _merge_wave(
+        self, state: AgentState, wave: list[int], outcomes: list[tuple[pd.DataFrame | str | None, str | None]]
+    ):
+        """Merges the results of a wave of steps into the state, in plan order."""
+        step_sql = list(state["step_sql"])
+        for index, (_, sql_query) in zip(wave, outcomes, strict=True):
+            step_sql[index] = sql_query
+        errors = [outcome for outcome, _ in outcomes if isinstance(outcome, str)]
+        if errors:
+            return {"error": errors[0], "step_sql": step_sql}
 
+        step_results = list(state["step_results"])
+        step_frames = dict(state["step_frames"])
+        completed_steps = state["completed_steps"] + wave
+        update = {
+            "step_results": step_results,
+            "step_frames": step_frames,
+            "step_sql": step_sql,
+            "completed_steps": completed_steps,
+        }
+        last_result_step = max((i for i, res in enumerate(step_results) if res is not None), default=-1)
+        for index, (outcome, _) in zip(wave, outcomes, strict=True):
+            if outcome is None:
+                continue
+            # Full results are spilled to the frame store; the state only carries a compact rendering
+            # Kept until the question is answered, whatever other sessions write meanwhile
+            step_frames[index] = self.frames.put(outcome, owner=state.get("trace_id"))
+            step_results[index] = render_result(outcome, index, SQL_CONTEXT_TOKEN_BUDGET)
+            # The chart uses the result of the latest step in plan order
+            if index > last_result_step:
+                update["dataframe_result"], last_result_step = step_frames[index], index
+        update["current_step"] = len(completed_steps)
+        return update
+
+    @traced_node("generate_final_answer")
     def generate_final_answer(self, state: AgentState):
         print("Node: generate_final_answer")
-        if any(
-            keyword in state["plan"][-2].lower() or keyword in state["plan"][-1].lower()
-            for keyword in ["chart", "visualize", "plot", "draw"]
-        ):
-            print("Visualization requested.")
-            df_for_viz = state.get("dataframe_result")
-            if df_for_viz is not None and not df_for_viz.empty:
-                path = self.vis_tool.generate_chart(df_for_viz, state["question"])
-                if "Error:" in path:
-                    return {"error": path}
-                state["chart_image_path"] = path
-            else:
-                print("Warning: Visualization requested but no data is available.")
-
-        prompt = final_answer_synthesis_prompt(state["question"], state["plan"], state["step_results"])
-        response = self.llm.invoke([SystemMessage(content=prompt)])
-        return {"final_answer": response.content, "chart_image_path": state.get("chart_image_path")}
+        frames = self.frames.get_all(state["step_frames"])
+        results_str = render_results(frames, FINAL_ANSWER_CONTEXT_TOKEN_BUDGET)
+        prompt = final_answer_synthesis_prompt(state["question"], state["plan"], results_str)
+        with LLM_LIMIT.hold():
+            response = self.synthesis_llm.invoke([SystemMessage(content=prompt)])
+        return {"final_answer": response.content}
+
+    @traced_node("generate_chart")
+    def generate_chart(self, state: AgentState):
+        print("Node: generate_chart")
+        df_for_viz = self._chart_frame(state)
+        if df_for_viz is None or df_for_viz.empty:
+            print("Warning: Visualization requested but no data is available.")
+            return {"chart": None}
+        # Most charts follow from the column types; only ambiguous ones take an LLM call. Drawing happens
+        # in the renderer's worker processes
+        details = self.vis_tool.suggest_chart(df_for_viz, state["question"])
+        if details is None:
+            with LLM_LIMIT.hold():
+                details = self.vis_tool.choose_chart(df_for_viz, state["question"])
+        chart = details if isinstance(details, str) else self.vis_tool.render(df_for_viz, details)
+        if isinstance(chart, str):
+            return {"error": chart, "chart": None}
+        return {"chart": chart}
 
+    @traced_node("generate_chart")
+    async def agenerate_chart(self, state: AgentState):
+        print("Node: generate_chart")
+        df_for_viz = await asyncio.to_thread(self._chart_frame, state)
+        if df_for_viz is None or df_for_viz.empty:
+            print("Warning: Visualization requested but no data is available.")
+            return {"chart": None}
+        details = self.vis_tool.suggest_chart(df_for_viz, state["question"])
+        if details is None:
+            async with LLM_LIMIT.ahold():
+                details = await self.vis_tool.achoose_chart(df_for_viz, state["question"])
+        chart = details if isinstance(details, str) else await self.vis_tool.arender(df_for_viz, details)
+        if isinstance(chart, str):
+            return {"error": chart, "chart": None}
+        return {"chart": chart}
+
+    def _chart_frame(self, state: AgentState) -> pd.DataFrame | None:
+        ref = state.get("dataframe_result")
+        return self.frames.get(ref) if ref is not None else None
+
+    @traced_node("handle_failure")
     def handle_failure(self, state: AgentState):
         print("Node: handle_failure")
         error = state["error"]
         answer = f"I'm sorry, but I was unable to complete the plan. I encountered an error:\n`{error}`"
         return {"final_answer": answer}
 
+    @traced_node("update_chat_history")
     def update_chat_history(self, state: AgentState):
         print("Node: update_chat_history")
-        chat_history = state["chat_history"]
-        chat_history.append(HumanMessage(content=state["question"]))
-        chat_history.append(AIMessage(content=state["final_answer"]))
-        return {"chat_history": chat_history}
+        # A new list, so the history object held by the caller's session is never modified. Only the latest
+        # messages are kept, starting at a question; older ones are folded into a summary of bounded size
+        chat_history = (state.get("chat_history") or []) + [
+            HumanMessage(content=state["question"]),
+            AIMessage(content=state["final_answer"]),
+        ]
+        kept = chat_history[-MAX_CONVERSATION_HISTORY:]
+        while kept and not isinstance(kept[0], HumanMessage):
+            kept = kept[1:]
+        dropped = chat_history[: len(chat_history) - len(kept)]
+        update = {"chat_history": kept}
+        if dropped:
+            update["history_summary"] = summarize_history(
+                state.get("history_summary") or "", dropped, HISTORY_SUMMARY_TOKEN_BUDGET
+            )
+        if self.plan_library is not None:
+            dialect = self.sql_tool.engine.dialect
+            if not state.get("error"):
+                # Also refreshes reused entries, e.g. with a query the LLM had to rewrite
+                self.plan_library.add(
+                    state["question"],
+                    dialect,
+                    state["plan"],
+                    state["step_dependencies"],
+                    state["step_sql"],
+                    bool(state.get("chart_requested")),
+                )
+            elif state.get("plan_reused"):
+                self.plan_library.discard(state["question"], dialect)
+            print(f"Plan library: {self.plan_library.stats()}")
+        if isinstance(self.llm.cache, SqliteLLMCache):
+            print(f"LLM cache: {self.llm.cache.stats()}")
+        print(f"Query result cache: {self.sql_tool.result_cache.stats()}")
+        if self.sql_tool.rollups is not None:
+            print(f"Rollups: {self.sql_tool.rollups.stats()}")
+        print(f"Chart cache: {self.vis_tool.renderer.stats()}")
+        print(f"Concurrency: LLM {LLM_LIMIT.stats()}, SQL {SQL_LIMIT.stats()}")
+        if state.get("trace_id"):
+            # The answer and chart are done; the question's frames may go once the store is full
+            self.frames.release(state["trace_id"])
+        print(f"Frame store: {self.frames.stats()}")
+        return update
 
 
 def route_plan(state: AgentState):
@@ -143,23 +444,71 @@ def route_plan(state: AgentState):
     plan_length = len(state.get("plan", []))
 
     if current_step >= plan_length:
+        if state.get("chart_requested"):
+            # The chart is drawn alongside the answer, so the answer doesn't wait for it
+            print("Plan complete. Routing to generate_final_answer and generate_chart.")
+            return ["generate_final_answer", "generate_chart"]
         print("Plan complete. Routing to generate_final_answer.")
         return "generate_final_answer"
     else:
-        print(f"Plan not complete. Routing to execute_step {current_step + 1}.")
+        print(f"Plan not complete ({current_step}/{plan_length} steps done). Routing to execute_step.")
         return "execute_step"
 
 
-def build_agent_graph(df: pd.DataFrame, db_schema: str, table_name: str):
-    llm = ChatOpenAI(model=LLM_MODEL, temperature=0)
-    sql_tool = SqlTool(df, table_name)
-    vis_tool = VisualizationTool()
-    nodes = AgentNodes(sql_tool, vis_tool, llm, db_schema)
+def _clean_sql(content: str) -> str:
+    return content.strip().replace("```sql", "").replace("```", "")
+
+
+def create_llm() -> ChatOpenAI:
+    """Creates the chat model used by the agent, backed by the response cache if enabled."""
+    cache = None
+    if LLM_CACHE_ENABLED:
+        cache = SqliteLLMCache(embeddings=HashingEmbeddings() if LLM_CACHE_SEMANTIC else None)
+    return ChatOpenAI(model=LLM_MODEL, temperature=0, cache=cache, stream_usage=True)
+
+
+def _with_tracing(llm: BaseChatModel) -> BaseChatModel:
+    """Attaches the handler that records a span per LLM call, including calls made by the tools."""
+    callbacks = llm.callbacks or []
+    if isinstance(callbacks, list):
+        if LLM_TRACING_HANDLER not in callbacks:
+            llm.callbacks = [*callbacks, LLM_TRACING_HANDLER]
+    else:
+        callbacks.add_handler(LLM_TRACING_HANDLER, inherit=True)
+    return llm
+
+
+def build_agent_graph(
+    sql_tool: SqlTool,
+    db_schema: str | None = None,
+    llm: BaseChatModel | None = None,
+    renderer: ChartRenderer | None = None,
+    checkpointer: BaseCheckpointSaver | None = None,
+    plan_library: PlanLibrary | None = None,
+    structured_planning: bool = STRUCTURED_PLANNING,
+    frame_store: FrameStore = FRAME_STORE,
+):
+    """
+    Builds the agent graph. With a checkpointer, every invocation needs a `thread_id` (the chat session) in
+    its config, and the session's history is restored from the checkpointer instead of the input.
+    """
+    llm = _with_tracing(llm or create_llm())
+    vis_tool = VisualizationTool(llm, renderer)
+    nodes = AgentNodes(
+        sql_tool,
+        vis_tool,
+        llm,
+        db_schema,
+        frame_store=frame_store,
+        plan_library=plan_library,
+        structured_planning=structured_planning,
+    )
 
     workflow = StateGraph(AgentState)
     workflow.add_node("planner", nodes.planner)
-    workflow.add_node("execute_step", nodes.execute_step)
+    workflow.add_node("execute_step", RunnableLambda(nodes.execute_step, afunc=nodes.aexecute_step))
     workflow.add_node("generate_final_answer", nodes.generate_final_answer)
+    workflow.add_node("generate_chart", RunnableLambda(nodes.generate_chart, afunc=nodes.agenerate_chart))
     workflow.add_node("handle_failure", nodes.handle_failure)
     workflow.add_node("update_chat_history", nodes.update_chat_history)
 
@@ -167,7 +516,8 @@ def build_agent_graph(df: pd.DataFrame, db_schema: str, table_name: str):
     workflow.add_conditional_edges("planner", route_plan)
     workflow.add_conditional_edges("execute_step", route_plan)
     workflow.add_edge("generate_final_answer", "update_chat_history")
+    workflow.add_edge("generate_chart", "update_chat_history")
     workflow.add_edge("handle_failure", "update_chat_history")
     workflow.add_edge("update_chat_history", END)
 
-    return workflow.compile()
+    return workflow.compile(checkpointer=checkpointer)
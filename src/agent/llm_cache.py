@@ -0,0 +1,245 @@
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import warnings
+
+import numpy as np
+from langchain_core._api import LangChainBetaWarning
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.embeddings import Embeddings
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, Generation
+
+from config import (
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_PATH,
+    LLM_CACHE_SIMILARITY_THRESHOLD,
+    LLM_CACHE_TTL_SECONDS,
+)
+
+# Numbers and quoted strings (not apostrophes); questions only count as similar if these are identical
+_LITERAL_PATTERN = re.compile(r"(?<!\w)'[^']*'(?!\w)|\"[^\"]*\"|\b\d+(?:\.\d+)?\b")
+
+# The part of a prompt that varies with the user's wording: the question or step instruction. Everything
+# else (instructions, schema, history, results) must be identical for a similar prompt to be reused.
+_VARIABLE_PATTERN = re.compile(
+    r'^\s*\*\*(?:User Question|Original User Question|Current Step Instruction):\*\* "(.*)"\s*$', re.MULTILINE
+)
+
+# Only LLM outputs are ever revived from the cache file
+_CACHED_TYPES = [Generation, ChatGeneration, ChatGenerationChunk, AIMessage, AIMessageChunk]
+
+
+class HashingEmbeddings(Embeddings):
+    """Local bag-of-words embeddings using the hashing trick. Needs no model or network access."""
+
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        vector = [0.0] * self.dimensions
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(token.encode()).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dimensions] += 1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+
+class SqliteLLMCache(BaseCache):
+    """
+    Persistent LLM response cache stored in a local SQLite file.
+
+    Entries are keyed on a hash of the prompt and the LLM configuration (model, temperature, ...), expire
+    after `ttl_seconds` and are evicted least-recently-used beyond `max_entries`. If `embeddings` is given,
+    a miss falls back to a cached prompt for the same configuration that differs only in the wording of
+    its question or step instruction: the rest of the prompt must be identical, the instruction must
+    contain exactly the same literals and its embedding must clear `similarity_threshold`. Only the
+    instructions are embedded, so the schema and prompt template don't make every prompt look alike.
+    """
+
+    def __init__(
+        self,
+        path: str = LLM_CACHE_PATH,
+        ttl_seconds: float | None = LLM_CACHE_TTL_SECONDS,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        embeddings: Embeddings | None = None,
+        similarity_threshold: float = LLM_CACHE_SIMILARITY_THRESHOLD,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        columns = [row[1] for row in self._connection.execute("PRAGMA table_info(llm_cache)")]
+        if columns and "template" not in columns:
+            # Entries of older versions have no template key; being a cache, they are simply dropped
+            self._connection.execute("DROP TABLE llm_cache")
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                llm_string TEXT NOT NULL,
+                template TEXT,
+                literals TEXT,
+                embedding BLOB,
+                generations TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )""")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache (last_access)")
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_llm_cache_template ON llm_cache (llm_string, template, literals)"
+        )
+        self._connection.commit()
+
+    def lookup(self, prompt: str, llm_string: str) -> RETURN_VAL_TYPE | None:
+        now = time.time()
+        with self._lock:
+            if self.ttl_seconds is not None:
+                self._connection.execute(
+                    "DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+                )
+            key = _cache_key(prompt, llm_string)
+            row = self._connection.execute(
+                "SELECT generations FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None and self.embeddings is not None:
+                key, row = self._lookup_similar(prompt, llm_string)
+                if row is not None:
+                    self.semantic_hits += 1
+            elif row is not None:
+                self.hits += 1
+            if row is None:
+                self.misses += 1
+                self._connection.commit()
+                return None
+            self._connection.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._connection.commit()
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", LangChainBetaWarning)
+            return [loads(gen, allowed_objects=_CACHED_TYPES) for gen in json.loads(row[0])]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        now = time.time()
+        generations = json.dumps([dumps(generation) for generation in return_val])
+        template, literals, embedding = None, None, None
+        parts = _variable_parts(prompt)
+        if self.embeddings is not None and parts is not None:
+            template, text = parts
+            literals = _literals(text)
+            embedding = _normalized(self.embeddings.embed_query(text)).tobytes()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    _cache_key(prompt, llm_string),
+                    llm_string,
+                    template,
+                    literals,
+                    embedding,
+                    generations,
+                    now,
+                    now,
+                ),
+            )
+            self._connection.execute(
+                """DELETE FROM llm_cache WHERE key NOT IN (
+                    SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT ?
+                )""",
+                (self.max_entries,),
+            )
+            self._connection.commit()
+
+    def clear(self, **kwargs) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM llm_cache")
+            self._connection.commit()
+
+    def stats(self) -> dict[str, float]:
+        """Returns hit/miss counters and the number of stored entries."""
+        with self._lock:
+            entries = self._connection.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+    def _lookup_similar(self, prompt: str, llm_string: str) -> tuple[str | None, tuple | None]:
+        parts = _variable_parts(prompt)
+        if parts is None:
+            return None, None
+        template, text = parts
+        # The index narrows the candidates to prompts differing only in the wording of the instruction
+        rows = self._connection.execute(
+            """SELECT key, embedding FROM llm_cache
+            WHERE llm_string = ? AND template = ? AND literals = ? AND embedding IS NOT NULL""",
+            (llm_string, template, _literals(text)),
+        ).fetchall()
+        query = _normalized(self.embeddings.embed_query(text))
+        # Embeddings of another model (size) can't be compared
+        rows = [row for row in rows if len(row[1]) == query.nbytes]
+        if not rows:
+            return None, None
+        matrix = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.float32).reshape(len(rows), -1)
+        scores = matrix @ query
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None, None
+        key = rows[best][0]
+        return (
+            key,
+            self._connection.execute("SELECT generations FROM llm_cache WHERE key = ?", (key,)).fetchone(),
+        )
+
+
+def _cache_key(prompt: str, llm_string: str) -> str:
+    return hashlib.sha256(f"{llm_string}\0{prompt}".encode()).hexdigest()
+
+
+def _prompt_text(prompt: str) -> str:
+    """Extracts the message contents from a serialized chat prompt."""
+    try:
+        messages = json.loads(prompt)
+        return "\n".join(str(message["kwargs"]["content"]) for message in messages)
+    except (ValueError, TypeError, KeyError):
+        return prompt
+
+
+def _variable_parts(prompt: str) -> tuple[str, str] | None:
+    """
+    Splits a prompt into a hash of its fixed part and the question or step instruction, or returns None if
+    it has neither, as in SQL retry prompts.
+    """
+    text = _prompt_text(prompt)
+    matches = list(_VARIABLE_PATTERN.finditer(text))
+    if len(matches) != 1:
+        return None
+    match = matches[0]
+    template = text[: match.start(1)] + "\0" + text[match.end(1) :]
+    return hashlib.sha256(template.encode()).hexdigest(), match.group(1)
+
+
+def _literals(text: str) -> str:
+    return json.dumps(sorted(set(_LITERAL_PATTERN.findall(text))))
+
+
+def _normalized(vector: list[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
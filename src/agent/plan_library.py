@@ -0,0 +1,375 @@
+import difflib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+import sqlglot
+from sqlglot import exp
+
+from config import PLAN_LIBRARY_MAX_ENTRIES, PLAN_LIBRARY_PATH, PLAN_LIBRARY_SIMILARITY_THRESHOLD
+from src.data.catalog import DataCatalog
+from src.observability.metrics import PLAN_LIBRARY_LOOKUPS
+from src.tools.sql_engines import SQLGLOT_DIALECTS
+
+from .planning import chart_requested as plan_requests_chart
+
+# Literals of a question, in the order they are looked for: quoted strings, ISO dates and numbers
+_QUOTED_PATTERN = re.compile(r"'([^']*)'")
+_DATE_PATTERN = re.compile(r"(?<![\w.-])\d{4}-\d{2}-\d{2}(?!\w|[.-]\d)")
+_NUMBER_PATTERN = re.compile(r"(?<![\w.-])\d+(?:\.\d+)?(?!\w|[.-]\d)")
+
+# String literals, quoted identifiers and numbers of a SQL query
+_SQL_TOKEN_PATTERN = re.compile(r"'((?:[^']|'')*)'|\"(?:[^\"]|\"\")*\"|(?<![\w.])\d+(?:\.\d+)?(?![\w.])")
+
+# Questions referring to earlier answers depend on the conversation, so their plans are not reused
+_REFERENCE_PATTERN = re.compile(
+    r"\b(that|those|these|this|it|its|them|they|same|previous|above|again)\b", re.IGNORECASE
+)
+
+# Words that don't change what a question asks for
+_FILLER_WORDS = {
+    "a", "an", "the", "please", "can", "could", "would", "you", "me", "us", "show", "tell", "give",
+    "what", "whats", "is", "are", "was", "were", "i", "want", "like", "do", "does",
+}  # fmt: skip
+
+# Expressions a literal can be wrapped in and still be a plain value
+_LITERAL_WRAPPERS = (exp.Neg, exp.Paren, exp.Cast)
+
+# Stands for the n-th literal of a question in stored plans and SQL
+_PLACEHOLDER = "{{{{{}}}}}"
+
+
+@dataclass
+class Literal:
+    kind: str
+    value: str
+    start: int
+    end: int
+
+
+@dataclass
+class PlanMatch:
+    """A stored plan with the literals of the new question filled in."""
+
+    plan: list[str]
+    dependencies: list[list[int]]
+    sql: list[str | None]
+    chart_requested: bool
+    confidence: float
+
+
+class PlanLibrary:
+    """
+    Library of the plans and SQL of successfully answered questions, so that questions of the same shape
+    are answered without the planner LLM call and, as long as the stored queries still run, without the
+    SQL-generation calls.
+
+    Questions are reduced to a signature: lowercase words without filler, with every literal (quoted
+    string, date, number, or value of a profiled text column) replaced by its kind. The literals are
+    parameterized in the stored plan and SQL and replaced by those of the new question on a match. A
+    question matches an entry with the same signature. It also matches an entry whose signature has the
+    same words in another order, at least `similarity_threshold` similar, but then only the plan is reused
+    and the LLM writes the SQL: a stored query is only replayed for the exact same shape. Otherwise the
+    planner LLM is called. Questions referring to earlier answers, and plans whose SQL doesn't use every
+    literal of the question, exactly as written, as a compared value, are not stored. Entries are kept in a
+    local SQLite file, least recently used ones are dropped beyond `max_entries`.
+    """
+
+    def __init__(
+        self,
+        catalog: DataCatalog,
+        path: str = PLAN_LIBRARY_PATH,
+        max_entries: int = PLAN_LIBRARY_MAX_ENTRIES,
+        similarity_threshold: float = PLAN_LIBRARY_SIMILARITY_THRESHOLD,
+    ):
+        self.catalog = catalog
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS plan_library (
+                signature TEXT NOT NULL,
+                dialect TEXT NOT NULL,
+                plan TEXT NOT NULL,
+                dependencies TEXT NOT NULL,
+                sql TEXT NOT NULL,
+                uses INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                chart_requested INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (signature, dialect)
+            )""")
+        try:
+            # Libraries written before the chart intent was stored: derive it from their plans, as the
+            # planner does, so that they still draw their charts
+            self._connection.execute(
+                "ALTER TABLE plan_library ADD COLUMN chart_requested INTEGER NOT NULL DEFAULT 0"
+            )
+            rows = self._connection.execute("SELECT rowid, plan FROM plan_library").fetchall()
+            self._connection.executemany(
+                "UPDATE plan_library SET chart_requested = ? WHERE rowid = ?",
+                [(int(plan_requests_chart(json.loads(plan))), rowid) for rowid, plan in rows],
+            )
+        except sqlite3.OperationalError:
+            pass
+        self._connection.commit()
+
+    def match(self, question: str, dialect: str) -> PlanMatch | None:
+        """Returns the stored plan for questions of this shape, or None if confidence is too low."""
+        if _REFERENCE_PATTERN.search(question):
+            return None
+        signature, literals = self._signature(question)
+        with self._lock:
+            row = self._connection.execute(
+                """SELECT signature, plan, dependencies, sql, chart_requested FROM plan_library
+                WHERE signature = ? AND dialect = ?""",
+                (signature, dialect),
+            ).fetchone()
+            confidence = 1.0
+            if row is None:
+                row, confidence = self._most_similar(signature, dialect)
+            if row is None:
+                self.misses += 1
+            else:
+                if confidence == 1.0:
+                    self.hits += 1
+                else:
+                    self.similar_hits += 1
+                self._connection.execute(
+                    """UPDATE plan_library SET uses = uses + 1, last_used = ?
+                    WHERE signature = ? AND dialect = ?""",
+                    (time.time(), row[0], dialect),
+                )
+                self._connection.commit()
+        PLAN_LIBRARY_LOOKUPS.inc(result="miss" if row is None else "hit" if confidence == 1.0 else "similar")
+        if row is None:
+            return None
+        values = [literal.value for literal in literals]
+        sql = [None if query is None else _fill(query, values, sql=True) for query in json.loads(row[3])]
+        return PlanMatch(
+            [_fill(step, values) for step in json.loads(row[1])],
+            json.loads(row[2]),
+            sql if confidence == 1.0 else [None] * len(sql),
+            bool(row[4]),
+            confidence,
+        )
+
+    def add(
+        self,
+        question: str,
+        dialect: str,
+        plan: list[str],
+        dependencies: list[list[int]],
+        sql: list[str | None],
+        chart_requested: bool = False,
+    ) -> bool:
+        """Stores the plan and SQL of a successfully answered question. Returns whether it was stored."""
+        if _REFERENCE_PATTERN.search(question) or not any(sql):
+            return False
+        signature, literals = self._signature(question)
+        values = [literal.value for literal in literals]
+        if len(set(values)) < len(values):
+            # The same value twice can't be mapped back to the right literal
+            return False
+        sql_templates = [
+            None if query is None else _parameterize_sql(query, literals, dialect) for query in sql
+        ]
+        if any(template is False for template in sql_templates):
+            return False
+        used = "".join(template for template in sql_templates if template)
+        if any(_PLACEHOLDER.format(i) not in used for i in range(len(literals))):
+            # A literal the SQL doesn't use as such may change the query in other ways
+            return False
+        plan_templates = [_parameterize_text(step, literals) for step in plan]
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                """INSERT INTO plan_library VALUES (?, ?, ?, ?, ?, 1, ?, ?)
+                ON CONFLICT (signature, dialect) DO UPDATE SET
+                    plan = excluded.plan, dependencies = excluded.dependencies, sql = excluded.sql,
+                    last_used = excluded.last_used, chart_requested = excluded.chart_requested""",
+                (
+                    signature,
+                    dialect,
+                    json.dumps(plan_templates),
+                    json.dumps(dependencies),
+                    json.dumps(sql_templates),
+                    now,
+                    chart_requested,
+                ),
+            )
+            self._connection.execute(
+                """DELETE FROM plan_library WHERE rowid NOT IN (
+                    SELECT rowid FROM plan_library ORDER BY last_used DESC LIMIT ?
+                )""",
+                (self.max_entries,),
+            )
+            self._connection.commit()
+        return True
+
+    def discard(self, question: str, dialect: str) -> None:
+        """Removes the entry a question was answered from, after the replayed plan failed."""
+        signature, _ = self._signature(question)
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM plan_library WHERE signature = ? AND dialect = ?", (signature, dialect)
+            )
+            self._connection.commit()
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            entries = self._connection.execute("SELECT COUNT(*) FROM plan_library").fetchone()[0]
+        lookups = self.hits + self.similar_hits + self.misses
+        return {
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.similar_hits) / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+    def _signature(self, question: str) -> tuple[str, list[Literal]]:
+        literals = _find_literals(question, self.catalog.text_values())
+        parts, position = [], 0
+        for literal in literals:
+            parts.append(_normalize_words(question[position : literal.start]))
+            parts.append(f"{{{literal.kind}}}")
+            position = literal.end
+        parts.append(_normalize_words(question[position:]))
+        return " ".join(part for part in parts if part), literals
+
+    def _most_similar(self, signature: str, dialect: str) -> tuple[tuple | None, float]:
+        """
+        The most similar entry with the same words in another order. Any other differing word may change
+        the meaning ("highest" vs "lowest"), and so may reordered literals of the same kind.
+        """
+        words = signature.split()
+        kinds = [word for word in words if word.startswith("{")]
+        if len(set(kinds)) < len(kinds):
+            return None, self.similarity_threshold
+        best_row, best_score = None, self.similarity_threshold
+        rows = self._connection.execute(
+            """SELECT signature, plan, dependencies, sql, chart_requested FROM plan_library
+            WHERE dialect = ?""",
+            (dialect,),
+        ).fetchall()
+        for row in rows:
+            candidate = row[0].split()
+            if (
+                sorted(candidate) != sorted(words)
+                or [word for word in candidate if word.startswith("{")] != kinds
+            ):
+                continue
+            matcher = difflib.SequenceMatcher(None, words, candidate, autojunk=False)
+            if matcher.real_quick_ratio() < best_score or matcher.quick_ratio() < best_score:
+                continue
+            score = matcher.ratio()
+            if score >= best_score:
+                best_row, best_score = row, score
+        return best_row, best_score
+
+
+def _find_literals(question: str, text_values: set[str]) -> list[Literal]:
+    literals: list[Literal] = []
+
+    def taken(start: int, end: int) -> bool:
+        return any(start < literal.end and literal.start < end for literal in literals)
+
+    for match in _QUOTED_PATTERN.finditer(question):
+        literals.append(Literal("text", match.group(1), match.start(), match.end()))
+    # Values of profiled text columns, longest first so that a value isn't matched inside a longer one
+    for value in sorted((value for value in text_values if len(value) > 1), key=len, reverse=True):
+        for match in re.finditer(rf"(?<!\w){re.escape(value)}(?!\w)", question):
+            if not taken(match.start(), match.end()):
+                literals.append(Literal("value", value, match.start(), match.end()))
+    for kind, pattern in (("date", _DATE_PATTERN), ("number", _NUMBER_PATTERN)):
+        for match in pattern.finditer(question):
+            if not taken(match.start(), match.end()):
+                literals.append(Literal(kind, match.group(0), match.start(), match.end()))
+    return sorted(literals, key=lambda literal: literal.start)
+
+
+def _normalize_words(text: str) -> str:
+    words = []
+    for word in re.findall(r"[\w.]+", text.lower()):
+        word = word.strip(".")
+        if not word or word in _FILLER_WORDS:
+            continue
+        # Crude plural folding, so that "value" and "values" give the same signature
+        words.append(word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word)
+    return " ".join(words)
+
+
+def _parameterize_sql(query: str, literals: list[Literal], dialect: str) -> str | bool:
+    """
+    Replaces the question's literals in a query by placeholders. Returns False if a literal also occurs
+    where it can't be replaced safely: inside a longer string, in other casing, or anywhere but as a
+    compared value, an IN list item, a BETWEEN bound or a LIMIT. E.g. the 4 of "top 4 years" in
+    `substr(d, 1, 4)` must stay 4, and the LLM writing 'North' for a question about 'north' doesn't mean
+    that 'south' would be written as is.
+    """
+    try:
+        tree = sqlglot.parse_one(query, read=SQLGLOT_DIALECTS.get(dialect))
+    except sqlglot.errors.SqlglotError:
+        return False
+    values = {literal.value.lower() for literal in literals}
+    if any(node.this.lower() in values and not _is_value(node) for node in tree.find_all(exp.Literal)):
+        return False
+    parts, position = [], 0
+    for token in _SQL_TOKEN_PATTERN.finditer(query):
+        text = token.group(0)
+        index = None
+        if token.group(1) is not None:
+            content = token.group(1).replace("''", "'")
+            index = next((i for i, lit in enumerate(literals) if lit.value == content), None)
+            # Case-insensitive, so that a string holding the literal in other casing isn't stored either
+            if index is None and any(_contains(content, literal.value) for literal in literals):
+                return False
+            replacement = f"'{_PLACEHOLDER.format(index)}'"
+        elif text[0] != '"':
+            index = next(
+                (i for i, lit in enumerate(literals) if lit.kind == "number" and lit.value == text), None
+            )
+            replacement = _PLACEHOLDER.format(index)
+        parts.append(query[position : token.start()])
+        parts.append(text if index is None else replacement)
+        position = token.end()
+    parts.append(query[position:])
+    return "".join(parts)
+
+
+def _is_value(literal: exp.Literal) -> bool:
+    """Whether a literal is a value the question chose, rather than part of how the query computes."""
+    node = literal
+    while isinstance(node.parent, _LITERAL_WRAPPERS):
+        node = node.parent
+    parent = node.parent
+    if isinstance(parent, exp.In):
+        return node.arg_key == "expressions"
+    if isinstance(parent, exp.Between):
+        return node.arg_key in ("low", "high")
+    return isinstance(parent, exp.EQ | exp.NEQ | exp.GT | exp.GTE | exp.LT | exp.LTE | exp.Limit | exp.Offset)
+
+
+def _parameterize_text(text: str, literals: list[Literal]) -> str:
+    for index, literal in enumerate(literals):
+        pattern = rf"(?<![\w.]){re.escape(literal.value)}(?!\w|\.\d)"
+        text = re.sub(pattern, _PLACEHOLDER.format(index), text, flags=re.IGNORECASE)
+    return text
+
+
+def _fill(template: str, values: list[str], sql: bool = False) -> str:
+    for index, value in enumerate(values):
+        template = template.replace(_PLACEHOLDER.format(index), value.replace("'", "''") if sql else value)
+    return template
+
+
+def _contains(text: str, value: str) -> bool:
+    return re.search(rf"(?<![\w.]){re.escape(value)}(?!\w|\.\d)", text, re.IGNORECASE) is not None
@@ -0,0 +1,76 @@
+import re
+
+from pydantic import BaseModel, Field
+
+_DEPENDENCY_PATTERN = re.compile(r"\s*\[depends on:\s*([^\]]*)\]\s*$", re.IGNORECASE)
+
+
+# Words in the last steps of a free-text plan that ask for a chart
+_CHART_KEYWORDS = ["chart", "visualize", "plot", "draw"]
+
+
+class PlannedStep(BaseModel):
+    """One step of a structured plan."""
+
+    instruction: str = Field(..., description="A clear, concise instruction for the step.")
+    depends_on: list[int] = Field(
+        default_factory=list, description="Numbers (1-based) of the earlier steps whose results it needs."
+    )
+    sql: str | None = Field(
+        None, description="The SQL query that executes the step; null for synthesis or chart steps."
+    )
+
+
+class StructuredPlan(BaseModel):
+    """A plan with the SQL of every step and the chart intent, returned by a single LLM call."""
+
+    steps: list[PlannedStep] = Field(..., description="The steps of the plan, in order.")
+    chart_requested: bool = Field(..., description="Whether the user asked for a chart or visualization.")
+
+
+def parse_plan(response: str) -> tuple[list[str], list[list[int]]]:
+    """
+    Parses the planner's numbered list into steps and, for each step, the indices of the steps it
+    depends on. A step without a `[depends on: ...]` annotation depends on all steps before it.
+    """
+    plan: list[str] = []
+    dependencies: list[list[int]] = []
+    for line in response.split("\n"):
+        step = line.strip()
+        if not step or not step[0].isdigit():
+            continue
+        match = _DEPENDENCY_PATTERN.search(step)
+        if match:
+            step = step[: match.start()]
+            depends_on = sorted({int(n) - 1 for n in re.findall(r"\d+", match.group(1))})
+            depends_on = [i for i in depends_on if 0 <= i < len(plan)]
+        else:
+            depends_on = list(range(len(plan)))
+        plan.append(step)
+        dependencies.append(depends_on)
+    return plan, dependencies
+
+
+def ready_steps(dependencies: list[list[int]], completed: list[int]) -> list[int]:
+    """Returns the pending steps whose dependencies have all completed."""
+    done = set(completed)
+    return [
+        i
+        for i, depends_on in enumerate(dependencies)
+        if i not in done and all(dependency in done for dependency in depends_on)
+    ]
+
+
+def structured_plan_steps(structured: StructuredPlan) -> tuple[list[str], list[list[int]], list[str | None]]:
+    """Converts a structured plan into numbered steps, their dependencies and the SQL of every step."""
+    plan, dependencies, sql = [], [], []
+    for index, step in enumerate(structured.steps):
+        plan.append(f"{index + 1}. {step.instruction.strip()}")
+        dependencies.append(sorted({n - 1 for n in step.depends_on if 0 < n <= index}))
+        sql.append(step.sql.strip() if step.sql and step.sql.strip() else None)
+    return plan, dependencies, sql
+
+
+def chart_requested(plan: list[str]) -> bool:
+    """Whether the last steps of a free-text plan ask for a chart."""
+    return any(keyword in step.lower() for step in plan[-2:] for keyword in _CHART_KEYWORDS)
@@ -0,0 +1,74 @@
+import asyncio
+import os
+import sqlite3
+from collections.abc import Sequence
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from config import SESSION_DB_PATH
+
+# Application types stored in the state besides LangChain messages
+_STATE_TYPES = [("src.tools.chart_renderer", "Chart"), ("src.tools.chart_renderer", "ChartDetails")]
+
+
+class SqliteSessionSaver(SqliteSaver):
+    """
+    Checkpointer keeping the graph state of every chat session (thread) in a local SQLite file, so
+    sessions live on disk instead of in memory and survive a restart.
+
+    The async methods run the sync ones in worker threads (the connection is guarded by a lock), so the
+    same saver serves `invoke` and `astream`. `prune` drops all but the latest checkpoint of a session,
+    which is all the agent ever resumes from.
+    """
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        checkpoints = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for checkpoint in checkpoints:
+            yield checkpoint
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def prune(self, thread_ids: Sequence[str], *, strategy: str = "keep_latest") -> None:
+        if strategy == "delete":
+            for thread_id in thread_ids:
+                self.delete_thread(thread_id)
+            return
+        with self.cursor() as cur:
+            for thread_id in thread_ids:
+                cur.execute(
+                    """DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_id < (
+                        SELECT MAX(checkpoint_id) FROM checkpoints AS latest
+                        WHERE latest.thread_id = checkpoints.thread_id
+                        AND latest.checkpoint_ns = checkpoints.checkpoint_ns)""",
+                    (str(thread_id),),
+                )
+                cur.execute(
+                    """DELETE FROM writes WHERE thread_id = ? AND NOT EXISTS (
+                        SELECT 1 FROM checkpoints WHERE checkpoints.thread_id = writes.thread_id
+                        AND checkpoints.checkpoint_ns = writes.checkpoint_ns
+                        AND checkpoints.checkpoint_id = writes.checkpoint_id)""",
+                    (str(thread_id),),
+                )
+
+    async def aprune(self, thread_ids: Sequence[str], *, strategy: str = "keep_latest") -> None:
+        await asyncio.to_thread(self.prune, thread_ids, strategy=strategy)
+
+
+def create_checkpointer(path: str = SESSION_DB_PATH) -> SqliteSessionSaver:
+    """Opens the session store; the connection stays open for the lifetime of the process."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    connection = sqlite3.connect(path, check_same_thread=False)
+    return SqliteSessionSaver(connection, serde=JsonPlusSerializer(allowed_msgpack_modules=_STATE_TYPES))
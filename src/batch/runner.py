@@ -0,0 +1,196 @@
+"""
+Headless batch runner: answers the questions of a JSONL file through the agent graph, without the UI.
+
+Every input line holds a question and optionally an id, e.g. {"id": "revenue-2019", "question": "..."};
+questions without an id are numbered by line. Questions run concurrently (bounded by --concurrency) on
+one graph, so the SQL engine, rollups and all caches are shared by every question. For each question the
+output directory gets a folder with the answer, the SQL and result table of every step and the chart, and
+a line in `results.jsonl`. Questions already answered there are skipped, so an interrupted run resumes
+where it stopped. The agent's log goes to `agent.log`.
+
+    python -m src.batch.runner questions.jsonl --output reports/ --concurrency 8
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+from config import BATCH_CONCURRENCY, DATA_PATH, PLAN_LIBRARY_ENABLED
+from src.agent.frame_store import FRAME_STORE
+from src.agent.graph import build_agent_graph
+from src.agent.plan_library import PlanLibrary
+from src.data.catalog import DataCatalog
+from src.tools.sql_tool import SqlTool
+
+RESULTS_FILE = "results.jsonl"
+
+
+def read_questions(path: str) -> list[dict]:
+    """Reads the questions to answer, giving every question an id."""
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            questions.append(
+                {"id": str(item.get("id") or f"q{line_number:04d}"), "question": item["question"]}
+            )
+    return questions
+
+
+def answered_ids(output_dir: Path) -> set[str]:
+    """Ids of the questions answered successfully by earlier runs; the last record of a question counts."""
+    results_path = output_dir / RESULTS_FILE
+    if not results_path.exists():
+        return set()
+    status = {}
+    with open(results_path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                status[record["id"]] = record["status"]
+    return {question_id for question_id, question_status in status.items() if question_status == "ok"}
+
+
+async def run_batch(graph, questions: list[dict], output_dir: Path, concurrency: int, log=sys.stdout) -> dict:
+    """Answers the questions, at most `concurrency` at once. Returns the run's counts and throughput."""
+    slots = asyncio.Semaphore(concurrency)
+    counts = {"ok": 0, "error": 0, "failed": 0}
+    start = time.perf_counter()
+
+    async def answer(item: dict) -> None:
+        async with slots:
+            record = await answer_question(graph, item, output_dir)
+        # Appended as soon as the question is done, so an interrupted run loses nothing it finished
+        with open(output_dir / RESULTS_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        counts[record["status"]] += 1
+        done = sum(counts.values())
+        rate = done / (time.perf_counter() - start) * 60
+        print(
+            f"[{done}/{len(questions)}] {record['id']}: {record['status']} in {record['seconds']:.1f}s "
+            f"({rate:.1f} questions/min)",
+            file=log,
+            flush=True,
+        )
+
+    await asyncio.gather(*(answer(item) for item in questions))
+    elapsed = time.perf_counter() - start
+    return {
+        **counts,
+        "questions": len(questions),
+        "seconds": elapsed,
+        "questions_per_minute": len(questions) / elapsed * 60 if elapsed else 0.0,
+    }
+
+
+async def answer_question(graph, item: dict, output_dir: Path) -> dict:
+    """Runs one question through the graph and writes its outputs. Returns its `results.jsonl` record."""
+    record = {"id": item["id"], "question": item["question"]}
+    start = time.perf_counter()
+    try:
+        state = await graph.ainvoke({"question": item["question"], "chat_history": []})
+    except Exception as e:
+        return {**record, "status": "failed", "error": str(e), "seconds": time.perf_counter() - start}
+    question_dir = output_dir / _to_path_name(item["id"])
+    outputs = await asyncio.to_thread(write_outputs, state, question_dir)
+    return {
+        **record,
+        "status": "error" if state.get("error") else "ok",
+        "answer": state.get("final_answer"),
+        "error": state.get("error"),
+        **outputs,
+        "trace_id": state.get("trace_id"),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def write_outputs(state: dict, question_dir: Path) -> dict:
+    """Writes the answer, the result table of every step and the chart. Returns what was written."""
+    question_dir.mkdir(parents=True, exist_ok=True)
+    (question_dir / "answer.md").write_text(state.get("final_answer") or "", encoding="utf-8")
+    refs = state.get("step_frames") or {}
+    frames = FRAME_STORE.get_all(refs)
+    # The spilled step results are only needed until they are written out
+    FRAME_STORE.delete(refs.values())
+    step_sql = state.get("step_sql") or []
+    steps = []
+    for index, instruction in enumerate(state.get("plan") or []):
+        step = {
+            "step": index + 1,
+            "instruction": instruction,
+            "sql": step_sql[index] if index < len(step_sql) else None,
+        }
+        if index in frames:
+            table = f"step_{index + 1}.csv"
+            frames[index].to_csv(question_dir / table, index=False)
+            step.update(rows=len(frames[index]), table=str(Path(question_dir.name) / table))
+        steps.append(step)
+    chart_file = None
+    chart = state.get("chart")
+    if chart is not None:
+        chart_file = str(Path(question_dir.name) / f"chart.{chart.format}")
+        (question_dir / f"chart.{chart.format}").write_bytes(chart.data)
+    return {"steps": steps, "chart": chart_file}
+
+
+def _to_path_name(question_id: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", question_id).strip("._") or "question"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("questions", help="JSONL file with one question per line")
+    parser.add_argument("--output", default="batch_output", help="Directory for answers, tables and charts")
+    parser.add_argument(
+        "--concurrency", type=int, default=BATCH_CONCURRENCY, help="Questions answered at once"
+    )
+    parser.add_argument("--data", default=DATA_PATH, help="Data file or directory")
+    parser.add_argument("--verbose", action="store_true", help="Show the agent's log instead of agent.log")
+    args = parser.parse_args()
+
+    if not os.environ.get("OPENAI_API_KEY"):
+        print("ERROR: OPENAI_API_KEY environment variable not set.")
+        return
+
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    questions = read_questions(args.questions)
+    done = answered_ids(output_dir)
+    pending = [item for item in questions if item["id"] not in done]
+    skipped = len(questions) - len(pending)
+    print(f"{len(questions)} questions, {skipped} answered before, {len(pending)} to run.")
+
+    log = sys.stdout
+    with contextlib.ExitStack() as stack:
+        agent_log = sys.stdout
+        if not args.verbose:
+            agent_log = stack.enter_context(open(output_dir / "agent.log", "a", encoding="utf-8"))
+            stack.enter_context(contextlib.redirect_stdout(agent_log))
+        logging.basicConfig(level=logging.INFO, format="%(message)s", stream=agent_log)
+        catalog = DataCatalog()
+        if os.path.isdir(args.data):
+            catalog.register_directory(args.data)
+        else:
+            catalog.register_file(args.data)
+        plan_library = PlanLibrary(catalog) if PLAN_LIBRARY_ENABLED else None
+        graph = build_agent_graph(SqlTool(catalog), plan_library=plan_library)
+        summary = asyncio.run(run_batch(graph, pending, output_dir, args.concurrency, log))
+
+    print(
+        f"Answered {summary['questions']} questions in {summary['seconds']:.1f}s "
+        f"({summary['questions_per_minute']:.1f} questions/min): {summary['ok']} ok, "
+        f"{summary['error']} unable to answer, {summary['failed']} failed; rerun to retry those."
+    )
+
+
+if __name__ == "__main__":
+    main()
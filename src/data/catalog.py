@@ -0,0 +1,358 @@
+import contextlib
+import re
+import threading
+from collections import Counter, OrderedDict
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future
+from dataclasses import dataclass
+from pathlib import Path
+
+import pandas as pd
+
+from config import CATALOG_MEMORY_BUDGET_MB, PROFILE_TABLES
+
+from .dtypes import concat_compact
+from .handler import (
+    SUPPORTED_SUFFIXES,
+    get_schema_from_tables,
+    list_sheets,
+    load_data,
+    load_sample,
+    read_cached_profile,
+    write_cached_profile,
+)
+from .profile import profile_dataframe
+
+
+@dataclass
+class TableSource:
+    """Where a catalog table comes from and what its columns look like."""
+
+    name: str
+    path: str | None
+    sheet_name: str | None
+    sample: pd.DataFrame
+    profile: dict | None = None
+
+
+class DataCatalog:
+    """
+    Registry of queryable tables backed by files or in-memory DataFrames.
+
+    File-backed tables are loaded the first time they are requested and the least recently used ones are
+    evicted once the loaded tables exceed the memory budget. In-memory tables, and tables pinned by a query
+    that is running, are never evicted. Tables load outside the catalog lock, so queries on loaded tables
+    don't wait for a cold one; concurrent requests for the same table share a single load.
+    """
+
+    def __init__(self, memory_budget_mb: float = CATALOG_MEMORY_BUDGET_MB):
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self._sources: dict[str, TableSource] = {}
+        self._loaded: OrderedDict[str, pd.DataFrame] = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self._versions: dict[str, int] = {}
+        self._pins: Counter[str] = Counter()
+        self._loading: dict[str, Future] = {}
+        self._evict_listeners: list[Callable[[str], None]] = []
+        self._load_listeners: list[Callable[[str, pd.DataFrame], None]] = []
+        self._append_listeners: list[Callable[[str, pd.DataFrame], None]] = []
+        self._schema: str | None = None
+        self._lock = threading.RLock()
+
+    @property
+    def table_names(self) -> list[str]:
+        return list(self._sources)
+
+    def register_directory(self, directory: str) -> list[str]:
+        """Registers every supported file in the directory. Returns the new table names."""
+        names = []
+        for path in list_data_files(directory):
+            names.extend(self.register_file(str(path)))
+        return names
+
+    def register_file(self, file_path: str) -> list[str]:
+        """Registers a file, with one table per workbook sheet. Returns the new table names."""
+        names = []
+        for name, sheet_name in _file_tables(file_path):
+            self._register_sheet(name, file_path, sheet_name)
+            names.append(name)
+        return names
+
+    def refresh_file(self, file_path: str) -> list[str]:
+        """
+        Picks up changes to a registered file without a restart. New sheets become new tables. A loaded
+        table whose rows were only appended to is swapped for the reloaded data and its append listeners get
+        just the new rows, like with `append_rows`; any other change replaces its data. Tables not in memory
+        are reloaded on their next use. Returns the changed tables.
+        """
+        changed = []
+        for name, sheet_name in _file_tables(file_path):
+            with self._lock:
+                source = self._sources.get(name)
+                old = self._loaded.get(name)
+            if source is not None and source.path != file_path:
+                print(f"Warning: Table '{name}' of {file_path} is already registered from another source.")
+                continue
+            if source is None or old is None:
+                self._register_sheet(name, file_path, sheet_name)
+                changed.append(name)
+                continue
+
+            df = load_data(file_path, sheet_name)
+            profile = profile_dataframe(df) if PROFILE_TABLES else None
+            if profile is not None:
+                write_cached_profile(file_path, sheet_name, profile)
+            appended = len(df) >= len(old) and _same_rows(df.head(len(old)), old)
+            with self._lock:
+                # Unless the table changed meanwhile, the new data, column types and profile are swapped in
+                # together, so no query sees the new rows described by the old schema or vice versa
+                appended = appended and self._loaded.get(name) is old
+                if appended:
+                    source.sample = df.head(0)
+                    source.profile = profile
+                    self._schema = None
+                    if len(df) > len(old):
+                        # The loaded frame already holds the old rows; only the new ones go to the listeners
+                        print(f"Appending {len(df) - len(old)} new rows to table '{name}'.")
+                        self._append(name, df, df.iloc[len(old) :])
+                else:
+                    print(f"Replacing the data of table '{name}'.")
+                    self._set_source(TableSource(name, file_path, sheet_name, df.head(0), profile))
+                    self._store(name, df)
+            if not appended:
+                self._notify_load(name, df)
+            elif len(df) == len(old):
+                continue
+            changed.append(name)
+        return changed
+
+    def register_dataframe(self, table_name: str, df: pd.DataFrame) -> None:
+        """Registers an in-memory DataFrame as a table."""
+        with self._lock:
+            profile = profile_dataframe(df) if PROFILE_TABLES else None
+            self._set_source(TableSource(table_name, None, None, df.head(0), profile))
+            self._loaded[table_name] = df
+            self._sizes[table_name] = 0
+
+    def get(self, table_name: str) -> pd.DataFrame:
+        """Returns the table's data, loading it first if needed."""
+        with self._lock:
+            if table_name in self._loaded:
+                self._loaded.move_to_end(table_name)
+                return self._loaded[table_name]
+            loading = self._loading.get(table_name)
+            if loading is None:
+                source = self._sources[table_name]
+                self._loading[table_name] = future = Future()
+        if loading is not None:
+            # Another caller is loading the table already
+            return loading.result()
+
+        try:
+            df = self._load(table_name, source)
+        except BaseException as e:
+            with self._lock:
+                del self._loading[table_name]
+            future.set_exception(e)
+            raise
+        future.set_result(df)
+        return df
+
+    def _load(self, table_name: str, source: TableSource) -> pd.DataFrame:
+        """Loads and profiles a table without holding the catalog lock, then makes it the current copy."""
+        df = load_data(source.path, source.sheet_name)
+        profile = source.profile
+        if PROFILE_TABLES and profile is None:
+            profile = profile_dataframe(df)
+            write_cached_profile(source.path, source.sheet_name, profile)
+        with self._lock:
+            del self._loading[table_name]
+            # A table re-registered while it loaded keeps its new data; this caller still gets what it loaded
+            current = self._sources.get(table_name) is source
+            if current:
+                source.sample = df.head(0)
+                if source.profile is None and profile is not None:
+                    source.profile = profile
+                    self._schema = None
+                self._store(table_name, df)
+        if current:
+            self._notify_load(table_name, df)
+        return df
+
+    @contextlib.contextmanager
+    def pinned(self, table_names: Iterable[str]) -> Iterator[None]:
+        """
+        Keeps the tables from being evicted inside the block, so a query loading several tables (or running
+        while another session loads one) doesn't lose the ones it already got. Pins are counted, so
+        concurrent queries can pin the same table.
+        """
+        table_names = list(table_names)
+        with self._lock:
+            self._pins.update(table_names)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pins.subtract(table_names)
+                self._pins = +self._pins
+                # Tables kept over the budget while pinned are evicted once no query needs them
+                self._evict()
+
+    def append_rows(self, table_name: str, rows: pd.DataFrame) -> None:
+        """
+        Appends rows to a table. The table is swapped for the new DataFrame in one step, so queries that
+        already got the table keep a consistent snapshot. Append listeners receive only the new rows.
+        """
+        # Loaded outside the lock like any other use; pinned so that it stays loaded until it is replaced
+        with self.pinned([table_name]):
+            current = self.get(table_name)
+            with self._lock:
+                self._append(table_name, concat_compact(self._loaded.get(table_name, current), rows), rows)
+
+    def columns(self, table_name: str) -> list[str]:
+        """Returns the table's column names without loading it."""
+        return list(self._sources[table_name].sample.columns)
+
+    def source(self, table_name: str) -> TableSource:
+        """Returns where the table comes from and what its columns look like, without loading it."""
+        return self._sources[table_name]
+
+    def is_loaded(self, table_name: str) -> bool:
+        """Whether the table's data is in memory."""
+        return table_name in self._loaded
+
+    def text_values(self) -> set[str]:
+        """Returns the values of the low-cardinality text columns listed in the table profiles."""
+        with self._lock:
+            profiles = [source.profile for source in self._sources.values() if source.profile is not None]
+        return {
+            value
+            for profile in profiles
+            for stats in profile["columns"].values()
+            for value in stats.get("values", [])
+            if isinstance(value, str)
+        }
+
+    def table_version(self, table_name: str) -> int:
+        """Returns a counter that increases every time the table's data is replaced or appended to."""
+        return self._versions.get(table_name, 0)
+
+    def referenced_tables(self, query: str) -> list[str]:
+        """Returns the registered tables mentioned in a SQL query."""
+        tokens = {(quoted or bare).lower() for quoted, bare in re.findall(r'"([^"]+)"|(\w+)', query)}
+        return [name for name in self._sources if name.lower() in tokens]
+
+    def get_schema(self) -> str:
+        """Generates the combined schema and profile of all registered tables without loading them."""
+        with self._lock:
+            if self._schema is None:
+                self._schema = get_schema_from_tables(
+                    {name: source.sample for name, source in self._sources.items()},
+                    {
+                        name: source.profile
+                        for name, source in self._sources.items()
+                        if source.profile is not None
+                    },
+                )
+            return self._schema
+
+    def on_evict(self, listener: Callable[[str], None]) -> None:
+        """Calls `listener(table_name)` whenever a table is evicted from memory."""
+        self._evict_listeners.append(listener)
+
+    def on_load(self, listener: Callable[[str, pd.DataFrame], None]) -> None:
+        """Calls `listener(table_name, df)` whenever a file-backed table is loaded into memory."""
+        self._load_listeners.append(listener)
+
+    def on_append(self, listener: Callable[[str, pd.DataFrame], None]) -> None:
+        """Calls `listener(table_name, rows)` whenever rows are appended to a table."""
+        self._append_listeners.append(listener)
+
+    @property
+    def memory_usage(self) -> int:
+        """Bytes held by the currently loaded file-backed tables."""
+        return sum(self._sizes[name] for name in self._loaded)
+
+    def _register_sheet(self, name: str, file_path: str, sheet_name: str | None) -> None:
+        sample = load_sample(file_path, sheet_name)
+        profile = read_cached_profile(file_path, sheet_name) if PROFILE_TABLES else None
+        with self._lock:
+            self._set_source(TableSource(name, file_path, sheet_name, sample, profile))
+        # Tables without a cached profile are profiled on their first load, so registering loads nothing
+        print(f"Registered table '{name}' from {file_path}" + (f" [{sheet_name}]" if sheet_name else ""))
+
+    def _set_source(self, source: TableSource) -> None:
+        if source.name in self._sources:
+            # Re-registering replaces the data; drop the stale copy and invalidate dependent caches
+            self._loaded.pop(source.name, None)
+            self._versions[source.name] = self.table_version(source.name) + 1
+        self._sources[source.name] = source
+        self._schema = None
+
+    def _store(self, table_name: str, df: pd.DataFrame) -> None:
+        """Makes freshly loaded data the table's current copy. Load listeners are called separately."""
+        self._loaded[table_name] = df
+        self._sizes[table_name] = int(df.memory_usage(deep=True).sum())
+        self._evict(keep=table_name)
+
+    def _append(self, table_name: str, df: pd.DataFrame, rows: pd.DataFrame) -> None:
+        """Makes `df`, the table with `rows` appended, the table's current copy. Called with the lock held."""
+        self._loaded[table_name] = df
+        if self._sources[table_name].path is not None:
+            self._sizes[table_name] = int(df.memory_usage(deep=True).sum())
+        self._versions[table_name] = self.table_version(table_name) + 1
+        for listener in self._append_listeners:
+            listener(table_name, rows)
+
+    def _notify_load(self, table_name: str, df: pd.DataFrame) -> None:
+        """Calls the load listeners (rollup builds, ...), outside the lock: they can take a while."""
+        for listener in self._load_listeners:
+            listener(table_name, df)
+
+    def _evict(self, keep: str | None = None) -> None:
+        for name in list(self._loaded):
+            if self.memory_usage <= self.memory_budget:
+                break
+            if name == keep or name in self._pins or self._sources[name].path is None:
+                continue
+            print(f"Evicting table '{name}' from memory.")
+            del self._loaded[name]
+            for listener in self._evict_listeners:
+                listener(name)
+
+
+def list_data_files(path: str) -> list[Path]:
+    """The supported data files in a directory, or the file itself."""
+    path = Path(path)
+    if not path.is_dir():
+        return [path]
+    return [
+        file
+        for file in sorted(path.iterdir())
+        if file.is_file() and file.suffix.lower() in SUPPORTED_SUFFIXES and not file.name.startswith("~$")
+    ]
+
+
+def _same_rows(a: pd.DataFrame, b: pd.DataFrame) -> bool:
+    """Whether two DataFrames hold the same values, even if compacted to different types."""
+    if list(a.columns) != list(b.columns) or len(a) != len(b):
+        return False
+    for column in a.columns:
+        x, y = a[column].reset_index(drop=True), b[column].reset_index(drop=True)
+        if x.dtype != y.dtype:
+            # New values can widen a compact type (more categories, larger integers)
+            x, y = x.astype(object), y.astype(object)
+        if not x.equals(y):
+            return False
+    return True
+
+
+def _file_tables(file_path: str) -> list[tuple[str, str | None]]:
+    """Table name and sheet of every table in a file: one per workbook sheet."""
+    sheets = list_sheets(file_path)
+    stem = _to_identifier(Path(file_path).stem)
+    return [(stem if len(sheets) == 1 else f"{stem}_{_to_identifier(sheet)}", sheet) for sheet in sheets]
+
+
+def _to_identifier(name: str) -> str:
+    return re.sub(r"\W+", "_", name).strip("_") or "table"
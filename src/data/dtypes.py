@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+from config import CATEGORY_MAX_RATIO
+
+# Text format of datetimes in the SQL engines, the same pandasql (SQLAlchemy) stored, so query results
+# stay unchanged. Kept with the other type conversions so the data layer doesn't depend on the tools.
+SQLITE_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+# Changes whenever `compact_dtypes` converts columns differently, so caches of compacted data are rebuilt
+COMPACTION_VERSION = 2
+
+
+def compact_dtypes(df: pd.DataFrame, category_max_ratio: float = CATEGORY_MAX_RATIO) -> pd.DataFrame:
+    """
+    Converts columns to the smallest types that hold the same values: text columns with repeated values
+    to categoricals, integers to the narrowest integer type and floats to float32 where every value is
+    exactly representable. The SQL engines and rollups widen the numbers back before computing with them,
+    so query results don't change. Date text stays text: as datetimes the engines would return and compare
+    it in another format.
+    """
+    columns = {}
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_object_dtype(series):
+            compacted = _compact_text(series, category_max_ratio)
+        elif pd.api.types.is_integer_dtype(series) and not isinstance(series.dtype, pd.CategoricalDtype):
+            compacted = pd.to_numeric(series, downcast="integer")
+        elif pd.api.types.is_float_dtype(series) and series.dtype != "float32":
+            narrow = series.astype("float32")
+            exact = (narrow.to_numpy(dtype="float64") == series.to_numpy()) | series.isna().to_numpy()
+            compacted = narrow if exact.all() else series
+        else:
+            compacted = series
+        if compacted is not series:
+            columns[column] = compacted
+    return df.assign(**columns) if columns else df
+
+
+def concat_compact(df: pd.DataFrame, rows: pd.DataFrame) -> pd.DataFrame:
+    """Appends rows to a compacted DataFrame, keeping its categorical columns categorical."""
+    combined = pd.concat([df, rows], ignore_index=True)
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype) and column in rows.columns:
+            appended = rows[column].astype("category")
+            combined[column] = pd.api.types.union_categoricals(
+                [df[column], appended], ignore_order=True, sort_categories=True
+            )
+    return combined
+
+
+def sql_type(dtype) -> str:
+    """SQL type of a DataFrame column as shown in the schema."""
+    if isinstance(dtype, pd.CategoricalDtype):
+        dtype = dtype.categories.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return "BOOLEAN"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "INT"
+    if pd.api.types.is_float_dtype(dtype):
+        return "FLOAT"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "DATETIME"
+    return "TEXT"
+
+
+def _compact_text(series: pd.Series, category_max_ratio: float) -> pd.Series:
+    values = series.dropna()
+    if pd.api.types.infer_dtype(values, skipna=True) != "string":
+        # Mixed columns (e.g. numbers and text) are left as they are
+        return series
+    if values.nunique() <= max(1, len(series) * category_max_ratio):
+        categories = np.sort(values.unique())
+        return pd.Series(pd.Categorical(series, categories=categories), index=series.index, name=series.name)
+    return series
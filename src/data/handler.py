@@ -1,26 +1,249 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
 import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from config import CATEGORY_MAX_RATIO, COMPACT_DTYPES, DATA_CACHE_DIR
+
+from .dtypes import COMPACTION_VERSION, compact_dtypes, sql_type
+from .profile import PROFILE_VERSION, render_column_profile
+
+EXCEL_SUFFIXES = {".xlsx", ".xlsm", ".xls"}
+SUPPORTED_SUFFIXES = EXCEL_SUFFIXES | {".csv", ".parquet"}
+
+
+def load_data(file_path: str, sheet_name: str | None = None) -> pd.DataFrame:
+    """Load data from a file, reusing the columnar cache next to it when the file is unchanged."""
+    source = Path(file_path)
+    # Parquet is already columnar and memory-mappable, so it is read directly
+    if DATA_CACHE_DIR is None or source.suffix.lower() == ".parquet":
+        return _read_source(file_path, sheet_name)
+
+    cache_dir = source.parent / DATA_CACHE_DIR
+    cache_stem = f"{source.stem}.{sheet_name}" if sheet_name else source.stem
+    meta_path = _meta_path(source, sheet_name)
+    stat = source.stat()
+
+    meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+    # Caches written with other column types are rebuilt
+    if meta.get("compaction") != _compaction():
+        meta = {}
+    cache_path = cache_dir / meta["cache_file"] if "cache_file" in meta else None
+    if cache_path and cache_path.exists():
+        if (meta["mtime_ns"], meta["size"]) == (stat.st_mtime_ns, stat.st_size):
+            return _read_cache(cache_path)
+        # The file was touched; only re-parse it if the content actually changed
+        digest = _file_digest(source)
+        if meta["sha256"] == digest:
+            _write_meta(meta_path, stat, digest, cache_path.name)
+            return _read_cache(cache_path)
+    else:
+        digest = _file_digest(source)
+
+    df = _read_source(file_path, sheet_name)
+    new_cache_path = cache_dir / f"{cache_stem}.{digest[:16]}.feather"
+    try:
+        cache_dir.mkdir(exist_ok=True)
+        tmp_path = new_cache_path.with_suffix(".tmp")
+        # Uncompressed Arrow IPC, so the cache can be memory-mapped on the next load
+        feather.write_feather(df, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, new_cache_path)
+        _write_meta(meta_path, stat, digest, new_cache_path.name)
+        if cache_path and cache_path != new_cache_path and cache_path.exists():
+            cache_path.unlink()
+    except (OSError, pa.ArrowException) as e:
+        print(f"Warning: Could not cache '{file_path}'. Reason: {e}")
+    return df
+
+
+def load_sample(file_path: str, sheet_name: str | None = None, nrows: int = 100) -> pd.DataFrame:
+    """
+    Returns a DataFrame with the file's columns and types without loading all of it. Types come from the
+    cache when it is current, otherwise they are inferred from the first `nrows` rows.
+    """
+    source = Path(file_path)
+    if source.suffix.lower() == ".parquet":
+        return pq.read_schema(file_path).empty_table().to_pandas()
+
+    meta_path = _meta_path(source, sheet_name)
+    if DATA_CACHE_DIR is not None and meta_path.exists():
+        meta = json.loads(meta_path.read_text())
+        cache_path = meta_path.parent / meta["cache_file"]
+        stat = source.stat()
+        current = (meta["mtime_ns"], meta["size"]) == (stat.st_mtime_ns, stat.st_size)
+        if cache_path.exists() and current and meta.get("compaction") == _compaction():
+            return feather.read_table(cache_path, memory_map=True).schema.empty_table().to_pandas()
+
+    return _read_source(file_path, sheet_name, nrows=nrows)
+
+
+def read_cached_profile(file_path: str, sheet_name: str | None = None) -> dict | None:
+    """Returns the profile cached for the file; None if there is none, it is outdated or the file changed."""
+    if DATA_CACHE_DIR is None:
+        return None
+    profile_path = _profile_path(Path(file_path), sheet_name)
+    if not profile_path.exists():
+        return None
+    cached = json.loads(profile_path.read_text())
+    stat = Path(file_path).stat()
+    changed = (cached["mtime_ns"], cached["size"]) != (stat.st_mtime_ns, stat.st_size)
+    if changed or cached.get("version") != PROFILE_VERSION:
+        # Profiles of an older version may describe values in another format
+        return None
+    return cached["profile"]
+
+
+def write_cached_profile(file_path: str, sheet_name: str | None, profile: dict) -> None:
+    """Caches a table's profile next to its data, valid until the file changes."""
+    if DATA_CACHE_DIR is None:
+        return
+    source = Path(file_path)
+    stat = source.stat()
+    try:
+        (source.parent / DATA_CACHE_DIR).mkdir(exist_ok=True)
+        cached = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "version": PROFILE_VERSION,
+            "profile": profile,
+        }
+        _profile_path(source, sheet_name).write_text(json.dumps(cached))
+    except OSError as e:
+        print(f"Warning: Could not cache the profile of '{file_path}'. Reason: {e}")
+
+
+def read_cached_rollup(file_path: str, sheet_name: str | None = None) -> tuple[pd.DataFrame, dict] | None:
+    """Returns the rollup cached for the file and what it was written with; None if the file changed."""
+    if DATA_CACHE_DIR is None:
+        return None
+    rollup_path = _rollup_path(Path(file_path), sheet_name)
+    if not rollup_path.exists():
+        return None
+    table = feather.read_table(rollup_path)
+    meta = json.loads(table.schema.metadata[b"rollup"])
+    stat = Path(file_path).stat()
+    if (meta["mtime_ns"], meta["size"]) != (stat.st_mtime_ns, stat.st_size):
+        return None
+    return table.to_pandas(), meta
 
 
-def load_data(file_path: str) -> pd.DataFrame:
-    """Load data from a file."""
-    df = pd.read_excel(file_path)
+def write_cached_rollup(file_path: str, sheet_name: str | None, frame: pd.DataFrame, meta: dict) -> None:
+    """Caches a table's rollup next to its data with `meta`, valid until the file changes."""
+    if DATA_CACHE_DIR is None:
+        return
+    source = Path(file_path)
+    stat = source.stat()
+    rollup_path = _rollup_path(source, sheet_name)
+    try:
+        rollup_path.parent.mkdir(exist_ok=True)
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        meta = {**meta, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+        table = table.replace_schema_metadata({**table.schema.metadata, b"rollup": json.dumps(meta)})
+        tmp_path = rollup_path.with_suffix(".tmp")
+        feather.write_feather(table, tmp_path)
+        os.replace(tmp_path, rollup_path)
+    except (OSError, pa.ArrowException) as e:
+        print(f"Warning: Could not cache the rollup of '{file_path}'. Reason: {e}")
+
+
+def list_sheets(file_path: str) -> list[str | None]:
+    """Returns the sheet names of a workbook, or [None] for single-table formats."""
+    if Path(file_path).suffix.lower() in EXCEL_SUFFIXES:
+        with pd.ExcelFile(file_path) as workbook:
+            return list(workbook.sheet_names)
+    return [None]
+
+
+def _read_source(file_path: str, sheet_name: str | None = None, nrows: int | None = None) -> pd.DataFrame:
+    suffix = Path(file_path).suffix.lower()
+    if suffix == ".csv":
+        df = pd.read_csv(file_path, nrows=nrows)
+    elif suffix == ".parquet":
+        df = pd.read_parquet(file_path, memory_map=True)
+    else:
+        df = pd.read_excel(file_path, sheet_name=sheet_name or 0, nrows=nrows)
 
     # Rename the first column to 'ID'
     df.rename(columns={"Unnamed: 0": "ID"}, inplace=True)
 
+    if COMPACT_DTYPES:
+        # Done before the columnar cache is written, so cached loads get the compact types for free
+        df = compact_dtypes(df, CATEGORY_MAX_RATIO)
     return df
 
 
-def get_schema_from_dataframe(dataframe: pd.DataFrame, table_name: str) -> str:
-    """Generates a CREATE TABLE SQL statement from a pandas DataFrame."""
-    type_mapping = {
-        "int64": "INT",
-        "float64": "FLOAT",
-        "object": "TEXT",
-        "datetime64[ns]": "DATETIME",
+def _meta_path(source: Path, sheet_name: str | None) -> Path:
+    sheet_suffix = f".{sheet_name}" if sheet_name else ""
+    return source.parent / DATA_CACHE_DIR / f"{source.name}{sheet_suffix}.meta.json"
+
+
+def _profile_path(source: Path, sheet_name: str | None) -> Path:
+    sheet_suffix = f".{sheet_name}" if sheet_name else ""
+    return source.parent / DATA_CACHE_DIR / f"{source.name}{sheet_suffix}.profile.json"
+
+
+def _rollup_path(source: Path, sheet_name: str | None) -> Path:
+    sheet_suffix = f".{sheet_name}" if sheet_name else ""
+    return source.parent / DATA_CACHE_DIR / f"{source.name}{sheet_suffix}.rollup.feather"
+
+
+def _read_cache(cache_path: Path) -> pd.DataFrame:
+    print(f"Loading cached data from {cache_path}")
+    table = feather.read_table(cache_path, memory_map=True)
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def _file_digest(path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _write_meta(meta_path: Path, stat: os.stat_result, digest: str, cache_file: str) -> None:
+    meta = {
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha256": digest,
+        "cache_file": cache_file,
+        "compaction": _compaction(),
     }
+    meta_path.write_text(json.dumps(meta))
+
+
+def _compaction() -> dict:
+    """The settings that decide the column types of the cached data."""
+    if not COMPACT_DTYPES:
+        return {"compact_dtypes": False}
+    return {"compact_dtypes": True, "category_max_ratio": CATEGORY_MAX_RATIO, "version": COMPACTION_VERSION}
+
+
+def get_schema_from_dataframe(dataframe: pd.DataFrame, table_name: str, profile: dict | None = None) -> str:
+    """
+    Generates a CREATE TABLE SQL statement from a pandas DataFrame. With a profile, every column gets a
+    comment describing its values.
+    """
+    columns = [f'"{col_name}" {sql_type(dtype)}' for col_name, dtype in dataframe.dtypes.items()]
+    if profile is None:
+        return f"CREATE TABLE {table_name} ({', '.join(columns)})"
+
+    lines = []
+    for i, (col_name, column) in enumerate(zip(dataframe.columns, columns, strict=True)):
+        separator = "," if i < len(columns) - 1 else ""
+        stats = profile["columns"].get(str(col_name))
+        comment = f" -- {render_column_profile(stats)}" if stats else ""
+        lines.append(f"  {column}{separator}{comment}")
+    body = "\n".join(lines)
+    return f"CREATE TABLE {table_name} ( -- {profile['rows']:,} rows\n{body}\n)"
+
 
-    columns = [
-        f'"{col_name}" {type_mapping.get(str(dtype), "TEXT")}' for col_name, dtype in dataframe.dtypes.items()
-    ]
-    return f"CREATE TABLE {table_name} ({', '.join(columns)})"
+def get_schema_from_tables(tables: dict[str, pd.DataFrame], profiles: dict[str, dict] | None = None) -> str:
+    """Generates the combined CREATE TABLE statements for several tables."""
+    profiles = profiles or {}
+    return "\n".join(get_schema_from_dataframe(df, name, profiles.get(name)) for name, df in tables.items())
@@ -0,0 +1,93 @@
+import math
+from typing import Any
+
+import pandas as pd
+
+from config import PROFILE_MAX_VALUES
+
+from .dtypes import SQLITE_DATETIME_FORMAT
+
+# Longest value shown in a profile; longer text is cut
+MAX_VALUE_CHARS = 40
+
+# Example values shown for text columns with too many distinct values to list
+TEXT_EXAMPLES = 3
+
+# Version of the profile contents and of the column types it describes; cached profiles of another version
+# are recomputed
+PROFILE_VERSION = 3
+
+
+def profile_dataframe(df: pd.DataFrame, max_values: int = PROFILE_MAX_VALUES) -> dict[str, Any]:
+    """
+    Computes per-column statistics that tell the LLM how the values look: distinct count, null ratio,
+    min/max of numbers and dates, all values of low-cardinality columns and a few examples of other text.
+    The result only holds JSON types, so it can be cached next to the data.
+    """
+    distinct = df.nunique(dropna=True)
+    null_ratio = df.isna().mean() if len(df) else pd.Series(0.0, index=df.columns)
+    ranged = [
+        column
+        for column in df.columns
+        if (pd.api.types.is_numeric_dtype(df[column]) and not pd.api.types.is_bool_dtype(df[column]))
+        or pd.api.types.is_datetime64_any_dtype(df[column])
+    ]
+    minimums, maximums = df[ranged].min(), df[ranged].max()
+
+    columns = {}
+    for column in df.columns:
+        stats: dict[str, Any] = {
+            "distinct": int(distinct[column]),
+            "null_ratio": round(float(null_ratio[column]), 4),
+        }
+        if column in ranged and distinct[column]:
+            stats["min"], stats["max"] = _plain(minimums[column]), _plain(maximums[column])
+        if 0 < distinct[column] <= max_values:
+            # Numbers and dates in order, text by frequency
+            values = df[column].value_counts().index
+            stats["values"] = [_plain(value) for value in (sorted(values) if column in ranged else values)]
+        elif column not in ranged:
+            examples = df[column].dropna().head(1000).unique()[:TEXT_EXAMPLES]
+            stats["examples"] = [_plain(value) for value in examples]
+        columns[str(column)] = stats
+    return {"rows": len(df), "columns": columns}
+
+
+def render_column_profile(stats: dict[str, Any]) -> str:
+    """One-line summary of a column's profile, e.g. `3 distinct: 2018, 2019, 2020; 5% null`."""
+    if "values" in stats:
+        parts = [f"{stats['distinct']} distinct: " + ", ".join(_render(value) for value in stats["values"])]
+    elif "min" in stats:
+        parts = [f"{stats['distinct']} distinct, {_render(stats['min'])} to {_render(stats['max'])}"]
+    elif stats.get("examples"):
+        parts = [f"{stats['distinct']} distinct, e.g. " + ", ".join(_render(v) for v in stats["examples"])]
+    else:
+        parts = [f"{stats['distinct']} distinct"]
+    if stats["null_ratio"] == 1:
+        return "all null"
+    if stats["null_ratio"]:
+        ratio = stats["null_ratio"]
+        parts.append("<1% null" if ratio < 0.01 else ">99% null" if ratio > 0.99 else f"{ratio:.0%} null")
+    return "; ".join(parts)
+
+
+def _plain(value: Any) -> Any:
+    """Converts a pandas/NumPy scalar to a JSON type."""
+    if isinstance(value, pd.Timestamp):
+        # Same text as SQLite stores and compares dates as, and both engines return; a shorter form like
+        # '2020-01-01' wouldn't equal the stored '2020-01-01 00:00:00.000000'
+        return value.strftime(SQLITE_DATETIME_FORMAT)
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float):
+        return None if math.isnan(value) else round(value, 4)
+    if isinstance(value, int | bool | str):
+        return value
+    return str(value)
+
+
+def _render(value: Any) -> str:
+    if isinstance(value, str):
+        text = value if len(value) <= MAX_VALUE_CHARS else value[: MAX_VALUE_CHARS - 3] + "..."
+        return "'" + text.replace("'", "''") + "'"
+    return str(value)
@@ -0,0 +1,82 @@
+import os
+import threading
+from pathlib import Path
+
+from config import DATA_PATH, DATA_WATCH_INTERVAL_SECONDS
+
+from .catalog import DataCatalog, list_data_files
+
+
+class DataWatcher:
+    """
+    Polls the data path for new and changed files and brings the catalog up to date without a restart:
+    new files and sheets are registered, rows appended to a file are appended to its loaded tables, and
+    other changes replace the table's data. Table versions are bumped, so cached results are invalidated.
+
+    A changed file is only read once its size and modification time are the same on two checks in a row,
+    so that files still being written aren't loaded half-way.
+    """
+
+    def __init__(
+        self,
+        catalog: DataCatalog,
+        path: str = DATA_PATH,
+        interval_seconds: float = DATA_WATCH_INTERVAL_SECONDS,
+    ):
+        self.catalog = catalog
+        self.path = path
+        self.interval_seconds = interval_seconds
+        # Files as of the last refresh, and changed files waiting to be stable
+        self._seen = self._scan()
+        self._pending: dict[Path, tuple[int, int]] = {}
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Checks for changes every `interval_seconds` in a background thread."""
+        self._thread = threading.Thread(target=self._run, name="data-watcher", daemon=True)
+        self._thread.start()
+        print(f"Watching {self.path} for data changes every {self.interval_seconds}s")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def poll(self) -> list[str]:
+        """Checks for changes once and applies them. Returns the tables that changed."""
+        changed = []
+        for path, stat in self._scan().items():
+            if self._seen.get(path) == stat:
+                self._pending.pop(path, None)
+                continue
+            if self._pending.get(path) != stat:
+                self._pending[path] = stat
+                continue
+            try:
+                if path in self._seen:
+                    changed.extend(self.catalog.refresh_file(str(path)))
+                else:
+                    changed.extend(self.catalog.register_file(str(path)))
+            except Exception as e:
+                # The file is retried once it changes again
+                print(f"Warning: Could not refresh tables from '{path}'. Reason: {e}")
+            self._seen[path] = stat
+            del self._pending[path]
+        return changed
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            changed = self.poll()
+            if changed:
+                print(f"Data refreshed: {', '.join(changed)}")
+
+    def _scan(self) -> dict[Path, tuple[int, int]]:
+        files = {}
+        for path in list_data_files(self.path):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files[path] = (stat.st_mtime_ns, stat.st_size)
+        return files
@@ -0,0 +1,199 @@
+import threading
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (seconds) of the latency histogram buckets; spans range from sub-millisecond SQL to LLM calls
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key, strict=True)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        return super().render() + [f"{self.name}{self._labels(key)} {value}" for key, value in values.items()]
+
+
+class Gauge(_Metric):
+    """Current values, read from `collect()` whenever the metrics are scraped."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...],
+        collect: Callable[[], dict[tuple[str, ...], float]],
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def render(self) -> list[str]:
+        return super().render() + [
+            f"{self.name}{self._labels(key)} {value}" for key, value in self.collect().items()
+        ]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets, optionally split by labels."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DURATION_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        self._values: dict[tuple[str, ...], tuple[list[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = {
+                key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()
+            }
+        lines = super().render()
+        for key, (counts, total, count) in values.items():
+            for bound, bucket_count in zip(self.buckets, counts, strict=True):
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{self._labels(key, le)} {bucket_count}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{self._labels(key, le)} {count}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {total}")
+            lines.append(f"{self.name}_count{self._labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Set of metrics rendered together in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics.values() for line in metric.render()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+SPAN_DURATION = REGISTRY.register(
+    Histogram("sql_agent_span_duration_seconds", "Duration of traced operations.", ("kind", "name"))
+)
+SPAN_ERRORS = REGISTRY.register(
+    Counter("sql_agent_span_errors_total", "Traced operations that failed.", ("kind", "name"))
+)
+LLM_TOKENS = REGISTRY.register(
+    Counter("sql_agent_llm_tokens_total", "Tokens used by LLM calls.", ("model", "type"))
+)
+SQL_ROWS = REGISTRY.register(
+    Counter("sql_agent_sql_rows_total", "Rows scanned and returned by SQL queries.", ("kind",))
+)
+SQL_RETRIES = REGISTRY.register(
+    Counter("sql_agent_sql_retries_total", "SQL generation attempts repeated after a failed query.")
+)
+SQL_REPAIRS = REGISTRY.register(
+    Counter("sql_agent_sql_repairs_total", "SQL queries fixed locally before execution.")
+)
+ROLLUP_QUERIES = REGISTRY.register(
+    Counter(
+        "sql_agent_rollup_queries_total",
+        "Aggregate queries over tables with a rollup, answered from the rollup (hit) or not (miss).",
+        ("result",),
+    )
+)
+PLAN_LIBRARY_LOOKUPS = REGISTRY.register(
+    Counter(
+        "sql_agent_plan_library_lookups_total",
+        "Questions planned from the plan library by signature (hit) or similarity (similar), or not (miss).",
+        ("result",),
+    )
+)
+CHART_SELECTIONS = REGISTRY.register(
+    Counter("sql_agent_chart_selections_total", "Charts chosen, by heuristic or by the LLM.", ("path",))
+)
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer | None:
+    """
+    Serves the registry at http://host:port/metrics from a background thread. Returns None if the port can't
+    be bound (e.g. another instance holds it); metrics are optional, so the app runs on without them.
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = REGISTRY.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        print(f"Warning: Could not serve metrics on {host}:{port}, continuing without them. Reason: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"Serving metrics at http://{host}:{port}/metrics")
+    return server
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
@@ -0,0 +1,227 @@
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from config import TRACE_FILE, TRACE_FILE_BACKUPS, TRACE_FILE_MAX_MB
+
+from .metrics import LLM_TOKENS, SPAN_DURATION, SPAN_ERRORS
+
+
+@dataclass
+class Span:
+    """One timed operation. Spans of the same question share a trace id and nest through `parent_id`."""
+
+    name: str
+    kind: str
+    trace_id: str
+    parent_id: str | None
+    span_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    start: float = field(default_factory=time.time)
+    duration: float = 0.0
+    status: str = "ok"
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def fail(self, error: str) -> None:
+        """Marks the span as failed, for operations that report errors without raising."""
+        self.status = "error"
+        self.attributes["error"] = error
+
+
+class TraceWriter:
+    """
+    Appends finished spans to a JSONL file, one object per line. Beyond `max_mb` the file is rotated to
+    `<path>.1`, shifting older rotations up to `backups`; the oldest is deleted.
+    """
+
+    def __init__(
+        self,
+        path: str | None = TRACE_FILE,
+        max_mb: float = TRACE_FILE_MAX_MB,
+        backups: int = TRACE_FILE_BACKUPS,
+    ):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.backups = backups
+        self._lock = threading.Lock()
+        self._file = None
+        self._size = 0
+
+    def write(self, span: Span) -> None:
+        if self.path is None:
+            return
+        line = json.dumps(span.__dict__, default=str) + "\n"
+        with self._lock:
+            if self._file is not None and self._size + len(line) > self.max_bytes:
+                self._rotate()
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, "a", buffering=1, encoding="utf-8")
+                self._size = self._file.tell()
+            self._file.write(line)
+            self._size += len(line)
+
+    def _rotate(self) -> None:
+        self._file.close()
+        self._file = None
+        if self.backups < 1:
+            os.remove(self.path)
+            return
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+
+TRACE_WRITER = TraceWriter()
+
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, kind: str, trace_id: str | None = None, **attributes: Any):
+    """
+    Times the enclosed block as a span, child of the current span unless a `trace_id` is given. The span is
+    exported to the trace file and the duration histogram when the block ends, also on errors.
+    """
+    parent = _current_span.get()
+    if trace_id is None:
+        trace_id = parent.trace_id if parent else new_trace_id()
+    parent_id = parent.span_id if parent and parent.trace_id == trace_id else None
+    current = Span(name, kind, trace_id, parent_id, attributes=attributes)
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except Exception as e:
+        current.fail(str(e))
+        raise
+    finally:
+        _current_span.reset(token)
+        _finish(current, time.perf_counter() - start)
+
+
+def traced_node(name: str, new_trace: bool = False):
+    """
+    Runs a graph node (sync or async) inside a span of the question's trace. The node that starts a question
+    (`new_trace`) opens a new trace and stores its id in the state for the nodes after it.
+    """
+
+    def decorator(func):
+        def trace_id_for(state) -> str:
+            return new_trace_id() if new_trace else state.get("trace_id") or new_trace_id()
+
+        def with_trace_id(update: dict, trace_id: str) -> dict:
+            return {**update, "trace_id": trace_id} if new_trace else update
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(self, state, *args, **kwargs):
+                trace_id = trace_id_for(state)
+                with span(name, "node", trace_id=trace_id):
+                    return with_trace_id(await func(self, state, *args, **kwargs), trace_id)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(self, state, *args, **kwargs):
+            trace_id = trace_id_for(state)
+            with span(name, "node", trace_id=trace_id):
+                return with_trace_id(func(self, state, *args, **kwargs), trace_id)
+
+        return wrapper
+
+    return decorator
+
+
+class LLMTracingHandler(BaseCallbackHandler):
+    """Records a span with latency and token usage for every chat model call."""
+
+    # Called in the caller's context, so the span is attached to the node or step that made the call
+    run_inline = True
+
+    def __init__(self):
+        self._runs: dict[uuid.UUID, tuple[Span, float]] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        parent = _current_span.get()
+        model = (metadata or {}).get("ls_model_name") or (serialized or {}).get("name", "")
+        llm_span = Span(
+            "llm.call",
+            "llm",
+            parent.trace_id if parent else new_trace_id(),
+            parent.span_id if parent else None,
+            attributes={
+                "model": model,
+                "tags": [tag for tag in kwargs.get("tags") or [] if not tag.startswith("seq:")],
+            },
+        )
+        self._runs[run_id] = (llm_span, time.perf_counter())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        if run_id not in self._runs:
+            return
+        llm_span, start = self._runs.pop(run_id)
+        usage = _token_usage(response)
+        llm_span.set(**usage)
+        if not usage["cached"]:
+            model = llm_span.attributes["model"]
+            LLM_TOKENS.inc(usage["prompt_tokens"], model=model, type="prompt")
+            LLM_TOKENS.inc(usage["completion_tokens"], model=model, type="completion")
+        _finish(llm_span, time.perf_counter() - start)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        if run_id not in self._runs:
+            return
+        llm_span, start = self._runs.pop(run_id)
+        llm_span.fail(str(error))
+        _finish(llm_span, time.perf_counter() - start)
+
+
+LLM_TRACING_HANDLER = LLMTracingHandler()
+
+
+def _token_usage(response) -> dict[str, int | bool]:
+    prompt = completion = 0
+    cached = False
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            prompt += usage.get("input_tokens", 0)
+            completion += usage.get("output_tokens", 0)
+            # LangChain zeroes the cost of responses served from the LLM cache
+            cached = cached or usage.get("total_cost") == 0
+    if not prompt and not completion:
+        # Some integrations only report usage in the provider's `llm_output`
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt, completion = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "cached": cached}
+
+
+def _finish(finished: Span, duration: float) -> None:
+    finished.duration = duration
+    SPAN_DURATION.observe(duration, kind=finished.kind, name=finished.name)
+    if finished.status == "error":
+        SPAN_ERRORS.inc(kind=finished.kind, name=finished.name)
+    TRACE_WRITER.write(finished)
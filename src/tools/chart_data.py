@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+
+from config import CHART_MAX_CATEGORIES, CHART_MAX_LINE_POINTS, CHART_MAX_SCATTER_POINTS
+
+OTHER_LABEL = "Other"
+
+
+def prepare_chart_data(
+    df: pd.DataFrame,
+    chart_type: str,
+    x_column: str,
+    y_column: str,
+    max_line_points: int = CHART_MAX_LINE_POINTS,
+    max_scatter_points: int = CHART_MAX_SCATTER_POINTS,
+    max_categories: int = CHART_MAX_CATEGORIES,
+) -> tuple[pd.DataFrame, str]:
+    """
+    Reduces the data to what the chart can show, so the render time is bounded by the limits instead of the
+    row count. Returns the data and how to draw it: the chart type, or "hexbin" for scatters too dense to
+    draw point by point.
+    """
+    data = df[list(dict.fromkeys([x_column, y_column]))].dropna()
+    if chart_type == "line":
+        return _downsample_line(data, x_column, y_column, max_line_points), chart_type
+    if chart_type == "scatter":
+        if len(data) <= max_scatter_points:
+            return data, chart_type
+        if _is_number(data[x_column]) and _is_number(data[y_column]):
+            return data, "hexbin"
+        return data.sample(n=max_scatter_points, random_state=0), chart_type
+    if chart_type == "bar":
+        # The mean per category is what the bar chart shows, so rows are aggregated before it is drawn
+        return _top_categories(data, x_column, y_column, "mean", max_categories), chart_type
+    if chart_type == "pie":
+        return _top_categories(data, x_column, y_column, "sum", max_categories), chart_type
+    return data, chart_type
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling of a series sorted by `x`. Returns the indices of the
+    `threshold` points kept: the first and last points, and in every bucket in between the point forming
+    the largest triangle with the previously kept point and the average of the next bucket.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    every = (n - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        next_start, next_end = end, min(int((i + 2) * every) + 1, n)
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(areas.argmax())
+        indices[i + 1] = a
+    return indices
+
+
+def _downsample_line(data: pd.DataFrame, x_column: str, y_column: str, max_points: int) -> pd.DataFrame:
+    if not _is_number(data[y_column]) or x_column == y_column:
+        return data.head(max_points)
+    x = data[x_column]
+    sortable = _is_number(x) or pd.api.types.is_datetime64_any_dtype(x)
+    # The line goes through the mean of repeated x values, as drawn without confidence intervals
+    data = data.groupby(x_column, sort=sortable, as_index=False)[y_column].mean()
+    if len(data) <= max_points:
+        return data
+    if not sortable:
+        positions = np.arange(len(data), dtype="float64")
+    elif _is_number(x):
+        positions = data[x_column].to_numpy(dtype="float64")
+    else:
+        positions = data[x_column].astype("int64").to_numpy(dtype="float64")
+    keep = lttb(positions, data[y_column].to_numpy(dtype="float64"), max_points)
+    return data.iloc[keep]
+
+
+def _top_categories(
+    data: pd.DataFrame, x_column: str, y_column: str, how: str, max_categories: int
+) -> pd.DataFrame:
+    if not _is_number(data[y_column]) or x_column == y_column:
+        return data.head(max_categories)
+    values = data.groupby(x_column, sort=False)[y_column].agg(how)
+    if len(values) > max_categories:
+        # The largest categories are kept, the rows of the rest are aggregated into one "Other" category
+        top = values.abs().nlargest(max_categories - 1).index
+        rest = data.loc[~data[x_column].isin(top), y_column].agg(how)
+        values = values[top]
+        values.index = values.index.astype(str)
+        values[OTHER_LABEL] = rest
+    return values.rename_axis(x_column).reset_index()
+
+
+def _is_number(series: pd.Series) -> bool:
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
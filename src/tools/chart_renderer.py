@@ -0,0 +1,212 @@
+import asyncio
+import base64
+import functools
+import io
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+
+import pandas as pd
+from pydantic import BaseModel, Field
+
+from config import CHART_CACHE_MAX_ENTRIES, CHART_FORMAT, CHART_MAX_CATEGORIES, CHART_WORKERS
+
+from .chart_data import prepare_chart_data
+from .result_cache import frame_digest
+
+MIME_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+class ChartDetails(BaseModel):
+    """Details for generating a chart."""
+
+    chart_type: str = Field(
+        ..., description="The type of chart to generate: 'bar', 'line', 'pie', 'scatter'."
+    )
+    x_column: str = Field(..., description="The column to use for the x-axis.")
+    y_column: str = Field(..., description="The column to use for the y-axis.")
+    title: str = Field(..., description="A descriptive title for the chart.")
+
+
+@dataclass(frozen=True)
+class Chart:
+    """A rendered chart image."""
+
+    data: bytes
+    format: str
+    details: ChartDetails
+
+    def data_uri(self) -> str:
+        return f"data:{MIME_TYPES[self.format]};base64,{base64.b64encode(self.data).decode()}"
+
+
+def render_chart(df: pd.DataFrame, details: ChartDetails, image_format: str) -> bytes:
+    """
+    Draws the chart on its own Figure and returns the encoded image. Uses no pyplot state, so it is safe to
+    run in any thread or process.
+    """
+    # Imported here so that only the render processes pay for loading the plotting stack
+    import seaborn as sns
+    from matplotlib.figure import Figure
+    from matplotlib.ticker import MaxNLocator
+
+    x, y = details.x_column, details.y_column
+    data, kind = prepare_chart_data(df, details.chart_type, x, y)
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    # Confidence intervals are bootstrapped from every row, which dominates the render time of large inputs
+    if kind == "bar":
+        sns.barplot(data=data, x=x, y=y, errorbar=None, ax=ax)
+    elif kind == "line":
+        sns.lineplot(data=data, x=x, y=y, errorbar=None, ax=ax)
+    elif kind == "pie":
+        ax.pie(data[y], labels=data[x], autopct="%1.1f%%", startangle=90)
+    elif kind == "scatter":
+        sns.scatterplot(data=data, x=x, y=y, ax=ax)
+    elif kind == "hexbin":
+        bins = ax.hexbin(data[x], data[y], gridsize=50, mincnt=1, cmap="viridis")
+        fig.colorbar(bins, ax=ax, label="count")
+        ax.set_xlabel(x)
+        ax.set_ylabel(y)
+    else:
+        raise ValueError(f"Unsupported chart type '{details.chart_type}' selected by LLM.")
+
+    many_categories = not _is_continuous(data[x]) and data[x].nunique() > CHART_MAX_CATEGORIES
+    if kind in ("line", "scatter") and many_categories:
+        # Drawing a tick label per category is slow and unreadable; only some of them are labeled
+        ax.xaxis.set_major_locator(MaxNLocator(CHART_MAX_CATEGORIES, integer=True))
+
+    ax.set_title(details.title)
+    ax.tick_params(axis="x", labelrotation=45)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment("right")
+    fig.tight_layout()
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def _is_continuous(series: pd.Series) -> bool:
+    return pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series)
+
+
+def _warm_up() -> None:
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import seaborn  # noqa: F401
+
+
+class ChartRenderer:
+    """
+    Renders charts in a pool of worker processes, off the request path and in parallel with the LLM.
+
+    Rendered images are cached by the content of the data and the chart details, so the same chart is
+    never drawn twice. A pool broken by a dying worker is replaced and the chart retried once.
+    """
+
+    def __init__(
+        self,
+        workers: int = CHART_WORKERS,
+        image_format: str = CHART_FORMAT,
+        max_entries: int = CHART_CACHE_MAX_ENTRIES,
+    ):
+        if image_format not in MIME_TYPES:
+            raise ValueError(f"Unsupported chart format '{image_format}'. Use one of {list(MIME_TYPES)}.")
+        self.image_format = image_format
+        self.max_entries = max_entries
+        self.workers = workers
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict[tuple, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = self._start_pool()
+
+    def render(self, df: pd.DataFrame, details: ChartDetails) -> Chart:
+        df = _charted_columns(df, details)
+        key, cached = self._lookup(df, details)
+        if cached is not None:
+            return Chart(cached, self.image_format, details)
+        pool = self._pool
+        try:
+            data = pool.submit(render_chart, df, details, self.image_format).result()
+        except BrokenProcessPool:
+            data = self._replace_pool(pool).submit(render_chart, df, details, self.image_format).result()
+        return self._store(key, data, details)
+
+    async def arender(self, df: pd.DataFrame, details: ChartDetails) -> Chart:
+        df = _charted_columns(df, details)
+        key, cached = self._lookup(df, details)
+        if cached is not None:
+            return Chart(cached, self.image_format, details)
+        pool = self._pool
+        try:
+            future: Future = pool.submit(render_chart, df, details, self.image_format)
+            data = await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            future = self._replace_pool(pool).submit(render_chart, df, details, self.image_format)
+            data = await asyncio.wrap_future(future)
+        return self._store(key, data, details)
+
+    def stats(self) -> dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._cache),
+        }
+
+    def _start_pool(self) -> ProcessPoolExecutor:
+        # Spawned workers don't inherit the parent's threads and locks; the warm-up loads the plotting
+        # stack in the background, so the first chart doesn't wait for it
+        pool = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=_warm_up
+        )
+        pool.submit(_warm_up)
+        return pool
+
+    def _replace_pool(self, broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        """
+        Replaces a pool after one of its workers died (e.g. killed by the OS), which leaves it unusable for
+        good. Concurrent callers that hit the same broken pool share one replacement.
+        """
+        with self._lock:
+            if self._pool is broken:
+                print("Warning: A chart worker died; restarting the chart worker pool.")
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._pool = self._start_pool()
+            return self._pool
+
+    def _lookup(self, df: pd.DataFrame, details: ChartDetails) -> tuple[tuple, bytes | None]:
+        key = (frame_digest(df), details.model_dump_json(), self.image_format)
+        with self._lock:
+            data = self._cache.get(key)
+            if data is None:
+                self.misses += 1
+            else:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            return key, data
+
+    def _store(self, key: tuple, data: bytes, details: ChartDetails) -> Chart:
+        with self._lock:
+            self._cache[key] = data
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return Chart(data, self.image_format, details)
+
+
+def _charted_columns(df: pd.DataFrame, details: ChartDetails) -> pd.DataFrame:
+    """Only the charted columns are hashed and sent to the render processes."""
+    return df[list(dict.fromkeys([details.x_column, details.y_column]))]
+
+
+@functools.cache
+def default_renderer() -> ChartRenderer:
+    """The renderer shared by all agents of the process, so the worker pool is only started once."""
+    return ChartRenderer()
@@ -0,0 +1,87 @@
+import re
+
+import pandas as pd
+
+from config import CHART_MAX_CATEGORIES
+
+from .chart_renderer import ChartDetails
+
+# Words in a question that ask for a specific chart type
+CHART_TYPE_KEYWORDS = {
+    "line": ("line", "trend", "over time"),
+    "bar": ("bar", "column chart", "histogram"),
+    "pie": ("pie", "share", "proportion", "breakdown"),
+    "scatter": ("scatter", "correlation", "relationship"),
+}
+
+# Names of integer columns holding periods rather than measures
+_PERIOD_NAME_PATTERN = re.compile(r"year|month|period|quarter|week|day|date", re.IGNORECASE)
+_ISO_DATE_PATTERN = r"\d{4}-\d{2}(-\d{2})?([ T].*)?"
+
+
+def heuristic_chart_details(df: pd.DataFrame, question: str) -> ChartDetails | None:
+    """
+    Picks the chart from the column types and cardinalities, without an LLM call:
+
+    - a date or period column and a measure: line chart
+    - a categorical column with few values and a measure: bar chart (pie if the question asks for shares)
+    - two measures: scatter plot
+
+    A chart type named in the question takes precedence. Returns None if the choice is ambiguous.
+    """
+    temporal, categorical, measures = [], [], []
+    for column in df.columns:
+        series = df[column]
+        if _is_temporal(column, series):
+            temporal.append(column)
+        elif pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            measures.append(column)
+        else:
+            categorical.append(column)
+
+    if len(temporal) == 1 and not categorical:
+        x_column, chart_type = temporal[0], "line"
+    elif len(categorical) == 1 and not temporal and df[categorical[0]].nunique() <= CHART_MAX_CATEGORIES:
+        x_column, chart_type = categorical[0], "bar"
+    elif not temporal and not categorical and len(measures) == 2:
+        x_column, chart_type = measures[0], "scatter"
+        measures = measures[1:]
+    else:
+        return None
+
+    y_column = _mentioned_column(measures, question)
+    if y_column is None:
+        return None
+    chart_type = _requested_chart_type(question) or chart_type
+    return ChartDetails(
+        chart_type=chart_type, x_column=x_column, y_column=y_column, title=f"{y_column} by {x_column}"
+    )
+
+
+def _is_temporal(column: str, series: pd.Series) -> bool:
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return True
+    if pd.api.types.is_integer_dtype(series):
+        return bool(_PERIOD_NAME_PATTERN.search(str(column)))
+    if pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+        values = series.dropna().astype(str)
+        return not values.empty and bool(values.str.fullmatch(_ISO_DATE_PATTERN).all())
+    return False
+
+
+def _mentioned_column(measures: list[str], question: str) -> str | None:
+    """The only measure, or the only one named in the question."""
+    if len(measures) == 1:
+        return measures[0]
+    mentioned = [column for column in measures if str(column).lower() in question.lower()]
+    return mentioned[0] if len(mentioned) == 1 else None
+
+
+def _requested_chart_type(question: str) -> str | None:
+    question = question.lower()
+    requested = [
+        chart_type
+        for chart_type, keywords in CHART_TYPE_KEYWORDS.items()
+        if any(re.search(rf"\b{keyword}s?\b", question) for keyword in keywords)
+    ]
+    return requested[0] if len(requested) == 1 else None
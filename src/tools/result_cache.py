@@ -0,0 +1,82 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+
+import pandas as pd
+
+from config import RESULT_CACHE_MAX_MB
+
+# String literals and quoted identifiers are kept verbatim; everything else is case- and space-insensitive
+_SQL_TOKEN_PATTERN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\s+|[^'\"\s]+")
+
+
+def normalize_sql(query: str) -> str:
+    """Normalizes whitespace, keyword/identifier case and trailing semicolons of a SQL query."""
+    parts = []
+    for token in _SQL_TOKEN_PATTERN.findall(query.strip().rstrip(";").strip()):
+        if token.isspace():
+            parts.append(" ")
+        elif token[0] in "'\"":
+            parts.append(token)
+        else:
+            parts.append(token.lower())
+    return "".join(parts)
+
+
+def frame_digest(df: pd.DataFrame) -> str:
+    """Content hash of a DataFrame's values and column names."""
+    content = pd.util.hash_pandas_object(df, index=False).values.tobytes()
+    return hashlib.sha256(content + repr(list(df.columns)).encode()).hexdigest()
+
+
+class QueryResultCache:
+    """LRU cache of query results, bounded by the memory used by the cached DataFrames."""
+
+    def __init__(self, max_mb: float = RESULT_CACHE_MAX_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[pd.DataFrame, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> pd.DataFrame | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0].copy()
+
+    def put(self, key: Hashable, df: pd.DataFrame) -> None:
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (df.copy(), size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, float]:
+        """Returns the hit rate and the memory held by cached results."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
@@ -0,0 +1,438 @@
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import sqlglot
+from sqlglot import exp
+
+from config import ROLLUPS
+from src.data.catalog import DataCatalog
+from src.data.handler import read_cached_rollup, write_cached_rollup
+from src.observability.metrics import ROLLUP_QUERIES
+
+from .sql_engines import SQLGLOT_DIALECTS, alias_projections
+
+# Row count of each group; every measure has "<measure>__sum", "__count", "__min" and "__max" columns
+ROWS_COLUMN = "__rows"
+
+# Most decimal places of a float measure whose SUM and AVG are answered from the rollup
+MAX_DECIMAL_SCALE = 6
+
+# Changes whenever the layout of the rollup frames changes, so older cached rollups are rebuilt
+ROLLUP_VERSION = 1
+
+
+@dataclass
+class Rollup:
+    """
+    Pre-aggregated copy of a table at the grain of its dimension columns. Float measures have their decimal
+    places in `scales` (None if they have too many) and their sums in integer units of that scale, e.g.
+    cents, so the sums are exact.
+    """
+
+    name: str
+    table: str
+    dimensions: list[str]
+    measures: list[str]
+    scales: dict[str, int | None]
+    frame: pd.DataFrame
+    version: int
+
+
+@dataclass
+class RollupRewrite:
+    """An aggregate query rewritten to read a rollup, and the same query for the base table."""
+
+    query: str
+    base_query: str
+    rollup: Rollup
+
+
+class Rollups:
+    """
+    Pre-aggregated rollups of catalog tables over configured dimension and measure columns (`ROLLUPS`),
+    and the rewrite of aggregate queries to read them instead of the base table.
+
+    A rollup holds the sum, count, min and max of every measure and the row count per combination of
+    dimension values, so any SUM/COUNT/MIN/MAX/AVG query that groups and filters by dimensions only can be
+    answered by re-aggregating it: orders of magnitude fewer rows than the base table. Rollups are built
+    when their table is loaded, merged incrementally when rows are appended, and rebuilt when the table is
+    replaced. Rollups of file-backed tables are cached next to the file, so a query answered from the rollup
+    doesn't load the table, not even after a restart.
+
+    Floating-point sums depend on the order of the additions, so a rollup could only match a table scan
+    approximately. SUM and AVG of float measures are therefore rounded to the measure's decimal places, in
+    the rollup query and in the query on the base table alike: both give the exact total.
+    """
+
+    def __init__(self, catalog: DataCatalog, specs: dict[str, dict[str, list[str]]] = ROLLUPS):
+        self.catalog = catalog
+        self.specs = specs
+        self.hits = 0
+        self.misses = 0
+        self._rollups: dict[str, Rollup] = {}
+        self._lock = threading.Lock()
+        catalog.on_load(self._on_load)
+        catalog.on_append(self._on_append)
+
+    def rewrite(self, query: str, dialect: str) -> RollupRewrite | None:
+        """
+        Rewrites an aggregate query over a table with a rollup to read the rollup instead. Returns the new
+        query, the query to run on the base table instead (with the same rounding) and the rollup it reads,
+        or None if the query can't be answered from a rollup. Computed columns keep the names they have in
+        the original query.
+        """
+        query = alias_projections(query, dialect)
+        dialect = SQLGLOT_DIALECTS.get(dialect)
+        try:
+            tree = sqlglot.parse_one(query, read=dialect)
+        except sqlglot.errors.SqlglotError:
+            return None
+        table = _single_table(tree)
+        spec = self._spec(table.name) if table is not None else None
+        # Decided from the query and the table's columns only, so other queries never load the table
+        if spec is None or not _answerable(tree, spec["dimensions"], spec["measures"]):
+            if spec is not None:
+                self._count(hit=False)
+            return None
+
+        rollup = self.get(table.name)
+        if any(_reaggregate(aggregate, rollup) is None for aggregate in tree.find_all(exp.AggFunc)):
+            # SUM or AVG of a float measure without a decimal scale
+            self._count(hit=False)
+            return None
+        base = _round_measures(tree.copy(), rollup)
+        rewritten = _rewrite(tree, rollup)
+        table.set("this", exp.to_identifier(rollup.name, quoted=True))
+        if not table.alias:
+            # Columns qualified with the table name keep resolving
+            table.set("alias", exp.TableAlias(this=exp.to_identifier(rollup.table, quoted=True)))
+        self._count(hit=True)
+        return RollupRewrite(rewritten.sql(dialect=dialect), base.sql(dialect=dialect), rollup)
+
+    def get(self, table_name: str) -> Rollup:
+        """
+        Returns the table's current rollup: the one in memory, the one cached next to the table's file if
+        the table isn't loaded, or else one built from the table.
+        """
+        rollup = self._current(table_name)
+        if rollup is None and not self.catalog.is_loaded(table_name):
+            rollup = self._read_cache(table_name)
+        if rollup is None:
+            df = self.catalog.get(table_name)
+            # Loading the table may have built the rollup already
+            rollup = self._current(table_name) or self._build(table_name, df)
+        return rollup
+
+    def stats(self) -> dict[str, float]:
+        queries = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / queries if queries else 0.0,
+            "rows": {rollup.table: len(rollup.frame) for rollup in self._rollups.values()},
+        }
+
+    def _spec(self, table_name: str) -> dict[str, list[str]] | None:
+        """The table's rollup configuration, if it has one and the table has all its columns."""
+        spec = self.specs.get(table_name)
+        if spec is None or table_name not in self.catalog.table_names:
+            return None
+        columns = set(self.catalog.columns(table_name))
+        return spec if columns.issuperset(spec["dimensions"] + spec["measures"]) else None
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        ROLLUP_QUERIES.inc(result="hit" if hit else "miss")
+
+    def _current(self, table_name: str) -> Rollup | None:
+        with self._lock:
+            rollup = self._rollups.get(table_name)
+        if rollup is not None and rollup.version == self.catalog.table_version(table_name):
+            return rollup
+        return None
+
+    def _on_load(self, table_name: str, df: pd.DataFrame) -> None:
+        if self._spec(table_name) is not None and self._current(table_name) is None:
+            # Freshly loaded from the file, so the rollup can be cached for the file's current content
+            self._write_cache(self._build(table_name, df))
+
+    def _on_append(self, table_name: str, rows: pd.DataFrame) -> None:
+        if self._spec(table_name) is None:
+            return
+        with self._lock:
+            rollup = self._rollups.get(table_name)
+            if rollup is None or rollup.version != self.catalog.table_version(table_name) - 1:
+                # Missed an earlier change; the next query rebuilds the rollup from the full table
+                self._rollups.pop(table_name, None)
+                return
+            scales = _scales(rows, rollup.measures)
+            wider = any(_wider(scales.get(measure, 0), scale) for measure, scale in rollup.scales.items())
+            if wider or not set(scales) <= set(rollup.scales):
+                # The new rows have more decimal places than the rollup's sums can hold
+                self._rollups.pop(table_name, None)
+                return
+            frame = _merge(rollup, [rollup.frame, _aggregate(rows, rollup)])
+            self._rollups[table_name] = Rollup(
+                rollup.name,
+                table_name,
+                rollup.dimensions,
+                rollup.measures,
+                rollup.scales,
+                frame,
+                self.catalog.table_version(table_name),
+            )
+        print(f"Rollup of '{table_name}' refreshed with {len(rows)} appended rows ({len(frame)} groups).")
+
+    def _build(self, table_name: str, df: pd.DataFrame) -> Rollup:
+        spec = self.specs[table_name]
+        rollup = Rollup(
+            f"{table_name}__rollup",
+            table_name,
+            list(spec["dimensions"]),
+            list(spec["measures"]),
+            _scales(df, spec["measures"]),
+            pd.DataFrame(),
+            self.catalog.table_version(table_name),
+        )
+        rollup.frame = _aggregate(df, rollup)
+        with self._lock:
+            self._rollups[table_name] = rollup
+        print(f"Built rollup of '{table_name}': {len(df)} rows into {len(rollup.frame)} groups.")
+        return rollup
+
+    def _cache_meta(self, table_name: str) -> dict:
+        spec = self.specs[table_name]
+        return {
+            "version": ROLLUP_VERSION,
+            "dimensions": list(spec["dimensions"]),
+            "measures": list(spec["measures"]),
+        }
+
+    def _read_cache(self, table_name: str) -> Rollup | None:
+        source = self.catalog.source(table_name)
+        if source.path is None:
+            return None
+        version = self.catalog.table_version(table_name)
+        cached = read_cached_rollup(source.path, source.sheet_name)
+        if cached is None:
+            return None
+        frame, meta = cached
+        if any(meta.get(key) != value for key, value in self._cache_meta(table_name).items()):
+            # Written for another rollup configuration or layout
+            return None
+        spec = self.specs[table_name]
+        rollup = Rollup(
+            f"{table_name}__rollup",
+            table_name,
+            list(spec["dimensions"]),
+            list(spec["measures"]),
+            meta["scales"],
+            frame,
+            version,
+        )
+        with self._lock:
+            self._rollups[table_name] = rollup
+        print(f"Loaded cached rollup of '{table_name}' ({len(frame)} groups).")
+        return rollup
+
+    def _write_cache(self, rollup: Rollup) -> None:
+        source = self.catalog.source(rollup.table)
+        if source.path is not None:
+            meta = {**self._cache_meta(rollup.table), "scales": rollup.scales}
+            write_cached_rollup(source.path, source.sheet_name, rollup.frame, meta)
+
+
+def _aggregate(df: pd.DataFrame, rollup: Rollup) -> pd.DataFrame:
+    measures = {measure: _widened(df[measure]) for measure in rollup.measures}
+    units = {
+        f"{measure}__units": _units(measures[measure], scale)
+        for measure, scale in rollup.scales.items()
+        if scale is not None
+    }
+    groups = (
+        df[rollup.dimensions]
+        .assign(**measures, **units)
+        .groupby(rollup.dimensions, dropna=False, observed=True, sort=False)
+    )
+    columns = {ROWS_COLUMN: groups.size()}
+    for measure in rollup.measures:
+        values = groups[measure]
+        # Float measures without a decimal scale have no exact sum, so the rollup doesn't answer their SUM
+        if rollup.scales.get(measure, 0) is not None:
+            summed = groups[f"{measure}__units"] if measure in rollup.scales else values
+            # SQL's SUM of only NULLs is NULL, not 0
+            columns[f"{measure}__sum"] = summed.sum(min_count=1)
+        columns[f"{measure}__count"] = values.count()
+        columns[f"{measure}__min"] = values.min()
+        columns[f"{measure}__max"] = values.max()
+    return pd.DataFrame(columns).reset_index()
+
+
+def _merge(rollup: Rollup, frames: list[pd.DataFrame]) -> pd.DataFrame:
+    combined = pd.concat(frames, ignore_index=True)
+    aggregates = [column for column in combined.columns if column not in rollup.dimensions]
+    combined = combined.assign(**{column: _widened(combined[column]) for column in aggregates})
+    groups = combined.groupby(rollup.dimensions, dropna=False, observed=True, sort=False)
+    columns = {ROWS_COLUMN: groups[ROWS_COLUMN].sum()}
+    for measure in rollup.measures:
+        if f"{measure}__sum" in combined:
+            columns[f"{measure}__sum"] = groups[f"{measure}__sum"].sum(min_count=1)
+        columns[f"{measure}__count"] = groups[f"{measure}__count"].sum()
+        columns[f"{measure}__min"] = groups[f"{measure}__min"].min()
+        columns[f"{measure}__max"] = groups[f"{measure}__max"].max()
+    return pd.DataFrame(columns).reset_index()
+
+
+def _widened(series: pd.Series) -> pd.Series:
+    """
+    Measures are aggregated as 64-bit numbers, like the SQL engines do: compacted float32 columns would be
+    summed in float32, which loses cents on large totals, and narrow integers could overflow.
+    """
+    nullable = isinstance(series.dtype, pd.api.extensions.ExtensionDtype)
+    if pd.api.types.is_float_dtype(series):
+        return series.astype("Float64" if nullable else "float64")
+    if pd.api.types.is_integer_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series.astype("Int64" if nullable else "int64")
+    return series
+
+
+def _scales(df: pd.DataFrame, measures: list[str]) -> dict[str, int | None]:
+    """The decimal places of the float measures; integer measures are summed exactly as they are."""
+    return {
+        measure: _decimal_scale(df[measure])
+        for measure in measures
+        if pd.api.types.is_float_dtype(df[measure])
+    }
+
+
+def _decimal_scale(series: pd.Series) -> int | None:
+    """The fewest decimal places every value has, e.g. 2 for amounts in cents; None if more than the max."""
+    values = series.dropna().to_numpy(dtype="float64")
+    for scale in range(MAX_DECIMAL_SCALE + 1):
+        units = np.round(values * 10**scale)
+        # The integer units must also be exact in a double for the sums to be exact
+        if (np.abs(units) < 2**53).all() and (units / 10**scale == values).all():
+            return scale
+    return None
+
+
+def _wider(scale: int | None, rollup_scale: int | None) -> bool:
+    return rollup_scale is not None and (scale is None or scale > rollup_scale)
+
+
+def _units(series: pd.Series, scale: int) -> pd.Series:
+    """A float measure in integer units of its decimal scale, e.g. cents."""
+    return (series.astype("float64") * 10**scale).round().astype("Int64")
+
+
+def _single_table(tree: exp.Expression) -> exp.Table | None:
+    """The table of a plain SELECT over exactly one table, without joins, subqueries or CTEs."""
+    if not isinstance(tree, exp.Select) or tree.args.get("joins") or tree.args.get("with"):
+        return None
+    tables = list(tree.find_all(exp.Table))
+    if len(tables) != 1 or tree.find(exp.Subquery) is not None:
+        return None
+    return tables[0]
+
+
+def _answerable(tree: exp.Select, dimensions: list[str], measures: list[str]) -> bool:
+    """Whether the query only aggregates measures and groups and filters by dimensions."""
+    if tree.args.get("distinct") or tree.find(exp.Window) is not None:
+        return False
+    aggregates = list(tree.find_all(exp.AggFunc))
+    if not aggregates and not tree.args.get("group"):
+        return False
+    dimension_names = {name.lower() for name in dimensions}
+    measure_names = {name.lower() for name in measures}
+    aliases = {
+        projection.alias.lower() for projection in tree.expressions if isinstance(projection, exp.Alias)
+    }
+    for column in tree.find_all(exp.Column):
+        if column.find_ancestor(exp.AggFunc) is not None:
+            continue
+        # Outside aggregates only dimensions can be used, and projection aliases (ORDER BY, HAVING)
+        if column.name.lower() not in dimension_names | aliases:
+            return False
+    return all(_measure(aggregate, measure_names) is not None for aggregate in aggregates)
+
+
+def _measure(aggregate: exp.AggFunc, measures: set[str]) -> str | None:
+    """The measure an aggregate reads ("*" for COUNT(*)), if the rollup has what it needs."""
+    argument = aggregate.this
+    if isinstance(aggregate, exp.Count) and isinstance(argument, exp.Star):
+        return "*"
+    if not isinstance(aggregate, exp.Sum | exp.Count | exp.Min | exp.Max | exp.Avg):
+        return None
+    if not isinstance(argument, exp.Column) or argument.name.lower() not in measures:
+        return None
+    return argument.name.lower()
+
+
+def _rewrite(tree: exp.Select, rollup: Rollup) -> exp.Select:
+    """Replaces the aggregates of the query by their re-aggregation over the rollup columns."""
+    for aggregate in list(tree.find_all(exp.AggFunc)):
+        aggregate.replace(_reaggregate(aggregate, rollup))
+    return tree
+
+
+def _round_measures(tree: exp.Select, rollup: Rollup) -> exp.Select:
+    """Rounds SUM and AVG of float measures on the base table the same way the rollup query does."""
+    measures = {name.lower(): name for name in rollup.measures}
+    for aggregate in list(tree.find_all(exp.Sum, exp.Avg)):
+        measure = measures[_measure(aggregate, set(measures))]
+        if measure not in rollup.scales:
+            continue
+        total = _round(exp.Sum(this=aggregate.this.copy()), rollup.scales[measure])
+        if isinstance(aggregate, exp.Avg):
+            total = exp.Div(this=total, expression=exp.Count(this=aggregate.this.copy()))
+        aggregate.replace(total)
+    return tree
+
+
+def _reaggregate(aggregate: exp.AggFunc, rollup: Rollup) -> exp.Expression | None:
+    measures = {name.lower(): name for name in rollup.measures}
+    name = _measure(aggregate, set(measures))
+    if name == "*":
+        return _coalesce_zero(exp.Sum(this=exp.column(ROWS_COLUMN, quoted=True)))
+    measure = measures[name]
+    argument = aggregate.this
+
+    def rollup_column(suffix: str) -> exp.Column:
+        return exp.column(f"{measure}__{suffix}", table=argument.table or None, quoted=True)
+
+    if isinstance(aggregate, exp.Count):
+        return _coalesce_zero(exp.Sum(this=rollup_column("count")))
+    if isinstance(aggregate, exp.Min):
+        return exp.Min(this=rollup_column("min"))
+    if isinstance(aggregate, exp.Max):
+        return exp.Max(this=rollup_column("max"))
+
+    if measure not in rollup.scales:
+        # Integer sums are exact in the rollup and the table alike
+        total = exp.Sum(this=rollup_column("sum"))
+    elif rollup.scales[measure] is None:
+        return None
+    else:
+        scale = rollup.scales[measure]
+        units = exp.Cast(this=exp.Sum(this=rollup_column("sum")), to=exp.DataType.build("DOUBLE"))
+        total = _round(exp.Div(this=units, expression=exp.Literal.number(10**scale)), scale)
+    if isinstance(aggregate, exp.Sum):
+        return total
+    # AVG
+    if measure not in rollup.scales:
+        total = exp.Cast(this=total, to=exp.DataType.build("DOUBLE"))
+    return exp.Div(this=total, expression=exp.Sum(this=rollup_column("count")))
+
+
+def _round(expression: exp.Expression, scale: int) -> exp.Expression:
+    return exp.Round(this=expression, decimals=exp.Literal.number(scale))
+
+
+def _coalesce_zero(expression: exp.Expression) -> exp.Expression:
+    return exp.Coalesce(this=expression, expressions=[exp.Literal.number(0)])
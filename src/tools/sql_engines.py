@@ -0,0 +1,379 @@
+import os
+import queue
+import shutil
+import sqlite3
+import tempfile
+import threading
+import weakref
+from abc import ABC, abstractmethod
+
+import duckdb
+import pandas as pd
+import sqlglot
+from sqlglot import exp
+from sqlglot.tokens import TokenType
+
+from config import DUCKDB_THREADS, SQL_ENGINE, SQLITE_INDEX_CARDINALITY_RATIO, SQLITE_POOL_SIZE
+from src.data.dtypes import SQLITE_DATETIME_FORMAT
+
+# sqlglot dialect of each engine
+SQLGLOT_DIALECTS = {"SQLite": "sqlite", "DuckDB": "duckdb"}
+
+# Tokens that end the column list of a SELECT
+_SELECT_LIST_END = {
+    TokenType.FROM, TokenType.WHERE, TokenType.GROUP_BY, TokenType.HAVING, TokenType.ORDER_BY,
+    TokenType.LIMIT, TokenType.UNION, TokenType.EXCEPT, TokenType.INTERSECT, TokenType.SEMICOLON,
+}  # fmt: skip
+
+
+def quote_identifier(name: str) -> str:
+    """Quotes a table or column name for use in SQL."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def alias_projections(query: str, dialect: str) -> str:
+    """
+    Aliases every unaliased computed column of the query with its own text, the name SQLite gives it, so
+    that engines which derive other names (DuckDB: `count_star()`) return the same columns. Queries that
+    can't be parsed are returned unchanged.
+    """
+    read = SQLGLOT_DIALECTS.get(dialect)
+    try:
+        tree = sqlglot.parse_one(query, read=read)
+        tokens = sqlglot.tokenize(query, read=read)
+    except sqlglot.errors.SqlglotError:
+        return query
+    select = tree
+    while isinstance(select, exp.SetOperation):
+        # Compound queries take their column names from the first SELECT
+        select = select.left
+    spans = _select_list_spans(tokens)
+    if not isinstance(select, exp.Select) or spans is None or len(spans) != len(select.expressions):
+        return query
+
+    parts, position = [], 0
+    for projection, (start, end) in zip(select.expressions, spans, strict=True):
+        column = projection.unnest() if isinstance(projection, exp.Paren) else projection
+        if isinstance(projection, exp.Alias | exp.Star) or isinstance(column, exp.Column):
+            continue
+        parts.append(query[position:end] + f" AS {quote_identifier(query[start:end])}")
+        position = end
+    parts.append(query[position:])
+    return "".join(parts)
+
+
+def _select_list_spans(tokens: list) -> list[tuple[int, int]] | None:
+    """Character spans of the columns of the query's outermost SELECT, or None if it has none."""
+    depth, spans, first, last = 0, None, None, None
+    for token in tokens:
+        if token.token_type == TokenType.L_PAREN:
+            depth += 1
+        elif token.token_type == TokenType.R_PAREN:
+            depth -= 1
+        elif depth == 0 and spans is None:
+            if token.token_type == TokenType.SELECT:
+                spans = []
+            continue
+        elif depth == 0 and token.token_type in _SELECT_LIST_END:
+            break
+        elif depth == 0 and token.token_type == TokenType.COMMA:
+            spans.append((first, last))
+            first = None
+            continue
+        if spans is None:
+            continue
+        if first is None and token.token_type not in (TokenType.DISTINCT, TokenType.ALL):
+            first = token.start
+        if first is not None:
+            last = token.end + 1
+    if spans is None or first is None:
+        return None
+    return [*spans, (first, last)]
+
+
+def dataframe_fingerprint(df: pd.DataFrame) -> tuple:
+    """Cheap identity of a DataFrame used to decide whether a loaded table must be refreshed."""
+    return id(df), df.shape, tuple(df.columns)
+
+
+class SqlEngine(ABC):
+    """Executes read-only SQL against pandas DataFrames registered as tables."""
+
+    dialect: str = "SQL"
+
+    def __init__(self):
+        self._fingerprints: dict[str, tuple] = {}
+        self._register_lock = threading.Lock()
+
+    def register(self, table_name: str, df: pd.DataFrame) -> bool:
+        """Makes the DataFrame queryable as `table_name`. Returns True if the table was (re)loaded."""
+        fingerprint = dataframe_fingerprint(df)
+        if self._fingerprints.get(table_name) == fingerprint:
+            return False
+        with self._register_lock:
+            # Another thread may have loaded the same table while this one waited
+            if self._fingerprints.get(table_name) == fingerprint:
+                return False
+            self._load(table_name, df)
+            self._fingerprints[table_name] = fingerprint
+        return True
+
+    def append(self, table_name: str, rows: pd.DataFrame, df: pd.DataFrame) -> None:
+        """
+        Adds rows to a loaded table, `df` being the whole table after the append. Queries see the table
+        either before or after the append. Tables that aren't loaded are left to the next `register`.
+        """
+        with self._register_lock:
+            if table_name not in self._fingerprints:
+                return
+            self._append(table_name, rows, df)
+            self._fingerprints[table_name] = dataframe_fingerprint(df)
+
+    def unregister(self, table_name: str) -> None:
+        """Removes a table from the engine."""
+        with self._register_lock:
+            if self._fingerprints.pop(table_name, None) is not None:
+                self._drop(table_name)
+
+    @property
+    def tables(self) -> list[str]:
+        return list(self._fingerprints)
+
+    @abstractmethod
+    def _load(self, table_name: str, df: pd.DataFrame) -> None: ...
+
+    @abstractmethod
+    def _drop(self, table_name: str) -> None: ...
+
+    def _append(self, table_name: str, rows: pd.DataFrame, df: pd.DataFrame) -> None:
+        self._load(table_name, df)
+
+    @abstractmethod
+    def execute(self, query: str, extra_tables: dict[str, pd.DataFrame] | None = None) -> pd.DataFrame:
+        """
+        Runs the query and returns the result. Raises on SQL errors. `extra_tables` are small DataFrames
+        visible to this query only.
+        """
+
+
+class SqliteEngine(SqlEngine):
+    """
+    SQLite engine that loads each table once into a long-lived database and serves queries from a pool
+    of read-only connections.
+
+    The database lives in a private temporary file in WAL mode, so readers run concurrently and keep a
+    consistent snapshot while a table is being refreshed.
+    """
+
+    dialect = "SQLite"
+
+    def __init__(self, pool_size: int = SQLITE_POOL_SIZE):
+        super().__init__()
+        self._dir = tempfile.mkdtemp(prefix="sql-agent-")
+        self._path = os.path.join(self._dir, "tables.db")
+        self._write_lock = threading.Lock()
+        self._writer = sqlite3.connect(self._path, check_same_thread=False)
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        self._readers: queue.Queue[sqlite3.Connection] = queue.Queue()
+        for _ in range(pool_size):
+            reader = sqlite3.connect(f"file:{self._path}?mode=ro", uri=True, check_same_thread=False)
+            self._readers.put(reader)
+        weakref.finalize(self, shutil.rmtree, self._dir, ignore_errors=True)
+
+    def _load(self, table_name: str, df: pd.DataFrame) -> None:
+        print(f"Loading table '{table_name}' ({len(df)} rows) into SQLite.")
+        table = quote_identifier(table_name)
+        staging_name = f"{table_name}__staging"
+        with self._write_lock:
+            self._to_sqlite_frame(df).to_sql(staging_name, self._writer, index=False, if_exists="replace")
+            # Swap the fresh copy in with a single transaction; readers keep seeing the old snapshot.
+            self._writer.execute("BEGIN")
+            try:
+                self._writer.execute(f"DROP TABLE IF EXISTS {table}")
+                self._writer.execute(f"ALTER TABLE {quote_identifier(staging_name)} RENAME TO {table}")
+                for i, column in enumerate(self._index_columns(df)):
+                    index = quote_identifier(f"idx_{table_name}_{i}")
+                    self._writer.execute(f"CREATE INDEX {index} ON {table} ({quote_identifier(column)})")
+                self._writer.execute("COMMIT")
+            except Exception:
+                self._writer.execute("ROLLBACK")
+                self._writer.execute(f"DROP TABLE IF EXISTS {quote_identifier(staging_name)}")
+                raise
+
+    def _append(self, table_name: str, rows: pd.DataFrame, df: pd.DataFrame) -> None:
+        print(f"Appending {len(rows)} rows to table '{table_name}' in SQLite.")
+        with self._write_lock:
+            # A single transaction, so readers see all of the new rows or none of them
+            self._to_sqlite_frame(rows).to_sql(table_name, self._writer, index=False, if_exists="append")
+
+    def _drop(self, table_name: str) -> None:
+        with self._write_lock:
+            self._writer.execute(f"DROP TABLE IF EXISTS {quote_identifier(table_name)}")
+            self._writer.commit()
+
+    def execute(self, query: str, extra_tables: dict[str, pd.DataFrame] | None = None) -> pd.DataFrame:
+        reader = self._readers.get()
+        extra_tables = extra_tables or {}
+        try:
+            # The temp schema is private to the connection and writable even on a read-only database
+            for table_name, df in extra_tables.items():
+                self._create_temp_table(reader, table_name, df)
+            return pd.read_sql_query(query, reader)
+        finally:
+            try:
+                for table_name in extra_tables:
+                    reader.execute(f"DROP TABLE IF EXISTS temp.{quote_identifier(table_name)}")
+            finally:
+                # Inserting into the temp tables opened a transaction. Left open, it would pin the pooled
+                # reader to a stale snapshot of later table refreshes and block WAL checkpoints.
+                reader.commit()
+                self._readers.put(reader)
+
+    def _create_temp_table(self, connection: sqlite3.Connection, table_name: str, df: pd.DataFrame) -> None:
+        df = self._to_sqlite_frame(df)
+        columns = ", ".join(quote_identifier(str(column)) for column in df.columns)
+        placeholders = ", ".join("?" * len(df.columns))
+        table = f"temp.{quote_identifier(table_name)}"
+        connection.execute(f"CREATE TABLE {table} ({columns})")
+        if df.empty:
+            return
+        rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+        connection.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+
+    @staticmethod
+    def _to_sqlite_frame(df: pd.DataFrame) -> pd.DataFrame:
+        datetime_columns = [
+            col for col, dtype in df.dtypes.items() if pd.api.types.is_datetime64_any_dtype(dtype)
+        ]
+        if not datetime_columns:
+            return df
+        df = df.copy(deep=False)
+        for col in datetime_columns:
+            df[col] = df[col].dt.strftime(SQLITE_DATETIME_FORMAT)
+        return df
+
+    @staticmethod
+    def _index_columns(df: pd.DataFrame) -> list[str]:
+        """Picks date columns and low-cardinality columns, the usual filter and group-by targets."""
+        max_distinct = max(2, int(len(df) * SQLITE_INDEX_CARDINALITY_RATIO))
+        columns = []
+        for col, dtype in df.dtypes.items():
+            distinct = df[col].nunique()
+            if distinct < 2:
+                continue
+            if pd.api.types.is_datetime64_any_dtype(dtype) or distinct <= max_distinct:
+                columns.append(col)
+        return columns
+
+
+# DuckDB types of compacted pandas columns, widened to what SQLite would store
+_WIDENED_TYPES = {
+    "int8": "BIGINT",
+    "int16": "BIGINT",
+    "int32": "BIGINT",
+    "uint8": "BIGINT",
+    "uint16": "BIGINT",
+    "uint32": "BIGINT",
+    "float32": "DOUBLE",
+    "category": "VARCHAR",
+}
+
+
+class DuckDbEngine(SqlEngine):
+    """
+    DuckDB engine that scans the registered pandas DataFrames in place through Arrow, with no copy, and
+    runs queries vectorized across multiple cores.
+
+    Results are normalized to what SQLite would return: computed columns named after their text, integer
+    sums, 0/1 booleans, datetime text, float columns with missing integers and NULL-only columns as None,
+    so both engines produce identical results for the same query.
+    """
+
+    dialect = "DuckDB"
+
+    def __init__(self, threads: int = DUCKDB_THREADS):
+        super().__init__()
+        # SQLite sorts NULLs as the smallest value; match it so ORDER BY results agree across engines.
+        config = {"default_null_order": "nulls_first_on_asc_last_on_desc"}
+        if threads:
+            config["threads"] = threads
+        self._connection = duckdb.connect(config=config)
+        self._frames: dict[str, pd.DataFrame] = {}
+
+    def _load(self, table_name: str, df: pd.DataFrame) -> None:
+        # Swapping the dict entry is atomic; running queries keep the frames they started with.
+        self._frames = {**self._frames, table_name: df}
+
+    def _drop(self, table_name: str) -> None:
+        self._frames = {name: df for name, df in self._frames.items() if name != table_name}
+
+    def execute(self, query: str, extra_tables: dict[str, pd.DataFrame] | None = None) -> pd.DataFrame:
+        # Views registered on a cursor are private to it, which keeps concurrent queries independent.
+        cursor = self._connection.cursor()
+        try:
+            for table_name, df in {**self._frames, **(extra_tables or {})}.items():
+                self._register_frame(cursor, table_name, df)
+            relation = cursor.sql(alias_projections(query, self.dialect))
+            return self._normalize_frame(self._normalize(relation).df())
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _register_frame(cursor: duckdb.DuckDBPyConnection, table_name: str, df: pd.DataFrame) -> None:
+        """
+        Makes the DataFrame queryable as `table_name`. Compacted columns are widened, as SQLite stores them:
+        narrow integers to BIGINT (so arithmetic doesn't overflow), float32 to DOUBLE, categoricals to text.
+        """
+        projections, widened = [], False
+        for column, dtype in df.dtypes.items():
+            name = quote_identifier(str(column))
+            wide_type = _WIDENED_TYPES.get(str(dtype))
+            projections.append(f"CAST({name} AS {wide_type}) AS {name}" if wide_type else name)
+            widened = widened or wide_type is not None
+        if not widened:
+            cursor.register(table_name, df)
+            return
+        frame_name = f"{table_name}__frame"
+        cursor.register(frame_name, df)
+        cursor.execute(
+            f"CREATE TEMP VIEW {quote_identifier(table_name)} AS "
+            f"SELECT {', '.join(projections)} FROM {quote_identifier(frame_name)}"
+        )
+
+    @staticmethod
+    def _normalize(relation: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
+        projections, changed = [], False
+        for column, column_type in zip(relation.columns, relation.types, strict=True):
+            name, column_type = quote_identifier(column), str(column_type)
+            if column_type in ("HUGEINT", "BOOLEAN"):
+                projections.append(f"CAST({name} AS BIGINT) AS {name}")
+            elif column_type.startswith("TIMESTAMP"):
+                projections.append(f"strftime({name}, '{SQLITE_DATETIME_FORMAT}') AS {name}")
+            else:
+                projections.append(name)
+                continue
+            changed = True
+        return relation.project(", ".join(projections)) if changed else relation
+
+    @staticmethod
+    def _normalize_frame(df: pd.DataFrame) -> pd.DataFrame:
+        """Gives columns with missing values the types SQLite results have, which has no typed NULLs."""
+        for i in range(df.shape[1]):
+            series = df.iloc[:, i]
+            if series.isna().all():
+                df.isetitem(i, pd.Series([None] * len(df), index=df.index, dtype=object))
+            elif isinstance(series.dtype, pd.api.extensions.ExtensionDtype) and series.dtype.kind in "iub":
+                has_missing = series.isna().any()
+                df.isetitem(i, series.astype("float64" if has_missing else series.dtype.numpy_dtype))
+        return df
+
+
+ENGINES: dict[str, type[SqlEngine]] = {"sqlite": SqliteEngine, "duckdb": DuckDbEngine}
+
+
+def create_engine(name: str = SQL_ENGINE) -> SqlEngine:
+    """Creates the SQL engine configured by name."""
+    try:
+        return ENGINES[name.lower()]()
+    except KeyError:
+        raise ValueError(f"Unknown SQL engine '{name}'. Available engines: {list(ENGINES)}.") from None
@@ -0,0 +1,197 @@
+import difflib
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import sqlglot
+from sqlglot import exp
+
+from config import SQL_REPAIR_CACHE_MAX_ENTRIES, SQL_REPAIR_FUZZY_CUTOFF
+
+from .sql_engines import SQLGLOT_DIALECTS, quote_identifier
+
+# String literals and quoted identifiers are left alone by the textual fixes; the rest is plain SQL
+_QUOTED_PATTERN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|\[[^\]]*\]")
+_PLAIN_IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_]\w*")
+
+
+@dataclass
+class Repair:
+    """A query after the local fixes, with a description of every fix applied."""
+
+    query: str
+    fixes: list[str] = field(default_factory=list)
+
+
+class SqlRepairer:
+    """
+    Fixes mechanical mistakes in generated SQL before it is executed, so that they don't cost an LLM round
+    trip: trailing semicolons, unquoted or wrongly quoted names with spaces or dots, and misspelled or
+    wrongly cased table and column names that closely match exactly one known name. The query is parsed
+    with sqlglot; queries that don't parse are only given the textual fixes.
+
+    Repairs are cached by query and schema, so a repeated mistake is fixed without parsing again.
+    """
+
+    def __init__(
+        self, max_entries: int = SQL_REPAIR_CACHE_MAX_ENTRIES, fuzzy_cutoff: float = SQL_REPAIR_FUZZY_CUTOFF
+    ):
+        self.max_entries = max_entries
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict[tuple, Repair] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def repair(self, query: str, schema: dict[str, list[str]], dialect: str) -> Repair:
+        """Applies the local fixes to `query`, given the columns of every queryable table."""
+        key = (query, dialect, tuple((table, tuple(columns)) for table, columns in sorted(schema.items())))
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        repaired = self._repair(query, schema, SQLGLOT_DIALECTS.get(dialect))
+        with self._lock:
+            self._cache[key] = repaired
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return repaired
+
+    def stats(self) -> dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._cache),
+        }
+
+    def _repair(self, query: str, schema: dict[str, list[str]], dialect: str | None) -> Repair:
+        fixes = []
+        stripped = query.strip().rstrip(";").strip()
+        if stripped != query.strip():
+            fixes.append("removed trailing semicolon")
+        names = set(schema) | {column for columns in schema.values() for column in columns}
+        text = _quote_names(stripped, names, fixes)
+
+        try:
+            tree = sqlglot.parse_one(text, read=dialect)
+        except sqlglot.errors.SqlglotError:
+            return Repair(text, list(dict.fromkeys(fixes)))
+        changed = self._fix_tables(tree, schema, fixes)
+        changed = self._fix_columns(tree, schema, fixes) or changed
+        # Regenerated only if the tree changed, so untouched queries keep the LLM's formatting
+        return Repair(tree.sql(dialect=dialect) if changed else text, list(dict.fromkeys(fixes)))
+
+    def _fix_tables(self, tree: exp.Expression, schema: dict[str, list[str]], fixes: list[str]) -> bool:
+        defined = {cte.alias.lower() for cte in tree.find_all(exp.CTE)}
+        changed = False
+        for table in tree.find_all(exp.Table):
+            name = table.name
+            if not name or name in schema or name.lower() in defined:
+                continue
+            match = self._match(name, list(schema))
+            if match is not None:
+                table.set("this", exp.to_identifier(match, quoted=_needs_quotes(match)))
+                fixes.append(f"table {name} -> {match}")
+                changed = True
+        return changed
+
+    def _fix_columns(self, tree: exp.Expression, schema: dict[str, list[str]], fixes: list[str]) -> bool:
+        known = list(dict.fromkeys(column for columns in schema.values() for column in columns))
+        known_set = set(known)
+        # Aliases of expressions, subqueries and CTE columns are valid names that no table has
+        defined = {alias.alias.lower() for alias in tree.find_all(exp.Alias)}
+        for table_alias in tree.find_all(exp.TableAlias):
+            defined.update(column.name.lower() for column in table_alias.columns)
+        changed = False
+        for column in tree.find_all(exp.Column):
+            identifier = column.this
+            if not isinstance(identifier, exp.Identifier):
+                continue
+            name = identifier.name
+            if name in known_set:
+                if _needs_quotes(name) and not identifier.quoted:
+                    identifier.set("quoted", True)
+                    changed = True
+                continue
+            if name.lower() in defined:
+                continue
+            match = self._match(name, known)
+            if match is not None:
+                column.set("this", exp.to_identifier(match, quoted=True))
+                fixes.append(f"column {name} -> {match}")
+                changed = True
+        return changed
+
+    def _match(self, name: str, candidates: list[str]) -> str | None:
+        """The only candidate equal to `name` ignoring case and punctuation, or else the only close match."""
+        for normalize in (str.lower, _normalize):
+            matches = [candidate for candidate in candidates if normalize(candidate) == normalize(name)]
+            if len(matches) == 1:
+                return matches[0]
+            if matches:
+                return None
+        by_key = {}
+        for candidate in candidates:
+            by_key.setdefault(_normalize(candidate), []).append(candidate)
+        close = difflib.get_close_matches(_normalize(name), list(by_key), n=2, cutoff=self.fuzzy_cutoff)
+        if not close or len(by_key[close[0]]) > 1:
+            return None
+        if len(close) == 2 and _similarity(name, close[0]) == _similarity(name, close[1]):
+            return None
+        return by_key[close[0]][0]
+
+
+def _quote_names(query: str, names: set[str], fixes: list[str]) -> str:
+    """
+    Quotes known names that are not plain identifiers (spaces, dots, ...) where the query uses them bare,
+    and turns backtick and bracket quoting of known names into standard double quotes.
+    """
+    special = sorted(filter(_needs_quotes, names), key=len)
+    lowered = {name.lower(): name for name in names}
+    bare_pattern = None
+    if special:
+        # Longest names first, so that a name isn't matched as the prefix of a longer one
+        alternatives = "|".join(re.escape(name) for name in reversed(special))
+        bare_pattern = re.compile(rf"(?<![\w\"])(?:{alternatives})(?![\w\"])", re.IGNORECASE)
+
+    def quote_bare(match: re.Match) -> str:
+        name = lowered[match.group(0).lower()]
+        fixes.append(f"quoted {name}")
+        return quote_identifier(name)
+
+    parts = []
+    position = 0
+    for quoted in _QUOTED_PATTERN.finditer(query):
+        parts.append(_sub(bare_pattern, quote_bare, query[position : quoted.start()]))
+        token = quoted.group(0)
+        if token[0] in "`[" and token[1:-1].lower() in lowered:
+            name = lowered[token[1:-1].lower()]
+            fixes.append(f"requoted {name}")
+            token = quote_identifier(name)
+        parts.append(token)
+        position = quoted.end()
+    parts.append(_sub(bare_pattern, quote_bare, query[position:]))
+    return "".join(parts)
+
+
+def _sub(pattern: re.Pattern | None, replace, text: str) -> str:
+    return pattern.sub(replace, text) if pattern is not None else text
+
+
+def _needs_quotes(name: str) -> bool:
+    return not _PLAIN_IDENTIFIER_PATTERN.fullmatch(name)
+
+
+def _normalize(name: str) -> str:
+    return re.sub(r"[\W_]+", "", name.lower())
+
+
+def _similarity(a: str, b: str) -> float:
+    return difflib.SequenceMatcher(None, _normalize(a), b).ratio()
@@ -1,17 +1,50 @@
+import logging
 import re
+import time
 
 import pandas as pd
-import pandasql as ps
 
-from config import MAX_ROWS
+from config import MAX_ROWS, ROLLUPS, SQL_REPAIR_ENABLED
+from src.data.catalog import DataCatalog
+from src.observability.metrics import SQL_REPAIRS, SQL_ROWS
+from src.observability.tracing import Span, span
+
+from .result_cache import QueryResultCache, frame_digest, normalize_sql
+from .rollups import RollupRewrite, Rollups
+from .sql_engines import SqlEngine, create_engine
+from .sql_repair import SqlRepairer
+
+logger = logging.getLogger(__name__)
 
 
 class SqlTool:
-    """Tool for executing SQL queries on pandas DataFrames."""
+    """Tool for executing SQL queries on the tables of a data catalog."""
 
-    def __init__(self, df: pd.DataFrame, table_name: str):
-        self.df = df
-        self.table_name = table_name
+    def __init__(
+        self,
+        catalog: DataCatalog,
+        engine: SqlEngine | None = None,
+        result_cache: QueryResultCache | None = None,
+        repairer: SqlRepairer | None = None,
+        rollups: Rollups | None = None,
+    ):
+        self.catalog = catalog
+        self.engine = engine or create_engine()
+        self.result_cache = result_cache or QueryResultCache()
+        self.repairer = repairer or (SqlRepairer() if SQL_REPAIR_ENABLED else None)
+        self.rollups = rollups or (Rollups(catalog) if ROLLUPS else None)
+        # Frames of the rollups loaded into the engine. Holding them keeps a refreshed rollup from reusing
+        # the id of the frame it replaces, which would make the engine think it's already loaded.
+        self._rollup_frames: dict[str, pd.DataFrame] = {}
+        self.catalog.on_evict(self.engine.unregister)
+        self.catalog.on_append(self._on_append)
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, table_name: str, engine: SqlEngine | None = None) -> "SqlTool":
+        """Creates a tool that queries a single in-memory DataFrame."""
+        catalog = DataCatalog()
+        catalog.register_dataframe(table_name, df)
+        return cls(catalog, engine)
 
     def __sanitize_query(self, query: str) -> str:
         """Performs security checks and adds a LIMIT clause to the SQL query."""
@@ -36,25 +69,126 @@ class SqlTool:
 
         return query
 
-    def execute_query(self, query: str) -> pd.DataFrame | str:
+    def execute_query(
+        self, query: str, extra_tables: dict[str, pd.DataFrame] | None = None
+    ) -> pd.DataFrame | str:
         """
         Sanitizes and executes the SQL query, returning a DataFrame on success
-        or an error string on failure.
+        or an error string on failure. `extra_tables` (e.g. results of earlier
+        plan steps) can be queried alongside the catalog tables.
         """
+        with span("sql.execute", "sql", engine=self.engine.dialect) as sql_span:
+            return self._execute(query, extra_tables or {}, sql_span)
+
+    def _execute(
+        self, query: str, extra_tables: dict[str, pd.DataFrame], sql_span: Span
+    ) -> pd.DataFrame | str:
         print(f"Original query: {query}")
+        if self.repairer is not None:
+            query = self._repair(query, extra_tables, sql_span)
         try:
             safe_query = self.__sanitize_query(query)
             print(f"Sanitized query: {safe_query}")
         except ValueError as e:
             error_message = f"Error: Invalid query. {e}"
             print(error_message)
+            sql_span.fail(error_message)
             return error_message
 
-        env = {self.table_name: self.df}
+        table_names = self.catalog.referenced_tables(safe_query)
+        extra_tables = {
+            name: df for name, df in extra_tables.items() if name.lower() in _identifiers(safe_query)
+        }
+        sql_span.set(query=safe_query, tables=table_names + list(extra_tables))
+        # Table versions are part of the key, so reloading a table invalidates its cached results
+        cache_key = (
+            normalize_sql(safe_query),
+            tuple((name, self.catalog.table_version(name)) for name in table_names),
+            tuple((name, frame_digest(df)) for name, df in sorted(extra_tables.items())),
+        )
+        cached_df = self.result_cache.get(cache_key)
+        if cached_df is not None:
+            logger.info("Query result served from cache.")
+            sql_span.set(cache_hit=True, rows_returned=len(cached_df))
+            return cached_df
+
         try:
-            result_df = ps.sqldf(safe_query, env)
-            return result_df
+            # Pinned until the query is done, so loading one of its tables can't evict and unregister another
+            with self.catalog.pinned(table_names):
+                rewrite = None
+                if self.rollups is not None and not extra_tables:
+                    rewrite = self.rollups.rewrite(safe_query, self.engine.dialect)
+                outcome = self._execute_on_rollup(rewrite, sql_span) if rewrite is not None else None
+                if outcome is None:
+                    if rewrite is not None:
+                        # Rounds float sums like the rollup query, so both give the same result
+                        safe_query = rewrite.base_query
+                    # Loads referenced tables on first use; the engine skips tables it already holds
+                    tables = [self.catalog.get(table_name) for table_name in table_names]
+                    for table_name, df in zip(table_names, tables, strict=True):
+                        self.engine.register(table_name, df)
+                    start = time.perf_counter()
+                    result_df = self.engine.execute(safe_query, extra_tables)
+                    outcome = result_df, tables, time.perf_counter() - start
+            result_df, tables, engine_seconds = outcome
+            self.result_cache.put(cache_key, result_df)
         except Exception as e:
             error_message = f"Error: Could not execute the query. Reason: {e}"
             print(error_message)
+            sql_span.fail(error_message)
             return error_message
+
+        # Engines don't report the rows they read; the referenced tables' sizes are the upper bound
+        rows_scanned = sum(len(df) for df in tables) + sum(len(df) for df in extra_tables.values())
+        sql_span.set(
+            cache_hit=False,
+            rows_scanned=rows_scanned,
+            rows_returned=len(result_df),
+            engine_seconds=engine_seconds,
+        )
+        SQL_ROWS.inc(rows_scanned, kind="scanned")
+        SQL_ROWS.inc(len(result_df), kind="returned")
+        return result_df
+
+    def _execute_on_rollup(
+        self, rewrite: RollupRewrite, sql_span: Span
+    ) -> tuple[pd.DataFrame, list[pd.DataFrame], float] | None:
+        """
+        Runs an aggregate query rewritten to read the rollup of its table. Returns the result, the tables
+        read and the engine time, or None to run the query on the base table.
+        """
+        # Computed columns of the rewritten query are aliased with their original text, so the result has
+        # the column names of the original query
+        rollup = rewrite.rollup
+        logger.info("Query answered from rollup '%s': %s", rollup.name, rewrite.query)
+        try:
+            self.engine.register(rollup.name, rollup.frame)
+            self._rollup_frames[rollup.name] = rollup.frame
+            start = time.perf_counter()
+            result_df = self.engine.execute(rewrite.query)
+            engine_seconds = time.perf_counter() - start
+        except Exception as e:
+            logger.warning("Rollup query failed, scanning the table instead. Reason: %s", e)
+            sql_span.set(rollup_error=str(e))
+            return None
+        sql_span.set(rollup=rollup.name, rollup_query=rewrite.query)
+        return result_df, [rollup.frame], engine_seconds
+
+    def _on_append(self, table_name: str, rows: pd.DataFrame) -> None:
+        # Only the new rows are written to the engine instead of reloading the whole table
+        self.engine.append(table_name, rows, self.catalog.get(table_name))
+
+    def _repair(self, query: str, extra_tables: dict[str, pd.DataFrame], sql_span: Span) -> str:
+        """Fixes mechanical mistakes locally, so that only real errors go back to the LLM."""
+        schema = {name: self.catalog.columns(name) for name in self.catalog.table_names}
+        schema.update({name: [str(column) for column in df.columns] for name, df in extra_tables.items()})
+        repair = self.repairer.repair(query, schema, self.engine.dialect)
+        if repair.fixes:
+            logger.info("Repaired query locally (%s): %s", "; ".join(repair.fixes), repair.query)
+            sql_span.set(repairs=repair.fixes)
+            SQL_REPAIRS.inc()
+        return repair.query
+
+
+def _identifiers(query: str) -> set[str]:
+    return {(quoted or bare).lower() for quoted, bare in re.findall(r'"([^"]+)"|(\w+)', query)}
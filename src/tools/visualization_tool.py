@@ -1,88 +1,110 @@
-import os
-import uuid
-
-import matplotlib.pyplot as plt
 import pandas as pd
-import seaborn as sns
+from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import SystemMessage
 from langchain_openai import ChatOpenAI
-from pydantic import BaseModel, Field
 
-from config import CHART_OUTPUT_PATH, LLM_MODEL
+from config import LLM_MODEL
+from src.observability.metrics import CHART_SELECTIONS
+from src.observability.tracing import current_span, span
 
+from .chart_renderer import Chart, ChartDetails, ChartRenderer, default_renderer
+from .chart_selection import heuristic_chart_details
 from .tools_prompts import chart_details_prompt
 
 
-class ChartDetails(BaseModel):
-    """Details for generating a chart."""
-
-    chart_type: str = Field(
-        ..., description="The type of chart to generate: 'bar', 'line', 'pie', 'scatter'."
-    )
-    x_column: str = Field(..., description="The column to use for the x-axis.")
-    y_column: str = Field(..., description="The column to use for the y-axis.")
-    title: str = Field(..., description="A descriptive title for the chart.")
-
-
 class VisualizationTool:
     """A tool for generating data visualizations."""
 
-    def __init__(self):
-        self.llm = ChatOpenAI(model=LLM_MODEL, temperature=0).with_structured_output(ChartDetails)
-        if not os.path.exists(CHART_OUTPUT_PATH):
-            os.makedirs(CHART_OUTPUT_PATH)
+    def __init__(self, llm: BaseChatModel | None = None, renderer: ChartRenderer | None = None):
+        llm = llm or ChatOpenAI(model=LLM_MODEL, temperature=0)
+        self.llm = llm.with_structured_output(ChartDetails)
+        self.renderer = renderer or default_renderer()
 
     def _get_chart_details(self, df: pd.DataFrame, question: str) -> ChartDetails:
         """Uses an LLM to determine the best chart to create."""
+        return self.llm.invoke([SystemMessage(content=self._chart_details_prompt(df, question))])
+
+    async def _aget_chart_details(self, df: pd.DataFrame, question: str) -> ChartDetails:
+        return await self.llm.ainvoke([SystemMessage(content=self._chart_details_prompt(df, question))])
+
+    @staticmethod
+    def _chart_details_prompt(df: pd.DataFrame, question: str) -> str:
         df_head = df.head().to_string(index=False)
-        prompt_content = chart_details_prompt(question, df_head, list(df.columns))
-        return self.llm.invoke([SystemMessage(content=prompt_content)])
+        return chart_details_prompt(question, df_head, list(df.columns))
 
-    def generate_chart(self, df: pd.DataFrame, question: str) -> str:
-        """Generates a chart and returns the file path."""
-        print("Node: generate_chart")
-        try:
-            details = self._get_chart_details(df, question)
+    def suggest_chart(self, df: pd.DataFrame, question: str) -> ChartDetails | None:
+        """Picks the chart from the column types without an LLM call; None if the choice is ambiguous."""
+        details = heuristic_chart_details(df, question)
+        if details is not None:
             print(
-                f"""LLM decided to create a '{details.chart_type}' chart with X='{details.x_column}'
-                and Y='{details.y_column}'."""
+                f"Chart chosen by heuristic: '{details.chart_type}' with X='{details.x_column}'"
+                f" and Y='{details.y_column}'."
             )
+            _record_selection("heuristic")
+        return details
 
-            if details.x_column not in df.columns or details.y_column not in df.columns:
-                error_msg = f"""
-                Error: LLM hallucinated column names. X='{details.x_column}', Y='{details.y_column}'.
-                Available columns: {list(df.columns)}
-                """
-                print(error_msg)
-                return error_msg
-
-            plt.figure(figsize=(10, 6))
-
-            if details.chart_type == "bar":
-                sns.barplot(data=df, x=details.x_column, y=details.y_column)
-            elif details.chart_type == "line":
-                sns.lineplot(data=df, x=details.x_column, y=details.y_column)
-            elif details.chart_type == "pie":
-                df.set_index(details.x_column)[details.y_column].plot.pie(
-                    autopct="%1.1f%%", startangle=90, legend=False
-                )
-                plt.ylabel("")
-            elif details.chart_type == "scatter":
-                sns.scatterplot(data=df, x=details.x_column, y=details.y_column)
-            else:
-                return f"Error: Unsupported chart type '{details.chart_type}' selected by LLM."
-
-            plt.title(details.title)
-            plt.xticks(rotation=45, ha="right")
-            plt.tight_layout()
-
-            filepath = os.path.join(CHART_OUTPUT_PATH, f"{uuid.uuid4()}.png")
-            plt.savefig(filepath)
-            plt.close()
-
-            print(f"Chart saved to {filepath}")
-            return filepath
+    def choose_chart(self, df: pd.DataFrame, question: str) -> ChartDetails | str:
+        """Asks the LLM to pick the chart; returns an error message if no valid chart was chosen."""
+        _record_selection("llm")
+        try:
+            return self._validate(df, self._get_chart_details(df, question))
+        except Exception as e:
+            return _error(f"Error generating chart: {e}")
+
+    async def achoose_chart(self, df: pd.DataFrame, question: str) -> ChartDetails | str:
+        _record_selection("llm")
+        try:
+            return self._validate(df, await self._aget_chart_details(df, question))
         except Exception as e:
-            error_msg = f"Error generating chart: {e}"
-            print(error_msg)
-            return error_msg
+            return _error(f"Error generating chart: {e}")
+
+    def render(self, df: pd.DataFrame, details: ChartDetails) -> Chart | str:
+        """Renders the chart in the renderer's worker processes, returning the image or an error message."""
+        with span("chart.render", "chart", chart_type=details.chart_type, rows=len(df)) as chart_span:
+            try:
+                chart = self.renderer.render(df, details)
+            except Exception as e:
+                chart_span.fail(str(e))
+                return _error(f"Error generating chart: {e}")
+        print(f"Chart rendered ({chart.format}, {len(chart.data):,} bytes).")
+        return chart
+
+    async def arender(self, df: pd.DataFrame, details: ChartDetails) -> Chart | str:
+        with span("chart.render", "chart", chart_type=details.chart_type, rows=len(df)) as chart_span:
+            try:
+                chart = await self.renderer.arender(df, details)
+            except Exception as e:
+                chart_span.fail(str(e))
+                return _error(f"Error generating chart: {e}")
+        print(f"Chart rendered ({chart.format}, {len(chart.data):,} bytes).")
+        return chart
+
+    def generate_chart(self, df: pd.DataFrame, question: str) -> Chart | str:
+        """Generates a chart and returns the rendered image, or an error message."""
+        details = self.suggest_chart(df, question) or self.choose_chart(df, question)
+        if isinstance(details, str):
+            return details
+        return self.render(df, details)
+
+    @staticmethod
+    def _validate(df: pd.DataFrame, details: ChartDetails) -> ChartDetails | str:
+        print(f"""LLM decided to create a '{details.chart_type}' chart with X='{details.x_column}'
+            and Y='{details.y_column}'.""")
+        if details.x_column not in df.columns or details.y_column not in df.columns:
+            return _error(f"""
+            Error: LLM hallucinated column names. X='{details.x_column}', Y='{details.y_column}'.
+            Available columns: {list(df.columns)}
+            """)
+        return details
+
+
+def _record_selection(path: str) -> None:
+    """Reports whether the heuristic or the LLM chose the chart, on the current span and in metrics."""
+    CHART_SELECTIONS.inc(path=path)
+    if (parent := current_span()) is not None:
+        parent.set(chart_selection=path)
+
+
+def _error(message: str) -> str:
+    print(message)
+    return message
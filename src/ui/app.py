@@ -1,9 +1,12 @@
-import base64
+import uuid
 
 import gradio as gr
 from gradio import ChatMessage
 from langchain_core.messages import HumanMessage
 
+from config import UI_CONCURRENCY_LIMIT, UI_MAX_QUEUE_SIZE
+from src.agent.graph import FINAL_ANSWER_TAG
+
 
 def run_gradio_ui(ai_agent):
     """Setup and runs the Gradio UI for the AI agent."""
@@ -18,31 +21,48 @@ def run_gradio_ui(ai_agent):
             submit_btn=True,
         )
 
-        chat_history_state = gr.State([])
-
-        def user_interaction(user_message, history_list):
-            initial_agent_state = {"question": user_message, "chat_history": history_list}
+        # The conversation itself lives in the agent's checkpointer; the browser only keeps the id of its
+        # session, so a reload or a server restart continues the same conversation
+        session_id = gr.BrowserState(None, storage_key="sql_agent_session")
 
-            temp_display_history = [
-                ChatMessage(role="user" if isinstance(m, HumanMessage) else "assistant", content=m.content)
-                for m in history_list
-            ]
-            temp_display_history.append(ChatMessage(role="user", content=user_message))
+        async def restore_session(stored_session_id):
+            if not stored_session_id:
+                return [], uuid.uuid4().hex
+            snapshot = await ai_agent.aget_state(_session_config(stored_session_id))
+            history_list = snapshot.values.get("chat_history", [])
+            return _to_display(history_list), stored_session_id
 
-            return "", temp_display_history, initial_agent_state
+        def user_interaction(user_message, display_history):
+            display_history = display_history + [ChatMessage(role="user", content=user_message)]
+            return "", display_history, user_message
 
-        def bot_response(agent_state):
+        async def bot_response(question, display_history, current_session_id):
             full_final_state = {}
-            history_list = agent_state.get("chat_history", [])
-            display_history = [
-                ChatMessage(role="user" if isinstance(m, HumanMessage) else "assistant", content=m.content)
-                for m in history_list
-            ]
-            display_history.append(ChatMessage(role="user", content=agent_state["question"]))
-
-            for step in ai_agent.stream(agent_state):
-                step_name = list(step.keys())[0]
-                step_output = step[step_name]
+            # The conversation up to and including the question; progress messages are added to a copy
+            base_history = list(display_history)
+            display_history = list(display_history)
+            config = _session_config(current_session_id)
+            completed_steps = []
+            answer_message = None
+
+            # Async streaming lets independent plan steps run concurrently; "messages" mode adds the
+            # tokens of the answer as they are generated, interleaved with the node updates
+            async for mode, chunk in ai_agent.astream(
+                {"question": question}, config, stream_mode=["updates", "messages"]
+            ):
+                if mode == "messages":
+                    token, metadata = chunk
+                    if FINAL_ANSWER_TAG not in metadata.get("tags", []) or not token.content:
+                        continue
+                    if answer_message is None:
+                        answer_message = ChatMessage(role="assistant", content="")
+                        display_history.append(answer_message)
+                    answer_message.content += token.content
+                    yield display_history
+                    continue
+
+                step_name = list(chunk.keys())[0]
+                step_output = chunk[step_name]
 
                 full_final_state.update(step_output)
 
@@ -51,62 +71,73 @@ def run_gradio_ui(ai_agent):
                     display_history.append(
                         ChatMessage(role="assistant", content=f"I've created a plan:\n{plan_str}")
                     )
+                elif step_name == "generate_chart" and step_output.get("chart"):
+                    # The chart is shown as soon as it is rendered, even while the answer is still streaming
+                    chart_html = f"<img src='{step_output['chart'].data_uri()}' />"
+                    display_history.append(ChatMessage(role="assistant", content=chart_html))
                 elif step_name == "execute_step":
-                    step_num = step_output.get("current_step", 0)
-                    if step_num > 0:
+                    new_steps = [
+                        i for i in step_output.get("completed_steps", []) if i not in completed_steps
+                    ]
+                    completed_steps.extend(new_steps)
+                    if new_steps:
+                        step_nums = ", ".join(str(i + 1) for i in sorted(new_steps))
+                        label = "Steps" if len(new_steps) > 1 else "Step"
                         display_history.append(
-                            ChatMessage(role="assistant", content=f"Executing Step {step_num}... Done.")
+                            ChatMessage(role="assistant", content=f"Executing {label} {step_nums}... Done.")
                         )
 
-                yield display_history, history_list
+                yield display_history
 
             if not full_final_state:
                 display_history.append(
                     ChatMessage(role="assistant", content="Sorry, an unexpected error occurred.")
                 )
-                yield display_history, history_list
+                yield display_history
                 return
 
-            final_history_list = full_final_state.get("chat_history")
-            chart_path = full_final_state.get("chart_image_path")
-
-            final_display_history = []
-            if final_history_list:
-                for msg in final_history_list[:-1]:  # All messages except the last AI one
-                    role = "user" if isinstance(msg, HumanMessage) else "assistant"
-                    final_display_history.append(ChatMessage(role=role, content=msg.content))
-
-                last_ai_message = final_history_list[-1]
-                ai_text_content = last_ai_message.content
+            # Older checkpoints of the session are never resumed from, so only the latest is kept
+            await ai_agent.checkpointer.aprune([current_session_id])
 
-                display_content = ai_text_content
-                if chart_path:
-                    try:
-                        with open(chart_path, "rb") as f:
-                            chart_data = f.read()
-                        chart_base64 = base64.b64encode(chart_data).decode("utf-8")
-                        display_content = f"""<img src='data:image/png;base64,{chart_base64}' />
-                        {ai_text_content}"""
+            ai_text_content = full_final_state.get("final_answer", "")
+            chart = full_final_state.get("chart")
 
-                    except Exception as e:
-                        print(f"Error reading chart file: {e}")
+            display_content = ai_text_content
+            if chart:
+                display_content = f"""<img src='{chart.data_uri()}' />
+                    {ai_text_content}"""
 
-                final_display_history.append(ChatMessage(role="assistant", content=display_content))
+            yield base_history + [ChatMessage(role="assistant", content=display_content)]
 
-            yield final_display_history, final_history_list
+        question_holder = gr.State()
 
-        agent_state_holder = gr.State()
+        demo.load(restore_session, inputs=[session_id], outputs=[chatbot, session_id])
 
         message.submit(
             user_interaction,
-            inputs=[message, chat_history_state],
-            outputs=[message, chatbot, agent_state_holder],
+            inputs=[message, chatbot],
+            outputs=[message, chatbot, question_holder],
             queue=False,
         ).then(
             bot_response,
-            inputs=[agent_state_holder],
-            outputs=[chatbot, chat_history_state],
+            inputs=[question_holder, chatbot, session_id],
+            outputs=[chatbot],
         )
 
+    # Sessions beyond the concurrency limit wait in the queue (and see their position); once the queue is
+    # full new questions are rejected instead of piling up
+    demo.queue(default_concurrency_limit=UI_CONCURRENCY_LIMIT, max_size=UI_MAX_QUEUE_SIZE)
+
     print("Launching Gradio UI...")
     demo.launch(share=False)
+
+
+def _session_config(session_id: str) -> dict:
+    return {"configurable": {"thread_id": session_id}}
+
+
+def _to_display(history_list) -> list[ChatMessage]:
+    return [
+        ChatMessage(role="user" if isinstance(m, HumanMessage) else "assistant", content=m.content)
+        for m in history_list
+    ]
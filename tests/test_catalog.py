@@ -0,0 +1,164 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from src.data import catalog as catalog_module
+from src.data.catalog import DataCatalog
+from src.tools.sql_engines import SqliteEngine, create_engine
+from src.tools.sql_tool import SqlTool
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    for name, values in (("a", range(1000)), ("b", range(1000, 2000))):
+        pd.DataFrame({"k": list(values), "v": [1.5] * 1000}).to_csv(tmp_path / f"{name}.csv", index=False)
+    # Too small for a single table, so every load evicts the other one
+    catalog = DataCatalog(memory_budget_mb=0.001)
+    catalog.register_directory(str(tmp_path))
+    return catalog
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """Records the loads of file-backed tables; loads of table b wait until `release` is set."""
+    loads = {"paths": [], "started": threading.Event(), "release": threading.Event()}
+    load_data = catalog_module.load_data
+
+    def slow_load_data(file_path, sheet_name=None):
+        loads["paths"].append(file_path)
+        if file_path.endswith("b.csv"):
+            loads["started"].set()
+            assert loads["release"].wait(10)
+        return load_data(file_path, sheet_name)
+
+    monkeypatch.setattr(catalog_module, "load_data", slow_load_data)
+    return loads
+
+
+def test_registering_loads_nothing(tmp_path, loads):
+    pd.DataFrame({"k": [1, 2]}).to_csv(tmp_path / "a.csv", index=False)
+    catalog = DataCatalog()
+    catalog.register_directory(str(tmp_path))
+    assert loads["paths"] == []
+    assert catalog.columns("a") == ["k"]
+    catalog.get("a")
+    # Profiled on the first load
+    assert "k" in catalog.get_schema() and catalog.source("a").profile is not None
+
+
+def test_loaded_table_is_served_while_another_table_loads(catalog, loads):
+    catalog.memory_budget = 1 << 30
+    a = catalog.get("a")
+    with ThreadPoolExecutor(1) as pool:
+        loading_b = pool.submit(catalog.get, "b")
+        assert loads["started"].wait(10)
+        assert catalog.get("a") is a
+        loads["release"].set()
+        assert len(loading_b.result()) == 1000
+
+
+def test_concurrent_requests_share_one_load(catalog, loads):
+    with ThreadPoolExecutor(4) as pool:
+        results = [pool.submit(catalog.get, "b") for _ in range(4)]
+        assert loads["started"].wait(10)
+        loads["release"].set()
+        frames = [result.result() for result in results]
+    assert [path for path in loads["paths"] if path.endswith("b.csv")] == [loads["paths"][0]]
+    assert all(frame is frames[0] for frame in frames)
+
+
+def test_loading_evicts_least_recently_used_table(catalog):
+    catalog.get("a")
+    catalog.get("b")
+    assert list(catalog._loaded) == ["b"]
+
+
+def test_pinned_tables_are_not_evicted_until_released(catalog):
+    with catalog.pinned(["a", "b"]):
+        catalog.get("a")
+        catalog.get("b")
+        assert set(catalog._loaded) == {"a", "b"}
+    assert list(catalog._loaded) == []
+
+
+@pytest.mark.parametrize("engine", ["sqlite", "duckdb"])
+def test_query_joining_tables_over_budget_succeeds(catalog, engine):
+    tool = SqlTool(catalog, engine=create_engine(engine))
+    result = tool.execute_query("SELECT COUNT(*) AS n FROM a JOIN b ON b.k = a.k + 1000")
+    assert isinstance(result, pd.DataFrame), result
+    assert result["n"].tolist() == [1000]
+
+
+def test_table_loaded_by_another_query_does_not_evict_a_running_query_table(catalog):
+    class ConcurrentLoadEngine(SqliteEngine):
+        """Loads another table between registering the query's tables and running it."""
+
+        def execute(self, query, extra_tables=None):
+            catalog.get("b")
+            return super().execute(query, extra_tables)
+
+    tool = SqlTool(catalog, engine=ConcurrentLoadEngine())
+    result = tool.execute_query("SELECT COUNT(*) AS n FROM a")
+    assert isinstance(result, pd.DataFrame), result
+    assert result["n"].tolist() == [1000]
+
+
+def write_csv(path, n: list) -> None:
+    pd.DataFrame({"k": range(len(n)), "n": n}).to_csv(path, index=False)
+    # Some file systems keep whole seconds only; the refresh must see a changed file
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2_000_000_000))
+
+
+@pytest.fixture
+def refreshed(tmp_path):
+    """A loaded table from a CSV file, with the load and append notifications it gets."""
+    path = tmp_path / "t.csv"
+    write_csv(path, [1, 2, 3])
+    catalog = DataCatalog()
+    catalog.register_file(str(path))
+    events = []
+    catalog.on_load(lambda name, df: events.append(("load", len(df))))
+    catalog.on_append(lambda name, rows: events.append(("append", rows["n"].tolist())))
+    catalog.get("t")
+    events.clear()
+    return path, catalog, events
+
+
+def test_refresh_appends_only_the_new_rows(refreshed):
+    path, catalog, events = refreshed
+    tool = SqlTool(catalog, engine=create_engine("sqlite"))
+    assert tool.execute_query("SELECT SUM(n) AS total FROM t")["total"].iloc[0] == 6
+    write_csv(path, [1, 2, 3, 4.5, 5])
+
+    assert catalog.refresh_file(str(path)) == ["t"]
+    assert events == [("append", [4.5, 5.0])]
+    assert catalog.table_version("t") == 1
+    assert catalog.get("t")["n"].tolist() == [1, 2, 3, 4.5, 5]
+    # The column types and the profile describe the new rows too
+    assert pd.api.types.is_float_dtype(catalog.source("t").sample["n"])
+    assert catalog.source("t").profile["columns"]["n"]["max"] == 5
+    assert tool.execute_query("SELECT SUM(n) AS total FROM t")["total"].iloc[0] == 15.5
+
+
+def test_refresh_replaces_changed_rows(refreshed):
+    path, catalog, events = refreshed
+    write_csv(path, [1, 20, 3, 4])
+
+    assert catalog.refresh_file(str(path)) == ["t"]
+    assert events == [("load", 4)]
+    assert catalog.table_version("t") == 1
+    assert catalog.get("t")["n"].tolist() == [1, 20, 3, 4]
+
+
+def test_refresh_of_an_unchanged_file_changes_nothing(refreshed):
+    path, catalog, events = refreshed
+    df = catalog.get("t")
+    write_csv(path, [1, 2, 3])
+
+    assert catalog.refresh_file(str(path)) == []
+    assert events == []
+    assert catalog.get("t") is df and catalog.table_version("t") == 0
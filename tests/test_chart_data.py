@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.tools.chart_data import OTHER_LABEL, lttb, prepare_chart_data
+
+
+@pytest.mark.parametrize("n, threshold", [(1000, 100), (1000, 3), (101, 100), (7, 5)])
+def test_lttb_keeps_the_endpoints_and_threshold_points(n, threshold):
+    rng = np.random.default_rng(0)
+    x = np.arange(n, dtype="float64")
+    y = rng.normal(size=n).cumsum()
+    indices = lttb(x, y, threshold)
+    assert len(indices) == threshold
+    assert indices[0] == 0 and indices[-1] == n - 1
+    assert (np.diff(indices) > 0).all()
+
+
+def test_lttb_keeps_the_extremes():
+    y = np.zeros(1000)
+    y[321], y[654] = 50.0, -50.0
+    indices = lttb(np.arange(1000, dtype="float64"), y, 20)
+    assert {321, 654} <= set(indices)
+
+
+@pytest.mark.parametrize("threshold", [2, 10, 20])
+def test_lttb_returns_every_point_below_the_minimum_or_above_the_length(threshold):
+    assert lttb(np.arange(10.0), np.arange(10.0), threshold).tolist() == list(range(10))
+
+
+def test_line_data_is_downsampled_to_the_limit():
+    df = pd.DataFrame({"day": pd.date_range("2024-01-01", periods=5000, freq="h"), "v": np.arange(5000.0)})
+    data, chart_type = prepare_chart_data(df, "line", "day", "v", max_line_points=200)
+    assert chart_type == "line"
+    assert len(data) == 200
+    assert data["day"].iloc[0] == df["day"].iloc[0] and data["day"].iloc[-1] == df["day"].iloc[-1]
+
+
+def test_dense_numeric_scatter_becomes_a_hexbin():
+    df = pd.DataFrame({"a": np.arange(100.0), "b": np.arange(100.0)})
+    assert prepare_chart_data(df, "scatter", "a", "b", max_scatter_points=10)[1] == "hexbin"
+
+
+def test_bar_categories_beyond_the_limit_are_grouped_into_other():
+    df = pd.DataFrame({"c": list("abcdef"), "v": [6.0, 5.0, 4.0, 3.0, 2.0, 1.0]})
+    data, _ = prepare_chart_data(df, "pie", "c", "v", max_categories=3)
+    assert data["c"].tolist() == ["a", "b", OTHER_LABEL]
+    assert data["v"].tolist() == [6.0, 5.0, 10.0]
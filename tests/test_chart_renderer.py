@@ -0,0 +1,41 @@
+import asyncio
+import os
+import signal
+
+import pandas as pd
+import pytest
+
+from src.tools.chart_renderer import ChartDetails, ChartRenderer
+
+DATA = pd.DataFrame({"month": ["Jan", "Feb", "Mar"], "total": [1.0, 2.0, 3.0]})
+
+
+@pytest.fixture(scope="module")
+def renderer():
+    renderer = ChartRenderer(workers=1)
+    yield renderer
+    renderer._pool.shutdown()
+
+
+def _kill_workers(renderer: ChartRenderer) -> None:
+    # Makes sure the worker has started, then kills it as the OS would under memory pressure
+    renderer._pool.submit(int).result()
+    for process in list(renderer._pool._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+        process.join()
+
+
+def _details(title: str) -> ChartDetails:
+    return ChartDetails(chart_type="bar", x_column="month", y_column="total", title=title)
+
+
+def test_render_replaces_a_broken_pool(renderer):
+    _kill_workers(renderer)
+    chart = renderer.render(DATA, _details("After a crash"))
+    assert chart.data.startswith(b"\x89PNG")
+
+
+def test_arender_replaces_a_broken_pool(renderer):
+    _kill_workers(renderer)
+    chart = asyncio.run(renderer.arender(DATA, _details("After another crash")))
+    assert chart.data.startswith(b"\x89PNG")
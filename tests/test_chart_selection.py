@@ -0,0 +1,61 @@
+import pandas as pd
+import pytest
+
+from src.tools.chart_selection import heuristic_chart_details
+
+MONTHS = pd.date_range("2024-01-01", periods=6, freq="MS")
+
+
+@pytest.mark.parametrize(
+    "df",
+    [
+        pd.DataFrame({"month": MONTHS, "sales": range(6)}),
+        pd.DataFrame({"year": range(2018, 2024), "sales": range(6)}),
+        pd.DataFrame({"month": MONTHS.strftime("%Y-%m"), "sales": range(6)}),
+    ],
+)
+def test_period_and_measure_is_a_line_chart(df):
+    details = heuristic_chart_details(df, "How did sales develop?")
+    assert (details.chart_type, details.x_column, details.y_column) == ("line", df.columns[0], "sales")
+
+
+def test_category_and_measure_is_a_bar_chart():
+    df = pd.DataFrame({"region": ["North", "South", "East"], "sales": [1, 2, 3]})
+    details = heuristic_chart_details(df, "Sales by region")
+    assert (details.chart_type, details.x_column, details.y_column) == ("bar", "region", "sales")
+
+
+def test_chart_type_named_in_the_question_takes_precedence():
+    df = pd.DataFrame({"region": ["North", "South", "East"], "sales": [1, 2, 3]})
+    assert heuristic_chart_details(df, "What is the share of sales per region?").chart_type == "pie"
+
+
+def test_two_measures_are_a_scatter_plot():
+    df = pd.DataFrame({"price": [1.0, 2.0, 3.0], "units": [3, 2, 1]})
+    details = heuristic_chart_details(df, "Price against units")
+    assert (details.chart_type, details.x_column, details.y_column) == ("scatter", "price", "units")
+
+
+def test_measure_named_in_the_question_is_plotted():
+    df = pd.DataFrame({"region": ["North", "South"], "sales": [1, 2], "profit": [3, 4]})
+    assert heuristic_chart_details(df, "Profit per region").y_column == "profit"
+
+
+@pytest.mark.parametrize(
+    "df, question",
+    [
+        # Two measures and neither is named
+        (pd.DataFrame({"region": ["North", "South"], "sales": [1, 2], "profit": [3, 4]}), "Per region"),
+        # Too many categories for a bar chart
+        (pd.DataFrame({"id": [f"c{i}" for i in range(100)], "sales": range(100)}), "Sales per id"),
+        # A period and a category
+        (pd.DataFrame({"year": [2020, 2021], "region": ["North", "South"], "sales": [1, 2]}), "Sales"),
+    ],
+)
+def test_ambiguous_choices_are_left_to_the_llm(df, question):
+    assert heuristic_chart_details(df, question) is None
+
+
+def test_several_chart_types_named_leave_the_rule_choice():
+    df = pd.DataFrame({"region": ["North", "South"], "sales": [1, 2]})
+    assert heuristic_chart_details(df, "A pie or a bar chart of sales").chart_type == "bar"
@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.agent.concurrency import ConcurrencyLimit
+
+
+class Peak:
+    """Counts the callers inside a limit and remembers the highest count."""
+
+    def __init__(self):
+        self.current = self.peak = 0
+        self._lock = threading.Lock()
+
+    def enter(self):
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def exit(self):
+        with self._lock:
+            self.current -= 1
+
+
+def test_limit_must_be_positive():
+    with pytest.raises(ValueError):
+        ConcurrencyLimit("llm", 0)
+
+
+def test_threads_and_coroutines_share_the_limit():
+    limit, peak = ConcurrencyLimit("llm", 2), Peak()
+
+    def in_thread():
+        with limit.hold():
+            peak.enter()
+            time.sleep(0.02)
+            peak.exit()
+
+    async def in_coroutine():
+        async with limit.ahold():
+            peak.enter()
+            await asyncio.sleep(0.02)
+            peak.exit()
+
+    async def run():
+        with ThreadPoolExecutor(4) as pool:
+            threads = [asyncio.get_running_loop().run_in_executor(pool, in_thread) for _ in range(4)]
+            await asyncio.gather(*threads, *(in_coroutine() for _ in range(4)))
+
+    asyncio.run(run())
+    assert peak.peak == 2
+    assert limit.stats() == {"limit": 2, "active": 0, "waiting": 0, "max_waiting": limit.max_waiting}
+    assert limit.max_waiting >= 4
+
+
+def test_waiters_are_served_in_order():
+    limit, order = ConcurrencyLimit("sql", 1), []
+
+    async def call(i: int):
+        async with limit.ahold():
+            order.append(i)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        tasks = []
+        for i in range(5):
+            tasks.append(asyncio.create_task(call(i)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == [0, 1, 2, 3, 4]
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    limit = ConcurrencyLimit("llm", 1)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def holder():
+            async with limit.ahold():
+                await release.wait()
+
+        async def waiter():
+            async with limit.ahold():
+                pass
+
+        held = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(waiter())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        release.set()
+        await held
+        # The slot is free again for the next caller
+        await asyncio.wait_for(waiter(), 1)
+
+    asyncio.run(run())
+    assert limit.stats()["active"] == 0
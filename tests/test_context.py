@@ -0,0 +1,23 @@
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.agent.context import estimate_tokens, summarize_history
+
+
+def test_summary_keeps_the_first_sentence_of_every_dropped_message():
+    messages = [
+        HumanMessage(content="What is the total value in 2019? Per month please."),
+        AIMessage(content="The total is 1,234.56. It grew by 3%."),
+    ]
+    summary = summarize_history("", messages, token_budget=100)
+    assert (
+        summary == "- human: What is the total value in 2019? Per month please.\n- ai: The total is 1,234.56"
+    )
+
+
+def test_summary_drops_its_oldest_lines_beyond_the_budget():
+    summary = ""
+    for i in range(50):
+        summary = summarize_history(summary, [HumanMessage(content=f"Question number {i}")], token_budget=40)
+    assert estimate_tokens(summary) <= 40
+    assert summary.endswith("Question number 49")
+    assert "Question number 0" not in summary
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data.dtypes import compact_dtypes, concat_compact
+from src.tools.sql_engines import create_engine
+
+TABLE = pd.DataFrame(
+    {
+        "day": ["2024-01-31", "2024-02-01", None, "2024-02-01"],
+        "kind": ["a", "b", "a", "a"],
+        "n": [1, 2, 3, 4],
+        "v": [0.5, 1.25, np.nan, 2.0],
+        "price": [0.1, 0.2, 0.3, 0.4],
+    }
+)
+
+
+def test_columns_get_the_smallest_exact_types():
+    df = compact_dtypes(TABLE)
+    assert isinstance(df["kind"].dtype, pd.CategoricalDtype)
+    assert df["n"].dtype == "int8"
+    assert df["v"].dtype == "float32"
+    # 0.1 isn't exact in float32
+    assert df["price"].dtype == "float64"
+
+
+def test_date_text_stays_text():
+    df = compact_dtypes(TABLE, category_max_ratio=0)
+    assert df["day"].dtype == object
+    assert df["day"].tolist() == TABLE["day"].tolist()
+
+
+@pytest.mark.parametrize("engine_name", ["sqlite", "duckdb"])
+def test_query_results_do_not_change(engine_name):
+    query = "SELECT day, kind, SUM(n) AS n, SUM(v) AS v FROM t WHERE day >= '2024-02-01' GROUP BY 1, 2"
+    results = []
+    for df in (TABLE, compact_dtypes(TABLE)):
+        engine = create_engine(engine_name)
+        engine.register("t", df)
+        results.append((engine.execute(query), df))
+    pd.testing.assert_frame_equal(results[1][0], results[0][0], check_dtype=False, check_exact=True)
+
+
+def test_appended_rows_keep_columns_categorical():
+    df = concat_compact(compact_dtypes(TABLE), TABLE.assign(kind=["c", "a", "c", "c"]))
+    assert isinstance(df["kind"].dtype, pd.CategoricalDtype)
+    assert df["kind"].tolist() == TABLE["kind"].tolist() + ["c", "a", "c", "c"]
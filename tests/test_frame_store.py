@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+
+from src.agent.frame_store import FrameStore
+
+FRAME = pd.DataFrame({"v": range(2000)})
+
+
+@pytest.fixture
+def store(tmp_path) -> FrameStore:
+    # Room for about two frames
+    size = len(FRAME.to_parquet())
+    return FrameStore(str(tmp_path / "frames"), max_mb=2.5 * size / 1024 / 1024)
+
+
+def test_frames_round_trip_with_their_column_names(store):
+    df = pd.DataFrame([[1, 2.5, "a"]], columns=["total", "total", 2019])
+    pd.testing.assert_frame_equal(store.get(store.put(df)), df.set_axis(["total", "total", "2019"], axis=1))
+
+
+def test_frames_parquet_cannot_store_are_pickled(store):
+    df = pd.DataFrame({"mixed": [1, "a", 2.5]})
+    ref = store.put(df)
+    assert ref.endswith(".pkl")
+    pd.testing.assert_frame_equal(store.get(ref), df)
+
+
+def test_oldest_frames_are_deleted_beyond_the_budget(store):
+    refs = [store.put(FRAME) for _ in range(3)]
+    with pytest.raises(FileNotFoundError):
+        store.get(refs[0])
+    pd.testing.assert_frame_equal(store.get(refs[2]), FRAME)
+
+
+def test_frames_of_a_running_question_are_kept_until_it_is_released(store):
+    running = store.put(FRAME, owner="question-1")
+    for _ in range(3):
+        store.put(FRAME, owner="question-2")
+        store.release("question-2")
+    pd.testing.assert_frame_equal(store.get(running), FRAME)
+    store.release("question-1")
+    store.put(FRAME)
+    with pytest.raises(FileNotFoundError):
+        store.get(running)
+
+
+def test_deleted_frames_free_their_budget(store):
+    refs = [store.put(FRAME), store.put(FRAME)]
+    store.delete(refs)
+    assert store.stats() == {"files": 0, "bytes": 0}
@@ -0,0 +1,150 @@
+import asyncio
+
+import pandas as pd
+import pytest
+
+from benchmarks.fake_llm import ScriptedChatModel
+from src.agent import graph as graph_module
+from src.agent.frame_store import FrameStore
+from src.agent.graph import FINAL_ANSWER_TAG, build_agent_graph
+from src.agent.sessions import create_checkpointer
+from src.tools.chart_renderer import ChartRenderer
+from src.tools.result_cache import QueryResultCache
+from src.tools.sql_tool import SqlTool
+
+TABLE = pd.DataFrame({"year": [2018, 2018, 2019], "v": [1.5, 2.5, 4.0]})
+ANSWER = "The total value in 2019 was 4.0, up from 4.0 in 2018."
+SCRIPT = {
+    # The synthesis prompt repeats the plan, so it is matched before the step instructions
+    "synthesizing the results of a data analysis plan": ANSWER,
+    "devise a step-by-step plan": (
+        "1. Get the total value per year. [depends on: none]\n"
+        "2. Synthesize the results and answer the user's question. [depends on: 1]"
+    ),
+    "total value per year": "SELECT year, SUM(v) AS total FROM t GROUP BY year ORDER BY year",
+}
+
+
+@pytest.fixture(scope="module")
+def renderer():
+    return ChartRenderer(workers=1)
+
+
+def make_graph(tmp_path, renderer, checkpointer=None, script=SCRIPT, **kwargs):
+    sql_tool = SqlTool.from_dataframe(TABLE, "t")
+    sql_tool.result_cache = QueryResultCache(max_mb=0)
+    return build_agent_graph(
+        sql_tool,
+        llm=ScriptedChatModel(script=script, latency=0, token_delay=0),
+        renderer=renderer,
+        checkpointer=checkpointer,
+        frame_store=FrameStore(str(tmp_path / "frames")),
+        **kwargs,
+    )
+
+
+def test_history_shorter_than_a_turn_is_folded_into_the_summary(tmp_path, renderer, monkeypatch):
+    monkeypatch.setattr(graph_module, "MAX_CONVERSATION_HISTORY", 1)
+    graph = make_graph(tmp_path, renderer, checkpointer=create_checkpointer(str(tmp_path / "sessions.db")))
+    config = {"configurable": {"thread_id": "session"}}
+    for question in ("What is the total value per year?", "And the total value per year again?"):
+        state = graph.invoke({"question": question}, config)
+        assert state["final_answer"] == ANSWER
+    assert state["chat_history"] == []
+    assert "human: And the total value per year again?" in state["history_summary"]
+
+
+async def stream_tokens(graph, question: str) -> tuple[list[str], list[str], dict]:
+    """The answer tokens, the other LLM tokens and the final state of a streamed question."""
+    answer_tokens, other_tokens, state = [], [], {}
+    async for mode, chunk in graph.astream({"question": question}, stream_mode=["updates", "messages"]):
+        if mode == "messages":
+            token, metadata = chunk
+            tokens = answer_tokens if FINAL_ANSWER_TAG in metadata.get("tags", []) else other_tokens
+            tokens.append(token.content)
+        else:
+            for update in chunk.values():
+                state.update(update or {})
+    return answer_tokens, other_tokens, state
+
+
+def test_only_answer_tokens_are_tagged(tmp_path, renderer):
+    graph = make_graph(tmp_path, renderer)
+    answer_tokens, other_tokens, state = asyncio.run(
+        stream_tokens(graph, "What is the total value per year?")
+    )
+    assert len(answer_tokens) > 1
+    assert "".join(answer_tokens) == state["final_answer"] == ANSWER
+    # The plan and the SQL are streamed too, but without the tag the UI shows them as progress only
+    assert any("SELECT" in token for token in other_tokens)
+
+
+def test_concurrent_sessions_keep_their_own_history(tmp_path, renderer):
+    graph = make_graph(tmp_path, renderer, checkpointer=create_checkpointer(str(tmp_path / "sessions.db")))
+
+    async def session(user: int) -> dict:
+        config = {"configurable": {"thread_id": f"user-{user}"}}
+        for i in range(2):
+            state = await graph.ainvoke({"question": f"User {user}: total value per year #{i}?"}, config)
+        return state
+
+    async def run():
+        return await asyncio.gather(*(session(user) for user in range(8)))
+
+    for user, state in enumerate(asyncio.run(run())):
+        assert state["final_answer"] == ANSWER
+        questions = [message.content for message in state["chat_history"] if message.type == "human"]
+        assert questions == [f"User {user}: total value per year #{i}?" for i in range(2)]
+
+
+# Matched before the free-text planner's key, which the structured planning prompt contains too
+STRUCTURED_KEY = "and to write the SQL"
+PLANNED_SQL = "SELECT year, SUM(v) AS planned_total FROM t GROUP BY year ORDER BY year"
+STRUCTURED_PLAN = {
+    "steps": [
+        {"instruction": "Get the total value per year.", "depends_on": [], "sql": PLANNED_SQL},
+        {"instruction": "Chart the totals and answer the question.", "depends_on": [1], "sql": None},
+    ],
+    "chart_requested": False,
+}
+
+
+def structured_script(reply) -> dict:
+    synthesis = "synthesizing the results of a data analysis plan"
+    return {synthesis: SCRIPT[synthesis], STRUCTURED_KEY: reply, **SCRIPT}
+
+
+def test_structured_plan_brings_its_sql_and_chart_intent(tmp_path, renderer):
+    graph = make_graph(
+        tmp_path, renderer, script=structured_script(STRUCTURED_PLAN), structured_planning=True
+    )
+    state = graph.invoke({"question": "What is the total value per year?"})
+    assert state["plan"] == [
+        "1. Get the total value per year.",
+        "2. Chart the totals and answer the question.",
+    ]
+    assert state["step_dependencies"] == [[], [0]]
+    # The planned query ran as is, without a SQL-generation call
+    assert state["step_sql"][0] == PLANNED_SQL
+    # The chart intent is the model's, not the keywords of the steps
+    assert state["chart_requested"] is False
+    assert state["final_answer"] == ANSWER
+
+
+@pytest.mark.parametrize(
+    "reply",
+    [
+        {"steps": "Get the totals", "chart_requested": False},
+        {"steps": [], "chart_requested": False},
+        "Here is the plan: 1. Get the totals.",
+    ],
+)
+def test_invalid_structured_output_falls_back_to_the_planner(tmp_path, renderer, reply):
+    graph = make_graph(tmp_path, renderer, script=structured_script(reply), structured_planning=True)
+    state = graph.invoke({"question": "What is the total value per year?"})
+    assert state["plan"] == [
+        "1. Get the total value per year.",
+        "2. Synthesize the results and answer the user's question.",
+    ]
+    assert state["step_sql"][0] == SCRIPT["total value per year"]
+    assert state["final_answer"] == ANSWER
@@ -0,0 +1,78 @@
+import os
+
+import pandas as pd
+import pytest
+
+from src.data import handler
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "sales.csv"
+    pd.DataFrame({"kind": ["a", "b", "a"], "v": [1.5, 2.5, 3.5]}).to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """Counts the parses of the source file, which the cache is there to avoid."""
+    calls = []
+    read_source = handler._read_source
+
+    def counting_read_source(file_path, sheet_name=None, nrows=None):
+        if nrows is None:
+            calls.append(file_path)
+        return read_source(file_path, sheet_name, nrows)
+
+    monkeypatch.setattr(handler, "_read_source", counting_read_source)
+    return calls
+
+
+def cache_files(source) -> list[str]:
+    return sorted(path.name for path in (source.parent / ".cache").glob("*.feather"))
+
+
+def test_unchanged_file_is_loaded_from_the_cache(source, parses):
+    first = handler.load_data(str(source))
+    second = handler.load_data(str(source))
+    assert len(parses) == 1
+    assert len(cache_files(source)) == 1
+    pd.testing.assert_frame_equal(second, first)
+
+
+def test_touched_file_with_the_same_content_reuses_the_cache(source, parses):
+    handler.load_data(str(source))
+    stat = source.stat()
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    handler.load_data(str(source))
+    handler.load_data(str(source))
+    assert len(parses) == 1
+
+
+def test_changed_file_is_parsed_again_and_replaces_the_cache(source, parses):
+    handler.load_data(str(source))
+    old_files = cache_files(source)
+    pd.DataFrame({"kind": ["c"], "v": [9.0]}).to_csv(source, index=False)
+    df = handler.load_data(str(source))
+    assert len(parses) == 2
+    assert df["v"].tolist() == [9.0]
+    assert len(cache_files(source)) == 1 and cache_files(source) != old_files
+
+
+def test_sample_has_the_cached_types_without_parsing(source, parses):
+    loaded = handler.load_data(str(source))
+    sample = handler.load_sample(str(source))
+    assert sample.empty
+    assert sample.dtypes.to_dict() == loaded.dtypes.to_dict()
+    assert len(parses) == 1
+
+
+def test_cache_compacted_with_another_category_ratio_is_rebuilt(source, parses, monkeypatch):
+    assert not isinstance(handler.load_data(str(source))["kind"].dtype, pd.CategoricalDtype)
+    monkeypatch.setattr(handler, "CATEGORY_MAX_RATIO", 1.0)
+    sample = handler.load_sample(str(source), nrows=1)
+    df = handler.load_data(str(source))
+    assert len(parses) == 2
+    assert isinstance(df["kind"].dtype, pd.CategoricalDtype)
+    # The types of the stale cache aren't used for the sample either
+    assert "kind" in sample and len(sample) == 1
@@ -0,0 +1,79 @@
+from langchain_core.messages import SystemMessage
+
+from benchmarks.fake_llm import ScriptedChatModel
+from src.agent.agent_prompts import planner_system_prompt
+from src.agent.llm_cache import HashingEmbeddings, SqliteLLMCache
+
+SCHEMA = 'CREATE TABLE t ( -- 100 rows\n  "Fiscal Year" INT, -- 2 distinct: 2018, 2019\n  "Value" FLOAT\n)'
+
+
+class CountingChatModel(ScriptedChatModel):
+    calls: int = 0
+
+    def _reply(self, messages):
+        self.calls += 1
+        return super()._reply(messages)
+
+
+def make_llm(tmp_path, semantic: bool = True) -> CountingChatModel:
+    cache = SqliteLLMCache(
+        path=str(tmp_path / "llm_cache.sqlite"), embeddings=HashingEmbeddings() if semantic else None
+    )
+    return CountingChatModel(script={}, default="1. Plan. [depends on: none]", latency=0, cache=cache)
+
+
+def ask(llm: CountingChatModel, question: str, schema: str = SCHEMA) -> str:
+    return llm.invoke([SystemMessage(content=planner_system_prompt(question, "", schema))]).content
+
+
+def test_repeated_prompt_is_answered_from_cache(tmp_path):
+    llm = make_llm(tmp_path, semantic=False)
+    first = ask(llm, "What is the total value in 2019?")
+    assert ask(llm, "What is the total value in 2019?") == first
+    assert llm.calls == 1
+    assert llm.cache.stats()["hits"] == 1
+
+
+def test_cache_persists_across_instances(tmp_path):
+    ask(make_llm(tmp_path), "What is the total value in 2019?")
+    llm = make_llm(tmp_path)
+    ask(llm, "What is the total value in 2019?")
+    assert llm.calls == 0
+
+
+def test_reworded_question_is_a_semantic_hit(tmp_path):
+    llm = make_llm(tmp_path)
+    ask(llm, "What is the total value in 2019?")
+    ask(llm, "what is the TOTAL value in 2019")
+    ask(llm, "In 2019, what is the total value?")
+    assert llm.calls == 1
+    assert llm.cache.stats()["semantic_hits"] == 2
+
+
+def test_different_aggregate_is_a_miss(tmp_path):
+    llm = make_llm(tmp_path)
+    ask(llm, "What is the total value in 2019?")
+    ask(llm, "What is the average value in 2019?")
+    assert llm.calls == 2
+
+
+def test_different_literal_is_a_miss(tmp_path):
+    llm = make_llm(tmp_path)
+    ask(llm, "What is the total value in 2019?")
+    ask(llm, "What is the total value in 2018?")
+    assert llm.calls == 2
+
+
+def test_same_question_on_other_schema_is_a_miss(tmp_path):
+    llm = make_llm(tmp_path)
+    ask(llm, "What is the total value in 2019?")
+    ask(llm, "what is the total value in 2019", schema=SCHEMA.replace("100 rows", "200 rows"))
+    assert llm.calls == 2
+
+
+def test_expired_entries_are_not_returned(tmp_path):
+    llm = make_llm(tmp_path, semantic=False)
+    llm.cache.ttl_seconds = -1
+    ask(llm, "What is the total value in 2019?")
+    ask(llm, "What is the total value in 2019?")
+    assert llm.calls == 2
@@ -0,0 +1,18 @@
+import math
+
+import pytest
+
+from benchmarks.load_test import percentile
+
+
+@pytest.mark.parametrize(
+    "n, q, rank",
+    [(10, 50, 5), (100, 95, 95), (20, 95, 19), (1, 95, 1), (3, 50, 2), (100, 100, 100), (10, 0, 1)],
+)
+def test_percentile_is_the_nearest_rank(n, q, rank):
+    values = [float(i) for i in range(n, 0, -1)]
+    assert percentile(values, q) == rank
+
+
+def test_percentile_of_no_values_is_nan():
+    assert math.isnan(percentile([], 50))
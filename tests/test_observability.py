@@ -0,0 +1,23 @@
+import socket
+
+from src.observability.metrics import start_metrics_server
+from src.observability.tracing import Span, TraceWriter
+
+
+def test_metrics_server_on_busy_port_is_skipped():
+    with socket.socket() as busy:
+        busy.bind(("127.0.0.1", 0))
+        busy.listen()
+        assert start_metrics_server(busy.getsockname()[1]) is None
+
+
+def test_trace_file_is_rotated_at_its_size_limit(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    writer = TraceWriter(str(path), max_mb=2000 / 1024 / 1024, backups=2)
+    for i in range(100):
+        writer.write(Span(f"span-{i}", "node", "trace", None))
+    rotated = sorted(tmp_path.iterdir())
+    assert [file.name for file in rotated] == ["traces.jsonl", "traces.jsonl.1", "traces.jsonl.2"]
+    assert all(file.stat().st_size <= 2000 for file in rotated)
+    # The newest spans are in the current file
+    assert "span-99" in path.read_text()
@@ -0,0 +1,159 @@
+import json
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.agent.plan_library import PlanLibrary
+from src.data.catalog import DataCatalog
+from src.tools.sql_engines import SqliteEngine
+
+DIALECT = "SQLite"
+
+
+@pytest.fixture(scope="module")
+def table() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    rows = 2000
+    return pd.DataFrame(
+        {
+            "d": pd.Timestamp("2018-01-01") + pd.to_timedelta(rng.integers(0, 4 * 365, rows), unit="D"),
+            "year": rng.choice([2018, 2019, 2020, 2021], rows),
+            "kind": rng.choice(["RFBU", "RFAD", "RFIV"], rows),
+            "v": rng.integers(-1000, 1000, rows) * 0.5,
+        }
+    )
+
+
+@pytest.fixture
+def library(tmp_path, table) -> PlanLibrary:
+    catalog = DataCatalog()
+    catalog.register_dataframe("t", table)
+    return PlanLibrary(catalog, path=str(tmp_path / "plans.sqlite"))
+
+
+@pytest.fixture(scope="module")
+def engine(table) -> SqliteEngine:
+    engine = SqliteEngine()
+    engine.register("t", table)
+    return engine
+
+
+def store(library: PlanLibrary, question: str, sql: str) -> bool:
+    plan = [f"1. {question}"]
+    return library.add(question, DIALECT, plan, [[]], [sql])
+
+
+def replay(library: PlanLibrary, question: str) -> str | None:
+    match = library.match(question, DIALECT)
+    return None if match is None else match.sql[0]
+
+
+def assert_same_result(engine: SqliteEngine, replayed: str, expected: str) -> None:
+    pd.testing.assert_frame_equal(engine.execute(replayed), engine.execute(expected), check_exact=True)
+
+
+def test_replayed_sql_uses_the_new_number(library, engine):
+    sql = "SELECT SUM(v) AS total FROM t WHERE year = 2019"
+    assert store(library, "What is the total value in 2019?", sql)
+    replayed = replay(library, "What is the total value in 2021?")
+    assert_same_result(engine, replayed, "SELECT SUM(v) AS total FROM t WHERE year = 2021")
+
+
+def test_replayed_sql_uses_the_new_column_value(library, engine):
+    sql = "SELECT COUNT(*) AS n FROM t WHERE kind IN ('RFBU') AND v BETWEEN 100 AND 400"
+    assert store(library, "How many RFBU rows have a value between 100 and 400?", sql)
+    replayed = replay(library, "How many RFIV rows have a value between 20 and 300?")
+    expected = "SELECT COUNT(*) AS n FROM t WHERE kind IN ('RFIV') AND v BETWEEN 20 AND 300"
+    assert_same_result(engine, replayed, expected)
+
+
+def test_replayed_limit_uses_the_new_count(library, engine):
+    sql = "SELECT year, SUM(v) AS total FROM t GROUP BY year ORDER BY total DESC LIMIT 3"
+    assert store(library, "Top 3 years by value", sql)
+    replayed = replay(library, "Top 2 years by value")
+    assert_same_result(engine, replayed, sql.replace("LIMIT 3", "LIMIT 2"))
+
+
+def test_literal_repeated_in_a_function_argument_is_not_stored(library):
+    sql = "SELECT substr(d, 1, 4) AS year, SUM(v) AS total FROM t GROUP BY 1 ORDER BY 2 DESC LIMIT 4"
+    assert not store(library, "Top 4 years by value", sql)
+    assert replay(library, "Top 7 years by value") is None
+
+
+def test_literal_used_as_an_ordinal_is_not_stored(library):
+    sql = "SELECT kind, year, SUM(v) AS total FROM t GROUP BY 1, 2 ORDER BY 2 LIMIT 2"
+    assert not store(library, "First 2 kinds and years by value", sql)
+
+
+def test_literal_inside_a_longer_string_is_not_stored(library):
+    assert not store(library, "Rows of 2019", "SELECT COUNT(*) FROM t WHERE d LIKE '2019-%'")
+
+
+def test_literal_in_other_casing_is_not_stored(library, engine):
+    # The LLM fixed the casing; replaying the SQL with 'rfiv' as written would find no rows
+    assert not store(library, "How many 'rfbu' rows?", "SELECT COUNT(*) AS n FROM t WHERE kind = 'RFBU'")
+    assert replay(library, "How many 'rfiv' rows?") is None
+
+
+def test_quoted_literal_in_the_same_casing_is_replayed(library, engine):
+    assert store(library, "How many 'RFBU' rows?", "SELECT COUNT(*) AS n FROM t WHERE kind = 'RFBU'")
+    replayed = replay(library, "How many 'RFIV' rows?")
+    assert_same_result(engine, replayed, "SELECT COUNT(*) AS n FROM t WHERE kind = 'RFIV'")
+
+
+def test_near_match_with_a_different_word_is_rejected(tmp_path, table):
+    catalog = DataCatalog()
+    catalog.register_dataframe("t", table)
+    library = PlanLibrary(catalog, path=str(tmp_path / "plans.sqlite"), similarity_threshold=0.5)
+    sql = "SELECT kind FROM t WHERE year = 2019 GROUP BY kind ORDER BY AVG(v) DESC LIMIT 1"
+    assert store(library, "Which kind has the highest average value in 2019?", sql)
+    assert library.match("Which kind has the lowest average value in 2019?", DIALECT) is None
+
+
+def test_reordered_question_reuses_only_the_plan(tmp_path, table):
+    catalog = DataCatalog()
+    catalog.register_dataframe("t", table)
+    library = PlanLibrary(catalog, path=str(tmp_path / "plans.sqlite"), similarity_threshold=0.5)
+    assert store(
+        library, "What is the total value in 2019?", "SELECT SUM(v) AS total FROM t WHERE year = 2019"
+    )
+    match = library.match("In 2021, what is the total value?", DIALECT)
+    assert match is not None and match.confidence < 1.0
+    assert match.plan == ["1. What is the total value in 2021?"]
+    assert match.sql == [None]
+
+
+def test_library_without_chart_column_keeps_chart_intent(tmp_path, table):
+    path = str(tmp_path / "plans.sqlite")
+    connection = sqlite3.connect(path)
+    connection.execute("""CREATE TABLE plan_library (
+            signature TEXT NOT NULL, dialect TEXT NOT NULL, plan TEXT NOT NULL, dependencies TEXT NOT NULL,
+            sql TEXT NOT NULL, uses INTEGER NOT NULL, last_used REAL NOT NULL,
+            PRIMARY KEY (signature, dialect)
+        )""")
+    rows = [
+        ("total value by year", ["1. Total value by year", "2. Plot it as a bar chart"]),
+        ("total value by kind", ["1. Total value by kind"]),
+    ]
+    connection.executemany(
+        "INSERT INTO plan_library VALUES (?, ?, ?, ?, ?, 1, 0)",
+        [
+            (
+                signature,
+                DIALECT,
+                json.dumps(plan),
+                json.dumps([[]] * len(plan)),
+                json.dumps([None] * len(plan)),
+            )
+            for signature, plan in rows
+        ],
+    )
+    connection.commit()
+    connection.close()
+    catalog = DataCatalog()
+    catalog.register_dataframe("t", table)
+    library = PlanLibrary(catalog, path=path)
+    assert library.match("Total value by year", DIALECT).chart_requested
+    assert not library.match("Total value by kind", DIALECT).chart_requested
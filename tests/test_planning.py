@@ -0,0 +1,70 @@
+from src.agent.planning import PlannedStep, StructuredPlan, parse_plan, ready_steps, structured_plan_steps
+
+PLAN = """Here is the plan:
+1. Get the total value in 2018. [depends on: none]
+2. Get the total value in 2019. [depends on: none]
+3. Compute the difference between the totals. [depends on: 1, 2]
+4. Summarize the result.
+"""
+
+
+def waves(dependencies: list[list[int]]) -> list[list[int]]:
+    """The groups of steps run together, each once the previous groups are done."""
+    completed, waves = [], []
+    while wave := ready_steps(dependencies, completed):
+        waves.append(wave)
+        completed.extend(wave)
+    return waves
+
+
+def test_parse_plan_reads_steps_and_dependencies():
+    plan, dependencies = parse_plan(PLAN)
+    assert plan == [
+        "1. Get the total value in 2018.",
+        "2. Get the total value in 2019.",
+        "3. Compute the difference between the totals.",
+        "4. Summarize the result.",
+    ]
+    # Unannotated steps depend on every step before them
+    assert dependencies == [[], [], [0, 1], [0, 1, 2]]
+
+
+def test_parse_plan_ignores_forward_and_unknown_dependencies():
+    _, dependencies = parse_plan("1. A [depends on: 2]\n2. B [Depends On: 1, 1, 7]\n3. C [depends on: 0]")
+    assert dependencies == [[], [0], []]
+
+
+def test_independent_steps_run_in_the_same_wave():
+    _, dependencies = parse_plan(PLAN)
+    assert waves(dependencies) == [[0, 1], [2], [3]]
+
+
+def test_steps_without_annotations_run_one_after_another():
+    _, dependencies = parse_plan("1. A\n2. B\n3. C")
+    assert waves(dependencies) == [[0], [1], [2]]
+
+
+def test_ready_steps_skips_completed_steps():
+    assert ready_steps([[], [], [0, 1]], completed=[1]) == [0]
+    assert ready_steps([[], [], [0, 1]], completed=[0, 1, 2]) == []
+
+
+def test_structured_plan_becomes_numbered_steps_with_their_sql():
+    structured = StructuredPlan(
+        steps=[
+            PlannedStep(instruction=" Get the total value in 2018. ", sql=" SELECT SUM(v) FROM t "),
+            PlannedStep(instruction="Get the total value in 2019.", depends_on=[2], sql="SELECT 1"),
+            # Step numbers are 1-based; itself, later and unknown steps are no dependencies
+            PlannedStep(instruction="Compare the totals.", depends_on=[1, 2, 2, 3, 7, 0], sql="  "),
+        ],
+        chart_requested=True,
+    )
+    plan, dependencies, sql = structured_plan_steps(structured)
+    assert plan == [
+        "1. Get the total value in 2018.",
+        "2. Get the total value in 2019.",
+        "3. Compare the totals.",
+    ]
+    assert dependencies == [[], [], [0, 1]]
+    assert sql == ["SELECT SUM(v) FROM t", "SELECT 1", None]
+    assert waves(dependencies) == [[0, 1], [2]]
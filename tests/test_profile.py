@@ -0,0 +1,27 @@
+import pandas as pd
+import pytest
+
+from src.data.profile import profile_dataframe
+from src.tools.sql_engines import create_engine
+
+DATES = pd.DataFrame({"d": pd.to_datetime(["2020-01-01", "2020-01-02", "2020-01-03"]), "v": [1, 2, 3]})
+
+
+@pytest.mark.parametrize("engine_name", ["sqlite", "duckdb"])
+def test_profiled_dates_compare_equal_in_the_engines(engine_name):
+    stats = profile_dataframe(DATES)["columns"]["d"]
+    engine = create_engine(engine_name)
+    engine.register("t", DATES)
+    first, last = stats["min"], stats["max"]
+    assert engine.execute(f"SELECT SUM(v) AS s FROM t WHERE d = '{first}'")["s"].tolist() == [1]
+    # The range shown in the profile includes its last day
+    result = engine.execute(f"SELECT SUM(v) AS s FROM t WHERE d >= '{first}' AND d <= '{last}'")
+    assert result["s"].tolist() == [6]
+
+
+def test_profiled_dates_match_query_results():
+    stats = profile_dataframe(DATES)["columns"]["d"]
+    for engine_name in ("sqlite", "duckdb"):
+        engine = create_engine(engine_name)
+        engine.register("t", DATES)
+        assert engine.execute("SELECT MAX(d) AS d FROM t")["d"].tolist() == [stats["max"]]
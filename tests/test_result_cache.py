@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+
+from src.data.catalog import DataCatalog
+from src.tools.result_cache import QueryResultCache, normalize_sql
+from src.tools.sql_tool import SqlTool
+
+QUERY = "SELECT SUM(v) AS total FROM t"
+
+
+@pytest.fixture
+def tool() -> SqlTool:
+    catalog = DataCatalog()
+    catalog.register_dataframe("t", pd.DataFrame({"v": [1, 2, 3]}))
+    return SqlTool(catalog, result_cache=QueryResultCache())
+
+
+def test_normalized_queries_share_a_result():
+    assert normalize_sql("select  SUM(v)\nFROM t;") == normalize_sql("SELECT sum(v) FROM T")
+    assert normalize_sql("SELECT * FROM t WHERE k = 'A'") != normalize_sql("SELECT * FROM t WHERE k = 'a'")
+
+
+def test_repeated_query_is_served_from_the_cache(tool):
+    first = tool.execute_query(QUERY)
+    second = tool.execute_query("select sum(v) as total from t;")
+    pd.testing.assert_frame_equal(second, first)
+    assert tool.result_cache.hits == 1
+
+
+def test_cached_result_is_a_copy(tool):
+    tool.execute_query(QUERY)["total"] = -1
+    assert tool.execute_query(QUERY)["total"].tolist() == [6]
+
+
+def test_appended_rows_invalidate_the_cached_result(tool):
+    assert tool.execute_query(QUERY)["total"].tolist() == [6]
+    tool.catalog.append_rows("t", pd.DataFrame({"v": [10]}))
+    assert tool.execute_query(QUERY)["total"].tolist() == [16]
+    assert tool.result_cache.hits == 0
+
+
+def test_replaced_table_invalidates_the_cached_result(tool):
+    tool.execute_query(QUERY)
+    tool.catalog.register_dataframe("t", pd.DataFrame({"v": [100]}))
+    assert tool.execute_query(QUERY)["total"].tolist() == [100]
+    assert tool.result_cache.hits == 0
+
+
+def test_cache_drops_least_recently_used_results_over_its_budget():
+    df = pd.DataFrame({"v": range(1000)})
+    cache = QueryResultCache(max_mb=2.5 * df.memory_usage(deep=True).sum() / 1024 / 1024)
+    for key in ("a", "b", "c"):
+        cache.put(key, df)
+    assert cache.get("a") is None
+    assert cache.get("c") is not None
@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data.catalog import DataCatalog
+from src.data.dtypes import compact_dtypes
+from src.tools.rollups import Rollups
+from src.tools.sql_engines import create_engine
+from src.tools.sql_tool import SqlTool
+
+SPECS = {"t": {"dimensions": ["year", "kind"], "measures": ["v", "n"]}}
+
+
+def make_table(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "year": rng.choice([2019, 2020, 2021], rows),
+            "kind": rng.choice(["RFBU", "RFAD", "RFIV"], rows),
+            # Multiples of 0.25 are exact in float32, so compaction narrows them
+            "v": rng.integers(0, 1_000_000, rows) * 0.25,
+            "n": rng.integers(-100, 100, rows),
+        }
+    )
+
+
+def make_tool(df: pd.DataFrame, engine_name: str) -> SqlTool:
+    catalog = DataCatalog()
+    catalog.register_dataframe("t", df)
+    return SqlTool(catalog, engine=create_engine(engine_name), rollups=Rollups(catalog, SPECS))
+
+
+def scan(tool: SqlTool, query: str) -> pd.DataFrame:
+    """The query's result from the base table, bypassing rollups and caches."""
+    tool.engine.register("t", tool.catalog.get("t"))
+    # Float sums are rounded to the measure's decimal places on the base table too
+    rewrite = tool.rollups.rewrite(query, tool.engine.dialect)
+    return tool.engine.execute(rewrite.base_query if rewrite is not None else query)
+
+
+def assert_answered_from_rollup(tool: SqlTool, query: str) -> None:
+    hits = tool.rollups.hits
+    result = tool.execute_query(query)
+    assert isinstance(result, pd.DataFrame), result
+    assert tool.rollups.hits == hits + 1
+    # Exact: a financial total that is only close is wrong
+    pd.testing.assert_frame_equal(result, scan(tool, query), check_dtype=False, check_exact=True)
+
+
+@pytest.mark.parametrize("engine_name", ["sqlite", "duckdb"])
+@pytest.mark.parametrize(
+    "query",
+    [
+        "SELECT SUM(v) AS total FROM t",
+        "SELECT AVG(v) AS average FROM t",
+        "SELECT year, SUM(v) AS total, AVG(v) AS average FROM t GROUP BY year ORDER BY year",
+        "SELECT kind, MIN(v), MAX(v), COUNT(v), COUNT(*) FROM t WHERE year = 2020 GROUP BY 1 ORDER BY 1",
+        "SELECT SUM(n) AS total FROM t WHERE kind IN ('RFBU', 'RFAD')",
+    ],
+)
+def test_rollup_on_compacted_float32_measures_matches_table_scan(engine_name, query):
+    df = compact_dtypes(make_table(200_000))
+    assert df["v"].dtype == "float32"
+    assert_answered_from_rollup(make_tool(df, engine_name), query)
+
+
+@pytest.mark.parametrize("engine_name", ["sqlite", "duckdb"])
+def test_rollup_merged_with_appended_rows_matches_table_scan(engine_name):
+    tool = make_tool(compact_dtypes(make_table(100_000)), engine_name)
+    tool.execute_query("SELECT SUM(v) FROM t")
+    tool.catalog.append_rows("t", compact_dtypes(make_table(100_000, seed=1)))
+    assert_answered_from_rollup(tool, "SELECT year, SUM(v) AS total, AVG(v) AS average FROM t GROUP BY year")
+
+
+@pytest.mark.parametrize("engine_name", ["sqlite", "duckdb"])
+@pytest.mark.parametrize(
+    "query",
+    [
+        "SELECT kind, SUM(v) AS total FROM t GROUP BY kind HAVING total > 0 ORDER BY total DESC",
+        "SELECT t.year, SUM(t.v) AS total FROM t GROUP BY t.year ORDER BY t.year",
+        "SELECT COUNT(*) AS rows_count, COUNT(v) AS values_count FROM t WHERE year = 1990",
+        "SELECT year, COUNT(v) AS values_count, AVG(v) AS average FROM t GROUP BY year ORDER BY year",
+    ],
+)
+def test_rewritten_query_matches_table_scan(engine_name, query):
+    df = make_table(50_000)
+    # Missing measures are skipped by COUNT and AVG, in the rollup as in the table
+    df.loc[df.index % 7 == 0, "v"] = np.nan
+    assert_answered_from_rollup(make_tool(compact_dtypes(df), engine_name), query)
+
+
+@pytest.mark.parametrize("engine_name", ["sqlite", "duckdb"])
+@pytest.mark.parametrize(
+    "query",
+    [
+        "SELECT SUM(v) AS total FROM t WHERE n > 0",
+        "SELECT year, COUNT(DISTINCT kind) AS kinds FROM t GROUP BY year ORDER BY year",
+        "SELECT SUM(v * 2) AS total FROM t",
+    ],
+)
+def test_query_outside_the_rollup_reads_the_table(engine_name, query):
+    tool = make_tool(compact_dtypes(make_table(10_000)), engine_name)
+    result = tool.execute_query(query)
+    assert tool.rollups.hits == 0
+    pd.testing.assert_frame_equal(result, scan(tool, query), check_exact=True)
+
+
+def cents_table(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(2)
+    return pd.DataFrame(
+        {
+            "year": rng.choice([2019, 2020, 2021], rows),
+            "kind": rng.choice(["RFBU", "RFAD", "RFIV"], rows),
+            "v": rng.integers(-(10**11), 10**11, rows) / 100,
+            "n": rng.integers(-100, 100, rows),
+        }
+    )
+
+
+@pytest.mark.parametrize("engine_name", ["sqlite", "duckdb"])
+def test_rollup_sums_of_cents_are_the_exact_totals(engine_name):
+    df = cents_table(300_000)
+    tool = make_tool(df, engine_name)
+    query = "SELECT year, SUM(v) AS total, AVG(v) AS average FROM t GROUP BY year ORDER BY year"
+    result = tool.execute_query(query)
+    assert tool.rollups.hits == 1
+    # The exact sum in cents; summing the floats in any order is off in the last bits
+    cents = (df["v"] * 100).round().astype("int64").groupby(df["year"]).agg(["sum", "count"])
+    total = cents["sum"] / 100
+    expected = pd.DataFrame({"year": cents.index, "total": total, "average": total / cents["count"]})
+    pd.testing.assert_frame_equal(
+        result, expected.reset_index(drop=True), check_dtype=False, check_exact=True
+    )
+    pd.testing.assert_frame_equal(result, scan(tool, query), check_exact=True)
+
+
+@pytest.mark.parametrize("engine_name", ["sqlite", "duckdb"])
+def test_sum_of_floats_without_decimal_places_reads_the_table(engine_name):
+    df = make_table(10_000).assign(v=np.random.default_rng(3).random(10_000))
+    tool = make_tool(df, engine_name)
+    tool.execute_query("SELECT SUM(v) FROM t")
+    assert tool.rollups.hits == 0
+    assert_answered_from_rollup(tool, "SELECT year, MIN(v), MAX(v), COUNT(v) FROM t GROUP BY year")
+
+
+def file_tool(path) -> SqlTool:
+    catalog = DataCatalog()
+    catalog.register_file(str(path))
+    specs = {path.stem: SPECS["t"]}
+    return SqlTool(catalog, engine=create_engine("sqlite"), rollups=Rollups(catalog, specs))
+
+
+def test_cached_rollup_answers_without_loading_the_table(tmp_path):
+    path = tmp_path / "sales.csv"
+    cents_table(20_000).to_csv(path, index=False)
+    query = "SELECT kind, SUM(v) AS total, COUNT(*) AS row_count FROM sales GROUP BY kind ORDER BY kind"
+    expected = file_tool(path).execute_query(query)
+
+    # A restart: the rollup cached next to the file answers without loading the table
+    tool = file_tool(path)
+    pd.testing.assert_frame_equal(tool.execute_query(query), expected, check_exact=True)
+    assert tool.rollups.hits == 1
+    assert not tool.catalog.is_loaded("sales")
+    # A query the rollup can't answer loads the table as before
+    assert isinstance(tool.execute_query("SELECT SUM(v) FROM sales WHERE n > 0"), pd.DataFrame)
+    assert tool.catalog.is_loaded("sales")
+
+
+def test_cached_rollup_of_a_changed_file_is_rebuilt(tmp_path):
+    path = tmp_path / "sales.csv"
+    df = cents_table(1_000)
+    df.to_csv(path, index=False)
+    query = "SELECT SUM(n) AS total FROM sales"
+    file_tool(path).execute_query(query)
+
+    df.assign(n=df["n"] + 1).to_csv(path, index=False)
+    tool = file_tool(path)
+    assert tool.execute_query(query)["total"].iloc[0] == df["n"].sum() + len(df)
+    assert tool.catalog.is_loaded("sales")
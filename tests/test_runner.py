@@ -0,0 +1,118 @@
+import asyncio
+import io
+import json
+
+import pandas as pd
+import pytest
+
+from benchmarks.fake_llm import ScriptedChatModel
+from src.agent.frame_store import FrameStore
+from src.agent.graph import build_agent_graph
+from src.batch import runner
+from src.tools.chart_renderer import ChartRenderer
+from src.tools.result_cache import QueryResultCache
+from src.tools.sql_tool import SqlTool
+
+TABLE = pd.DataFrame({"year": [2018, 2018, 2019], "v": [1.5, 2.5, 4.0]})
+SCRIPT = {
+    "synthesizing the results of a data analysis plan": "The total was 4.0 in both years.",
+    "devise a step-by-step plan": (
+        "1. Get the total value per year. [depends on: none]\n"
+        "2. Synthesize the results and answer the user's question. [depends on: 1]"
+    ),
+    "total value per year": "SELECT year, SUM(v) AS total FROM t GROUP BY year ORDER BY year",
+}
+
+
+@pytest.fixture
+def frame_store(tmp_path, monkeypatch):
+    store = FrameStore(str(tmp_path / "frames"))
+    # The runner writes the step results from the store the graph spilled them to
+    monkeypatch.setattr(runner, "FRAME_STORE", store)
+    return store
+
+
+@pytest.fixture(scope="module")
+def renderer():
+    return ChartRenderer(workers=1)
+
+
+@pytest.fixture
+def graph(frame_store, renderer):
+    sql_tool = SqlTool.from_dataframe(TABLE, "t")
+    sql_tool.result_cache = QueryResultCache(max_mb=0)
+    return build_agent_graph(
+        sql_tool,
+        llm=ScriptedChatModel(script=SCRIPT, latency=0, token_delay=0),
+        renderer=renderer,
+        frame_store=frame_store,
+    )
+
+
+class FailingGraph:
+    async def ainvoke(self, state):
+        raise RuntimeError("LLM unavailable")
+
+
+def write_questions(path, items: list) -> None:
+    path.write_text("\n".join(json.dumps(item) for item in items) + "\n\n", encoding="utf-8")
+
+
+def results(output_dir) -> list[dict]:
+    return [json.loads(line) for line in (output_dir / runner.RESULTS_FILE).read_text().splitlines()]
+
+
+def test_questions_without_an_id_are_numbered_by_line(tmp_path):
+    path = tmp_path / "questions.jsonl"
+    write_questions(path, [{"id": "revenue", "question": "A?"}, {"question": "B?"}])
+    assert runner.read_questions(str(path)) == [
+        {"id": "revenue", "question": "A?"},
+        {"id": "q0002", "question": "B?"},
+    ]
+
+
+def test_answered_ids_count_the_last_record_of_a_question(tmp_path):
+    records = [
+        {"id": "a", "status": "failed"},
+        {"id": "a", "status": "ok"},
+        {"id": "b", "status": "ok"},
+        {"id": "b", "status": "error"},
+    ]
+    write_questions(tmp_path / runner.RESULTS_FILE, records)
+    assert runner.answered_ids(tmp_path) == {"a"}
+    assert runner.answered_ids(tmp_path / "new") == set()
+
+
+def test_batch_writes_answers_sql_and_step_tables(tmp_path, graph, frame_store):
+    questions = [
+        {"id": "totals/2019", "question": "What is the total value per year?"},
+        {"id": "again", "question": "And the total value per year again?"},
+    ]
+    summary = asyncio.run(runner.run_batch(graph, questions, tmp_path, concurrency=2, log=io.StringIO()))
+    assert (summary["ok"], summary["error"], summary["failed"]) == (2, 0, 0)
+
+    record = {r["id"]: r for r in results(tmp_path)}["totals/2019"]
+    assert (
+        record["status"] == "ok"
+        and record["answer"] == SCRIPT["synthesizing the results of a data analysis plan"]
+    )
+    assert record["steps"][0]["sql"] == SCRIPT["total value per year"]
+    # Ids are made safe to use as folder names
+    question_dir = tmp_path / "totals_2019"
+    assert (question_dir / "answer.md").read_text() == record["answer"]
+    step = pd.read_csv(tmp_path / record["steps"][0]["table"])
+    assert step.to_dict("list") == {"year": [2018, 2019], "total": [4.0, 4.0]}
+    # The spilled results are deleted once written out
+    assert not any(frame_store.directory.iterdir())
+
+
+def test_failed_questions_are_recorded_and_retried_on_the_next_run(tmp_path, graph):
+    questions = [{"id": "q1", "question": "What is the total value per year?"}]
+    summary = asyncio.run(runner.run_batch(FailingGraph(), questions, tmp_path, 1, log=io.StringIO()))
+    assert summary["failed"] == 1
+    assert results(tmp_path)[0]["error"] == "LLM unavailable"
+    assert runner.answered_ids(tmp_path) == set()
+
+    asyncio.run(runner.run_batch(graph, questions, tmp_path, 1, log=io.StringIO()))
+    assert [r["status"] for r in results(tmp_path)] == ["failed", "ok"]
+    assert runner.answered_ids(tmp_path) == {"q1"}
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data.dtypes import compact_dtypes
+from src.tools.sql_engines import DuckDbEngine, SqliteEngine, alias_projections
+
+# Registered frames are held, like the catalog holds them: the engine identifies frames by id
+TABLE = pd.DataFrame({"v": [1, 2, 3]})
+RELOADED_TABLE = pd.DataFrame({"v": [10, 20, 30]})
+
+_rng = np.random.default_rng(0)
+PARITY_TABLE = compact_dtypes(
+    pd.DataFrame(
+        {
+            "Posting Date": pd.Timestamp("2019-01-01")
+            + pd.to_timedelta(_rng.integers(0, 730, 500), unit="D"),
+            "Bus. Transac. Type": _rng.choice(["RFBU", "RFAD", "RFIV"], 500),
+            "Transaction Value": _rng.integers(-10_000, 10_000, 500) * 0.25,
+            "Fiscal Year": _rng.choice([2019, 2020], 500),
+            "Note": [None] * 500,
+            "Empty Value": np.nan,
+        }
+    )
+)
+PARITY_QUERIES = [
+    'SELECT COUNT(*), SUM("Transaction Value") FROM t',
+    'SELECT "Bus. Transac. Type", count(*) , avg( "Transaction Value" ) FROM t GROUP BY 1 ORDER BY 1',
+    'SELECT "Fiscal Year", MAX("Posting Date"), MIN("Posting Date") FROM t GROUP BY 1 ORDER BY 1',
+    'SELECT t."Fiscal Year", ("Transaction Value"), "Transaction Value" * 2 FROM t ORDER BY 2, 1 LIMIT 20',
+    'SELECT SUM("Empty Value"), MAX("Note"), COUNT("Note") FROM t',
+    'SELECT "Note", "Empty Value", "Posting Date" FROM t ORDER BY "Posting Date" LIMIT 5',
+    'SELECT "Fiscal Year", SUM("Transaction Value") FROM t WHERE "Fiscal Year" = 1990 GROUP BY 1',
+    'SELECT CASE WHEN "Transaction Value" > 0 THEN "Fiscal Year" END FROM t ORDER BY 1 LIMIT 50',
+    "SELECT \"Bus. Transac. Type\" = 'RFBU', COUNT(*) AS n FROM t GROUP BY 1 ORDER BY 1",
+    'WITH y AS (SELECT "Fiscal Year" AS fy, SUM("Transaction Value") AS total FROM t GROUP BY 1) '
+    "SELECT MAX(total) - MIN(total) FROM y",
+]
+
+
+@pytest.fixture
+def engine():
+    engine = SqliteEngine(pool_size=1)
+    engine.register("t", TABLE)
+    return engine
+
+
+def _reader_in_transaction(engine: SqliteEngine) -> bool:
+    reader = engine._readers.get()
+    try:
+        return reader.in_transaction
+    finally:
+        engine._readers.put(reader)
+
+
+def test_extra_tables_leave_no_open_transaction(engine):
+    result = engine.execute("SELECT SUM(v) AS s FROM t, step_1", {"step_1": pd.DataFrame({"x": [1]})})
+    assert result["s"].tolist() == [6]
+    assert not _reader_in_transaction(engine)
+
+
+def test_failed_query_with_extra_tables_leaves_no_open_transaction(engine):
+    with pytest.raises(Exception, match="no such column"):
+        engine.execute("SELECT missing FROM t", {"step_1": pd.DataFrame({"x": [1]})})
+    assert not _reader_in_transaction(engine)
+
+
+def test_reader_sees_reloaded_table_after_query_with_extra_tables(engine):
+    engine.execute("SELECT COUNT(*) FROM t, step_1", {"step_1": pd.DataFrame({"x": [1]})})
+    engine.register("t", RELOADED_TABLE)
+    assert engine.execute("SELECT SUM(v) AS s FROM t")["s"].tolist() == [60]
+
+
+@pytest.fixture(scope="module")
+def engines():
+    engines = SqliteEngine(), DuckDbEngine()
+    for engine in engines:
+        engine.register("t", PARITY_TABLE)
+    return engines
+
+
+@pytest.mark.parametrize("query", PARITY_QUERIES)
+def test_engines_return_identical_results(engines, query):
+    sqlite_result, duckdb_result = (engine.execute(query) for engine in engines)
+    pd.testing.assert_frame_equal(duckdb_result, sqlite_result, check_exact=True)
+
+
+def test_alias_projections_names_computed_columns_after_their_text():
+    query = "SELECT kind, t.v, (v), sum( v ) , COUNT(*) AS n, upper('a, b') FROM t GROUP BY 1 UNION SELECT 1"
+    assert alias_projections(query, "DuckDB") == (
+        "SELECT kind, t.v, (v), sum( v ) AS \"sum( v )\" , COUNT(*) AS n, upper('a, b') AS \"upper('a, b')\" "
+        "FROM t GROUP BY 1 UNION SELECT 1"
+    )
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.tools.sql_engines import create_engine
+from src.tools.sql_repair import SqlRepairer
+
+TABLE = pd.DataFrame(
+    {
+        "Order Date": pd.date_range("2020-01-01", periods=300, freq="D"),
+        "customer.name": np.resize(["Ann", "Bob", "Cid"], 300),
+        "Revenue": np.arange(300) * 1.5,
+    }
+)
+SCHEMA = {"sales": list(TABLE.columns)}
+ENGINE_NAMES = {"SQLite": "sqlite", "DuckDB": "duckdb"}
+
+
+@pytest.fixture(scope="module", params=list(ENGINE_NAMES))
+def dialect(request) -> str:
+    return request.param
+
+
+@pytest.fixture(scope="module")
+def engine(dialect):
+    engine = create_engine(ENGINE_NAMES[dialect])
+    engine.register("sales", TABLE)
+    return engine
+
+
+@pytest.mark.parametrize(
+    "broken, expected",
+    [
+        (
+            "SELECT SUM(Revenue) FROM sales;",
+            "SELECT SUM(Revenue) FROM sales",
+        ),
+        (
+            "SELECT customer.name, SUM(Revenue) AS s FROM sales GROUP BY customer.name ORDER BY s",
+            'SELECT "customer.name", SUM(Revenue) AS s FROM sales GROUP BY "customer.name" ORDER BY s',
+        ),
+        (
+            "SELECT COUNT(*) AS n FROM sales WHERE `Order Date` >= '2020-06-01'",
+            "SELECT COUNT(*) AS n FROM sales WHERE \"Order Date\" >= '2020-06-01'",
+        ),
+        (
+            "SELECT AVG(revenu) AS average FROM sale WHERE \"customer.name\" = 'Bob'",
+            "SELECT AVG(Revenue) AS average FROM sales WHERE \"customer.name\" = 'Bob'",
+        ),
+    ],
+)
+def test_repaired_query_matches_the_correct_one(engine, dialect, broken, expected):
+    repair = SqlRepairer().repair(broken, SCHEMA, dialect)
+    assert repair.fixes
+    pd.testing.assert_frame_equal(engine.execute(repair.query), engine.execute(expected), check_exact=True)
+
+
+def test_valid_query_is_left_unchanged(dialect):
+    query = 'SELECT "customer.name" AS who, MAX(Revenue) AS top\nFROM sales\nGROUP BY 1'
+    repair = SqlRepairer().repair(query, SCHEMA, dialect)
+    assert repair.query == query
+    assert repair.fixes == []
+
+
+def test_ambiguous_misspelling_is_left_alone(dialect):
+    schema = {"sales": ["amount_a", "amount_b"]}
+    repair = SqlRepairer().repair("SELECT SUM(amount) FROM sales", schema, dialect)
+    assert repair.query == "SELECT SUM(amount) FROM sales"
+
+
+def test_repeated_query_is_repaired_from_the_cache(dialect):
+    repairer = SqlRepairer()
+    first = repairer.repair("SELECT SUM(revenu) FROM sales", SCHEMA, dialect)
+    assert repairer.repair("SELECT SUM(revenu) FROM sales", SCHEMA, dialect) is first
+    assert repairer.stats()["hits"] == 1